@@ -2,6 +2,8 @@
 ASGI config for app project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with async workers through the gunicorn configuration of the production profile:
+GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py app.asgi:application
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
@@ -37,14 +37,18 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'core',
     'user',
     'recipe',
+    'benchmarks',
 ]
 
 MIDDLEWARE = [
+    # First, so the durations it records include the other middleware
+    'core.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -78,16 +82,76 @@ WSGI_APPLICATION = 'app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# core.db.backends.postgresql_pool takes connections from a pool of each worker process. Connections then default to
+# CONN_MAX_AGE=0, so every request gives its connection back to the pool
+DB_ENGINE = os.environ.get('DB_ENGINE', 'django.db.backends.postgresql')
+DB_POOLED = DB_ENGINE == 'core.db.backends.postgresql_pool'
+
+# Threads of each worker process taking database connections: the gunicorn threads (see gunicorn.conf.py), the
+# threads generating the resized variants of uploaded recipe images (0 processes them in the request thread) and the
+# threads checking the databases for the readiness probe, see core.db.health
+GUNICORN_THREADS = int(os.environ.get('GUNICORN_THREADS', 4))
+RECIPE_IMAGE_WORKERS = int(os.environ.get('RECIPE_IMAGE_WORKERS', 2))
+HEALTH_CHECK_WORKERS = int(os.environ.get('HEALTH_CHECK_WORKERS', 2))
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': DB_ENGINE,
         'HOST': os.environ.get('DB_HOST'),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
+        # Without the pool, keep connections open between the requests of a thread instead of connecting for every
+        # request
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 0 if DB_POOLED else 600)),
+        # Seconds a connect may take, so an unreachable host fails the health checks instead of hanging their threads
+        'OPTIONS': {
+            'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', 5)),
+        },
+        # Size of the pool of each worker process, only used by core.db.backends.postgresql_pool. It defaults to a
+        # connection for every thread of the worker using the database, so none of them waits for another's
+        'POOL': {
+            'MAX_SIZE': int(os.environ.get(
+                'DB_POOL_MAX_SIZE', GUNICORN_THREADS + RECIPE_IMAGE_WORKERS + HEALTH_CHECK_WORKERS,
+            )),
+            'TIMEOUT': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            'HEALTH_CHECK_INTERVAL': int(os.environ.get('DB_CONN_HEALTH_CHECK_INTERVAL', 30)),
+        },
     }
 }
 
+# Comma separated hosts of read replicas of the default database. The list and retrieve requests of the recipe API
+# read from them, see core.db.routers and recipe.replicas
+DATABASE_REPLICAS = []
+for index, host in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), start=1):
+    DATABASES[f'replica{index}'] = dict(DATABASES['default'], HOST=host, TEST={'MIRROR': 'default'})
+    DATABASE_REPLICAS.append(f'replica{index}')
+
+DATABASE_ROUTERS = ['core.db.routers.ReplicaRouter']
+
+# Seconds after a change to a user's recipes, tags or ingredients during which their reads stay on the primary, so
+# they see their own writes. Keep it above the replication lag
+DATABASE_REPLICA_LAG = int(os.environ.get('DB_REPLICA_LAG', 5))
+
+# Share of the requests whose SQL queries and serializer time are recorded by core.middleware, every request's
+# duration is. Metrics are served at /metrics, timings are sent in Server-Timing headers unless turned off, as they
+# are by default in app.settings_production
+METRICS_SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', 0.1))
+METRICS_SERVER_TIMING = bool(int(os.environ.get('METRICS_SERVER_TIMING', 1)))
+
+# Directory shared by the worker processes of a container, each writes its metrics there every METRICS_WRITE_INTERVAL
+# seconds and /metrics serves their sum. Without it /metrics only serves the metrics of the worker answering it.
+# gunicorn.conf.py empties it on start and archives the counters of exited workers, see core.metrics
+METRICS_DIR = os.environ.get('METRICS_DIR') or None
+METRICS_WRITE_INTERVAL = float(os.environ.get('METRICS_WRITE_INTERVAL', 5))
+
+# Seconds the databases get to answer the readiness probe (/health/ready/) before it fails
+HEALTH_CHECK_TIMEOUT = float(os.environ.get('HEALTH_CHECK_TIMEOUT', 2))
+
+# Persistent connections idle for longer than this are checked before a request uses them, so a connection dropped by
+# the server or a proxy is replaced instead of failing the request, see core.signals
+DB_CONN_HEALTH_CHECK_INTERVAL = int(os.environ.get('DB_CONN_HEALTH_CHECK_INTERVAL', 30))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -140,6 +204,54 @@ AUTH_USER_MODEL = 'core.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'core.authentication.CachedTokenAuthentication',
+    ],
+    'PAGE_SIZE': int(os.environ.get('API_PAGE_SIZE', 100)),
+    # orjson backed when it is installed, stdlib json otherwise
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'core.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ],
 }
+
+# Pagination classes are set on the viewsets that list, PAGE_SIZE is only their shared default
+SILENCED_SYSTEM_CHECKS = ['rest_framework.W001']
+
+# Clients can ask for bigger pages with ?page_size= but never more than this
+API_MAX_PAGE_SIZE = int(os.environ.get('API_MAX_PAGE_SIZE', 1000))
+
+# List pages of at least this many objects are streamed while they are serialized
+API_STREAMING_MIN_ITEMS = int(os.environ.get('API_STREAMING_MIN_ITEMS', 200))
+
+# Maximum number of suggestions returned by the tag and ingredient autocomplete
+AUTOCOMPLETE_MAX_LIMIT = int(os.environ.get('AUTOCOMPLETE_MAX_LIMIT', 50))
+
+# Maximum number of objects accepted by one request to the bulk endpoints
+API_MAX_BULK_SIZE = int(os.environ.get('API_MAX_BULK_SIZE', 1000))
+
+# Authenticated tokens are kept in an in-process LRU for TOKEN_AUTH_CACHE_TTL seconds, see core.authentication.
+# Set TOKEN_AUTH_SHARED_CACHE to an alias of CACHES to share them between workers. Without it, a deleted token or a
+# deactivated user is only forgotten by the worker that changed it, the others accept it for up to the TTL.
+TOKEN_AUTH_CACHE_SIZE = int(os.environ.get('TOKEN_AUTH_CACHE_SIZE', 10000))
+TOKEN_AUTH_CACHE_TTL = int(os.environ.get('TOKEN_AUTH_CACHE_TTL', 60))
+TOKEN_AUTH_SHARED_CACHE = os.environ.get('TOKEN_AUTH_SHARED_CACHE') or None
+
+# List responses are cached per user in this alias of CACHES (local memory unless CACHES says otherwise), see
+# recipe.caching. An empty value disables the cache.
+RESPONSE_CACHE = os.environ.get('RESPONSE_CACHE', 'default')
+RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', 300))
+
+# Seconds after which process_recipe_images takes over a pending or processing image, a worker may still be on
+# younger ones
+RECIPE_IMAGE_STALE_AFTER = int(os.environ.get('RECIPE_IMAGE_STALE_AFTER', 600))
+
+# Uploads of bigger recipe images are refused before their body is read
+RECIPE_IMAGE_MAX_UPLOAD_SIZE = int(os.environ.get('RECIPE_IMAGE_MAX_UPLOAD_SIZE', 20 * 1024 * 1024))
+
+# Seconds after its first chunk a chunked upload is deleted with its file by purge_image_uploads, if not complete
+RECIPE_IMAGE_UPLOAD_EXPIRY = int(os.environ.get('RECIPE_IMAGE_UPLOAD_EXPIRY', 24 * 60 * 60))
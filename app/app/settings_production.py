@@ -0,0 +1,51 @@
+"""
+Production settings for app project, select them with DJANGO_SETTINGS_MODULE=app.settings_production.
+
+Everything of app.settings applies, with debugging off and secrets and hosts read from the environment.
+Static and media files are served by the proxy in front of gunicorn, see proxy/default.conf.
+"""
+import os
+
+from .settings import *  # noqa: F401,F403
+
+DEBUG = False
+
+SECRET_KEY = os.environ['DJANGO_SECRET_KEY']
+
+ALLOWED_HOSTS = [host.strip() for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if host.strip()]
+# The healthcheck of docker-compose-deploy.yml requests the readiness probe from inside the container
+ALLOWED_HOSTS.append('localhost')
+
+# The proxy tells the scheme of the request in X-Forwarded-Proto. The nginx of docker-compose-deploy.yml serves
+# plain HTTP, set DJANGO_SECURE_COOKIES=1 when a TLS terminating proxy is put in front of it, secure cookies are
+# never sent back over HTTP and the admin login would fail its CSRF check.
+SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+SESSION_COOKIE_SECURE = os.environ.get('DJANGO_SECURE_COOKIES', '0') == '1'
+CSRF_COOKIE_SECURE = SESSION_COOKIE_SECURE
+
+# Server-Timing headers tell clients how long queries took, only send them when debugging a deployment
+METRICS_SERVER_TIMING = bool(int(os.environ.get('METRICS_SERVER_TIMING', 0)))
+
+# Hashed names let the proxy tell clients to cache static files forever
+STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.ManifestStaticFilesStorage'
+
+# Templates are only read from disk once per worker
+TEMPLATES[0]['APP_DIRS'] = False  # noqa: F405
+TEMPLATES[0]['OPTIONS']['loaders'] = [  # noqa: F405
+    ('django.template.loaders.cached.Loader', [
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ]),
+]
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'root': {
+        'handlers': ['console'],
+        'level': os.environ.get('DJANGO_LOG_LEVEL', 'INFO'),
+    },
+}
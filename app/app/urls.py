@@ -18,9 +18,17 @@ from django.urls import path, include
 from django.conf.urls.static import static
 from django.conf import settings
 
+from core import views as core_views
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    # Probes of the container orchestrator, the readiness one checks the databases like wait_for_db
+    path('health/live/', core_views.liveness, name='health-live'),
+    path('health/ready/', core_views.readiness, name='health-ready'),
+    # Scraped by Prometheus, the proxy doesn't expose it
+    path('metrics', core_views.metrics, name='metrics'),
     path('api/user/', include('user.urls', namespace='user')),
     path('api/recipe/', include('recipe.urls', namespace='recipe')),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 # Django runserver server static files however, it doesn't serve media files by default so we should add this manually
+# static() only adds the route when DEBUG is on, in production the proxy serves media, see proxy/default.conf
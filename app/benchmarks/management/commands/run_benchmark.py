@@ -0,0 +1,160 @@
+import json
+import platform
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from rest_framework.authtoken.models import Token
+
+from benchmarks.scenarios import SCENARIOS, Fixture, run_scenario, sample_image
+from benchmarks.seed import benchmark_users
+from recipe.conditional import bump_data_version
+from recipe.models import Recipe, Tag, Ingredient, IMAGE_PENDING, IMAGE_PROCESSING
+
+
+class Command(BaseCommand):
+    """
+    Django command to measure the latency, queries and allocations of the recipe API hot paths on the data of
+    seed_benchmark, through the test client. Results are written as JSON to diff runs, e.g:
+    python manage.py run_benchmark --output before.json
+    python manage.py run_benchmark --output after.json --compare before.json
+    The recipes created by a run are deleted at the end and the uploaded images, written to a temporary media
+    directory, are removed, so consecutive runs measure the same data.
+    """
+    help = 'Send requests to the recipe API for every scenario and report latency percentiles, queries and allocations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help='can be repeated')
+        parser.add_argument('--requests', type=int, default=200, help='measured requests of every scenario')
+        parser.add_argument('--warmup', type=int, default=20, help='requests sent before measuring')
+        parser.add_argument('--allocation-requests', type=int, default=10, help='requests with traced allocations')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--cache', action='store_true', help='let list responses be served from the cache')
+        parser.add_argument('--output', help='JSON file to write the results to')
+        parser.add_argument('--compare', help='JSON file of a previous run to compare with')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests must be at least 1')
+        previous = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                previous = json.load(f)
+
+        headers = {'HTTP_ACCEPT': 'application/json'}
+        if not options['cache']:
+            headers['HTTP_CACHE_CONTROL'] = 'no-cache'
+        image = sample_image()
+        fixtures = []
+        for user in benchmark_users():
+            token, _ = Token.objects.get_or_create(user=user)
+            fixtures.append(Fixture(
+                Client(HTTP_AUTHORIZATION=f'Token {token.key}', **headers),
+                list(Recipe.objects.filter(user=user).order_by('pk').values_list('pk', flat=True)),
+                list(Tag.objects.filter(user=user).order_by('pk').values_list('pk', flat=True)),
+                list(Ingredient.objects.filter(user=user).order_by('pk').values_list('pk', flat=True)),
+                image,
+            ))
+        fixtures = [fixture for fixture in fixtures if fixture.recipe_ids]
+        if not fixtures:
+            raise CommandError('No benchmark data, run seed_benchmark first')
+
+        results = {
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'environment': self.get_environment(),
+            'data': {
+                'users': len(fixtures),
+                'recipes': sum(len(fixture.recipe_ids) for fixture in fixtures),
+                'tags': sum(len(fixture.tag_ids) for fixture in fixtures),
+                'ingredients': sum(len(fixture.ingredient_ids) for fixture in fixtures),
+            },
+            'options': {
+                name: options[name] for name in ('requests', 'warmup', 'allocation_requests', 'seed', 'cache')
+            },
+            'scenarios': {},
+        }
+        media_root = tempfile.mkdtemp(prefix='benchmark-media-')
+        rng = random.Random(options['seed'])
+        last_recipe_id = Recipe.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        try:
+            # The test client's host, and uploads kept away from the real media files
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], MEDIA_ROOT=media_root):
+                for scenario in options['scenario'] or SCENARIOS:
+                    result = run_scenario(
+                        scenario, fixtures, rng, options['requests'],
+                        warmup=options['warmup'], allocation_requests=options['allocation_requests'],
+                    )
+                    results['scenarios'][scenario] = result
+                    self.report(scenario, result, (previous or {}).get('scenarios', {}).get(scenario))
+                self.wait_for_images(fixtures)
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+            self.restore(last_recipe_id)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+                f.write('\n')
+            self.stdout.write(f'Results written to {options["output"]}')
+
+    def get_environment(self):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True, timeout=5,
+            ).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            commit = None
+        return {
+            'commit': commit,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'machine': platform.machine(),
+        }
+
+    def report(self, scenario, result, previous):
+        line = (
+            f'{scenario}: p50 {result["p50_ms"]:.2f} ms, p95 {result["p95_ms"]:.2f} ms, '
+            f'p99 {result["p99_ms"]:.2f} ms, {result["queries_per_request"]:g} queries, '
+            f'{result["peak_allocated_kib"]} KiB allocated at peak'
+        )
+        if previous:
+            changes = ', '.join(
+                f'{name} {(result[name] - previous[name]) / previous[name]:+.0%}'
+                for name in ('p50_ms', 'p95_ms', 'queries_per_request') if previous.get(name)
+            )
+            line += f' ({changes})'
+        self.stdout.write(self.style.SUCCESS(line))
+        if set(result['status_codes']) - {'200', '201'}:
+            self.stdout.write(self.style.WARNING(f'{scenario}: status codes {result["status_codes"]}'))
+
+    def restore(self, last_recipe_id):
+        """Undo the writes of the scenarios, so the next run measures the same data"""
+        recipes = Recipe.objects.filter(user__in=benchmark_users())
+        recipes.filter(pk__gt=last_recipe_id).delete()
+        # The uploaded files were removed with the media directory
+        uploaded = recipes.exclude(image_status='')
+        user_ids = set(uploaded.values_list('user_id', flat=True))
+        uploaded.update(image=None, image_status='', image_status_changed=None, image_variants={})
+        # update() sends no signals, the cached responses and ETags of the recipes would stay current
+        for user_id in user_ids:
+            bump_data_version(user_id)
+
+    def wait_for_images(self, fixtures, timeout=30):
+        """Let the image workers finish the variants of the uploads before their directory is removed"""
+        if connection.in_atomic_block:
+            # The uploads are only processed once committed
+            return
+        recipe_ids = [pk for fixture in fixtures for pk in fixture.recipe_ids]
+        deadline = time.monotonic() + timeout
+        pending = Recipe.objects.filter(pk__in=recipe_ids, image_status__in=(IMAGE_PENDING, IMAGE_PROCESSING))
+        while pending.exists() and time.monotonic() < deadline:
+            time.sleep(0.1)
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from benchmarks.seed import EMAIL_DOMAIN, benchmark_users, seed
+
+
+class Command(BaseCommand):
+    """
+    Django command to create the data run_benchmark sends requests about, e.g:
+    python manage.py seed_benchmark --users 10 --recipes 1000 --tags 50 --ingredients 200
+    """
+    help = f'Create users of the {EMAIL_DOMAIN} domain with recipes, tags and ingredients for run_benchmark'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--recipes', type=int, default=500, help='recipes of every user')
+        parser.add_argument('--tags', type=int, default=30, help='tags of every user')
+        parser.add_argument('--ingredients', type=int, default=100, help='ingredients of every user')
+        parser.add_argument('--links', type=int, default=3, help='tags and ingredients of every recipe')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--clear', action='store_true', help='delete the data of a previous seed first')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        with transaction.atomic():
+            if options['clear']:
+                benchmark_users().delete()
+            elif benchmark_users().exists():
+                raise CommandError('Benchmark data exists already, use --clear to replace it')
+            users = seed(
+                options['users'], options['recipes'], options['tags'], options['ingredients'],
+                links=options['links'], seed=options['seed'],
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(users)} users with {options["recipes"]} recipes, {options["tags"]} tags and '
+            f'{options["ingredients"]} ingredients each in {time.perf_counter() - started:.1f} seconds'
+        ))
@@ -0,0 +1,125 @@
+import io
+import json
+import statistics
+import time
+import tracemalloc
+from contextlib import ExitStack
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connections
+from django.urls import reverse
+from PIL import Image
+
+from core.metrics import RequestTimings
+
+
+def sample_image():
+    """Return the bytes of a small JPEG, uploaded by the upload-image scenario"""
+    output = io.BytesIO()
+    Image.new('RGB', (64, 64), (200, 80, 40)).save(output, format='JPEG')
+    return output.getvalue()
+
+
+class Fixture:
+    """The seeded objects of a user the scenarios send requests about, with a client authenticated as the user"""
+
+    def __init__(self, client, recipe_ids, tag_ids, ingredient_ids, image):
+        self.client = client
+        self.recipe_ids = recipe_ids
+        self.tag_ids = tag_ids
+        self.ingredient_ids = ingredient_ids
+        self.image = image
+
+
+def recipe_list(fixture, rng):
+    return fixture.client.get(reverse('recipe:recipe-list'))
+
+
+def recipe_filter(fixture, rng):
+    tags = rng.sample(fixture.tag_ids, min(2, len(fixture.tag_ids)))
+    ingredients = rng.sample(fixture.ingredient_ids, min(1, len(fixture.ingredient_ids)))
+    return fixture.client.get(reverse('recipe:recipe-list'), {
+        'tags': ','.join(map(str, tags)),
+        'ingredients': ','.join(map(str, ingredients)),
+    })
+
+
+def recipe_detail(fixture, rng):
+    return fixture.client.get(reverse('recipe:recipe-detail', args=[rng.choice(fixture.recipe_ids)]))
+
+
+def recipe_create(fixture, rng):
+    data = {
+        'title': 'Benchmark recipe',
+        'time_minutes': rng.randint(5, 120),
+        'price': '9.99',
+        'tags': rng.sample(fixture.tag_ids, min(3, len(fixture.tag_ids))),
+        'ingredients': rng.sample(fixture.ingredient_ids, min(3, len(fixture.ingredient_ids))),
+    }
+    return fixture.client.post(reverse('recipe:recipe-list'), json.dumps(data), content_type='application/json')
+
+
+def recipe_upload_image(fixture, rng):
+    image = SimpleUploadedFile('benchmark.jpg', fixture.image, content_type='image/jpeg')
+    return fixture.client.post(
+        reverse('recipe:recipe-upload-image', args=[rng.choice(fixture.recipe_ids)]), {'image': image}
+    )
+
+
+# Name -> function sending one request of the scenario for a fixture and returning the response
+SCENARIOS = {
+    'recipe-list': recipe_list,
+    'recipe-filter': recipe_filter,
+    'recipe-detail': recipe_detail,
+    'recipe-create': recipe_create,
+    'recipe-upload-image': recipe_upload_image,
+}
+
+
+def percentile(quantiles, n):
+    return round(quantiles[n - 1] * 1000, 3)
+
+
+def run_scenario(scenario, fixtures, rng, requests, warmup=10, allocation_requests=10):
+    """
+    Send requests of a scenario, cycling through the fixtures, and return the latency percentiles in milliseconds,
+    the queries per request and the memory allocated at peak per request.
+    Allocations are traced in requests of their own, tracing slows down every allocation and would skew latencies.
+    """
+    request = SCENARIOS[scenario]
+    for i in range(warmup):
+        request(fixtures[i % len(fixtures)], rng)
+
+    latencies = []
+    statuses = {}
+    timings = RequestTimings()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(timings))
+        for i in range(requests):
+            started = time.perf_counter()
+            response = request(fixtures[i % len(fixtures)], rng)
+            latencies.append(time.perf_counter() - started)
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+
+    peaks = []
+    for i in range(allocation_requests):
+        tracemalloc.start()
+        try:
+            request(fixtures[i % len(fixtures)], rng)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {
+        'requests': requests,
+        'status_codes': statuses,
+        'mean_ms': round(statistics.mean(latencies) * 1000, 3),
+        'p50_ms': percentile(quantiles, 50),
+        'p95_ms': percentile(quantiles, 95),
+        'p99_ms': percentile(quantiles, 99),
+        'queries_per_request': round(timings.queries / requests, 2),
+        'sql_ms_per_request': round(timings.sql / requests * 1000, 3),
+        'peak_allocated_kib': round(statistics.mean(peaks) / 1024, 1) if peaks else None,
+    }
@@ -0,0 +1,70 @@
+import random
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+
+from recipe.bulk import bulk_create, bulk_link
+from recipe.models import Recipe, Tag, Ingredient, UserDataVersion
+from recipe.names import normalize_name
+from recipe.search import refresh_search_vectors
+
+# Seeded users are recognized by their email domain, reserved so it can never be a real user's
+EMAIL_DOMAIN = 'benchmark.invalid'
+
+WORDS = (
+    'chicken', 'curry', 'rice', 'tomato', 'basil', 'garlic', 'lemon', 'salmon', 'pasta', 'beef', 'mushroom',
+    'spinach', 'potato', 'onion', 'ginger', 'chili', 'coconut', 'lentil', 'cheese', 'apple', 'honey', 'almond',
+    'vegan', 'spicy', 'quick', 'roasted', 'grilled', 'baked', 'soup', 'salad', 'stew', 'cake',
+)
+
+
+def benchmark_users():
+    """Return the users created by seed"""
+    return get_user_model().objects.filter(email__endswith=f'@{EMAIL_DOMAIN}').order_by('pk')
+
+
+def seed(users, recipes, tags, ingredients, links=3, seed=0, batch_size=1000):
+    """
+    Create users, each with their own recipes, tags and ingredients, with bulk inserts.
+    Every recipe is linked to links tags and links ingredients of its user. The same arguments always create the
+    same data, so runs on different databases or commits compare the same requests.
+    """
+    rng = random.Random(seed)
+    # Seeded users authenticate with tokens
+    password = make_password(None)
+    created = bulk_create(get_user_model(), [
+        get_user_model()(email=f'user{i}@{EMAIL_DOMAIN}', name=f'Benchmark user {i}', password=password)
+        for i in range(users)
+    ], batch_size=batch_size)
+    # Bulk inserts don't send the post_save creating them, the saves of other backends do
+    UserDataVersion.objects.bulk_create(
+        [UserDataVersion(user=user) for user in created], batch_size=batch_size, ignore_conflicts=True,
+    )
+
+    for user in created:
+        user_tags = bulk_create(Tag, [
+            Tag(user=user, name=name, normalized_name=normalize_name(name))
+            for name in (f'{rng.choice(WORDS)} {i}' for i in range(tags))
+        ], batch_size=batch_size)
+        user_ingredients = bulk_create(Ingredient, [
+            Ingredient(user=user, name=name, normalized_name=normalize_name(name))
+            for name in (f'{rng.choice(WORDS)} {i}' for i in range(ingredients))
+        ], batch_size=batch_size)
+        user_recipes = bulk_create(Recipe, [
+            Recipe(
+                user=user,
+                title=' '.join(rng.sample(WORDS, 3)),
+                time_minutes=rng.randint(5, 120),
+                price=Decimal(rng.randint(100, 5000)) / 100,
+            )
+            for _ in range(recipes)
+        ], batch_size=batch_size)
+        bulk_link(user_recipes, 'tags', [
+            rng.sample(user_tags, min(links, len(user_tags))) for _ in user_recipes
+        ], batch_size=batch_size)
+        bulk_link(user_recipes, 'ingredients', [
+            rng.sample(user_ingredients, min(links, len(user_ingredients))) for _ in user_recipes
+        ], batch_size=batch_size)
+    refresh_search_vectors(Recipe.objects.filter(user__in=created))
+    return created
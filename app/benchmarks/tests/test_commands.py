@@ -0,0 +1,86 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from benchmarks.seed import benchmark_users
+from recipe.models import Recipe, Tag, Ingredient
+
+
+class SeedBenchmarkTests(TestCase):
+    """Test seeding the benchmark data"""
+
+    def test_seed(self):
+        """Test every user gets their recipes, tags and ingredients, linked with their counters"""
+        call_command('seed_benchmark', users=2, recipes=5, tags=4, ingredients=6, links=2, stdout=StringIO())
+
+        users = list(benchmark_users())
+        self.assertEqual(len(users), 2)
+        recipes = Recipe.objects.filter(user=users[0])
+        self.assertEqual(recipes.count(), 5)
+        self.assertEqual(Tag.objects.filter(user=users[0]).count(), 4)
+        self.assertEqual(Ingredient.objects.filter(user=users[0]).count(), 6)
+        for recipe in recipes:
+            self.assertEqual(recipe.tags.count(), 2)
+            self.assertEqual(set(recipe.tags.values_list('user', flat=True)), {users[0].pk})
+        tag_counts = sum(Tag.objects.filter(user=users[0]).values_list('recipe_count', flat=True))
+        self.assertEqual(tag_counts, 10)
+
+    def test_seed_twice(self):
+        """Test seeding again needs --clear"""
+        call_command('seed_benchmark', users=1, recipes=1, stdout=StringIO())
+
+        with self.assertRaises(CommandError):
+            call_command('seed_benchmark', users=1, recipes=1)
+        call_command('seed_benchmark', users=1, recipes=2, clear=True, stdout=StringIO())
+
+        self.assertEqual(Recipe.objects.count(), 2)
+
+
+class RunBenchmarkTests(TestCase):
+    """Test running the benchmark scenarios"""
+
+    def test_run(self):
+        """Test every scenario is measured and the results are written as JSON"""
+        call_command('seed_benchmark', users=2, recipes=3, tags=3, ingredients=3, stdout=StringIO())
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            call_command(
+                'run_benchmark', requests=3, warmup=1, allocation_requests=1, output=output,
+                stdout=StringIO(),
+            )
+            with open(output) as f:
+                results = json.load(f)
+
+        self.assertEqual(results['data']['users'], 2)
+        self.assertEqual(set(results['scenarios']), {
+            'recipe-list', 'recipe-filter', 'recipe-detail', 'recipe-create', 'recipe-upload-image',
+        })
+        for scenario, result in results['scenarios'].items():
+            self.assertEqual(set(result['status_codes']) - {'200', '201'}, set(), scenario)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+            self.assertGreater(result['queries_per_request'], 0)
+            self.assertGreater(result['peak_allocated_kib'], 0)
+
+    def test_run_restores_uploads(self):
+        """Test the uploaded images are undone, and the data version of their owners bumped"""
+        call_command('seed_benchmark', users=1, recipes=2, stdout=StringIO())
+
+        with patch('benchmarks.management.commands.run_benchmark.bump_data_version') as bump:
+            call_command(
+                'run_benchmark', scenario=['recipe-upload-image'], requests=1, warmup=0, allocation_requests=0,
+                stdout=StringIO(),
+            )
+
+        self.assertFalse(Recipe.objects.exclude(image_status='').exists())
+        self.assertFalse(Recipe.objects.filter(image_status_changed__isnull=False).exists())
+        bump.assert_called_once_with(benchmark_users()[0].pk)
+
+    def test_run_without_data(self):
+        """Test the benchmark needs seeded data"""
+        with self.assertRaisesMessage(CommandError, 'seed_benchmark'):
+            call_command('run_benchmark', requests=1)
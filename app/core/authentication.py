@@ -0,0 +1,169 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+
+class TokenCache:
+    """
+    Thread safe in-process LRU of token key -> token and user, entries expire after TOKEN_AUTH_CACHE_TTL.
+    Entries only hold the token's creation time and the user's columns but the password, and every hit builds new
+    instances from them, so a request changing its user doesn't change the cached one.
+    When TOKEN_AUTH_SHARED_CACHE names a cache of CACHES, local misses are looked up there too, so a token that was
+    authenticated by one worker doesn't cost a query in the others. The changes of a user are then broadcast by
+    bumping a revision of the user in the shared cache, which every local hit checks. Without a shared cache, the
+    other workers keep authenticating a deleted token or a deactivated user for up to TOKEN_AUTH_CACHE_TTL seconds.
+    A user loaded from the database is only cached when it didn't change since stamp() was taken, before loading it.
+    """
+
+    def __init__(self):
+        # key -> (expiry, user id, revision of the user, payload)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by every delete_user of this process
+        self._generation = 0
+
+    @property
+    def shared(self):
+        alias = settings.TOKEN_AUTH_SHARED_CACHE
+        return caches[alias] if alias else None
+
+    @staticmethod
+    def shared_key(key):
+        """Never put raw tokens in the shared cache, which may be readable by other services"""
+        return 'token-auth:' + hashlib.sha256(key.encode()).hexdigest()
+
+    @staticmethod
+    def revision_key(user_id):
+        return f'token-auth-revision:{user_id}'
+
+    @staticmethod
+    def user_fields():
+        """The cached columns of a user, the password hash stays in the database"""
+        return [field.attname for field in get_user_model()._meta.concrete_fields if field.attname != 'password']
+
+    def dump(self, token):
+        return token.created, [getattr(token.user, name) for name in self.user_fields()]
+
+    def load(self, key, payload):
+        """Return a new user and token, the password is deferred and read from the database if it is used"""
+        created, values = payload
+        user = get_user_model().from_db(DEFAULT_DB_ALIAS, self.user_fields(), values)
+        return user, Token(key=key, user=user, created=created)
+
+    def get(self, key):
+        """Return the user and token of a cached key, None if it isn't cached"""
+        shared = self.shared
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                else:
+                    del self._entries[key]
+                    entry = None
+        if entry is not None:
+            _, user_id, revision, payload = entry
+            if shared is None or shared.get(self.revision_key(user_id), 0) == revision:
+                return self.load(key, payload)
+            # The user changed in another worker
+            with self._lock:
+                self._entries.pop(key, None)
+            return None
+        if shared is not None:
+            entry = shared.get(self.shared_key(key))
+            if entry is not None:
+                user_id, revision, payload = entry
+                if shared.get(self.revision_key(user_id), 0) == revision:
+                    self._set_local(key, user_id, revision, payload)
+                    return self.load(key, payload)
+        return None
+
+    def stamp(self, key):
+        """
+        Return what set() needs to tell whether the user of a token changed since, take it before loading the user.
+        With a shared cache it holds the user's revision, whose id costs a query of the token.
+        """
+        with self._lock:
+            generation = self._generation
+        shared = self.shared
+        revision = 0
+        if shared is not None:
+            user_id = Token.objects.filter(key=key).values_list('user_id', flat=True).first()
+            if user_id is not None:
+                revision = shared.get(self.revision_key(user_id), 0)
+        return generation, revision
+
+    def set(self, key, token, stamp):
+        """Cache a token and its user loaded after stamp(key), unless the user may have changed in between"""
+        generation, revision = stamp
+        payload = self.dump(token)
+        with self._lock:
+            if self._generation != generation:
+                # A user changed in this process while the token was loaded, it may have been this one
+                return
+        self._set_local(key, token.user_id, revision, payload)
+        shared = self.shared
+        if shared is not None:
+            # Entries of an older revision are ignored by every worker
+            shared.set(self.shared_key(key), (token.user_id, revision, payload), settings.TOKEN_AUTH_CACHE_TTL)
+
+    def _set_local(self, key, user_id, revision, payload):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + settings.TOKEN_AUTH_CACHE_TTL, user_id, revision, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.TOKEN_AUTH_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+        if self.shared is not None:
+            self.shared.delete_many([self.shared_key(key) for key in keys])
+
+    def delete_user(self, user_id):
+        """Forget every cached token of a user, in this worker and in the others"""
+        with self._lock:
+            self._generation += 1
+            keys = {key for key, entry in self._entries.items() if entry[1] == user_id}
+        shared = self.shared
+        if shared is not None:
+            # Other workers may have cached tokens this one never saw. The revision outlives their local entries.
+            keys.update(Token.objects.filter(user_id=user_id).values_list('key', flat=True))
+            revision_key = self.revision_key(user_id)
+            shared.set(revision_key, shared.get(revision_key, 0) + 1, settings.TOKEN_AUTH_CACHE_TTL)
+        self.delete(*keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication that remembers authenticated tokens instead of running
+    SELECT ... FROM authtoken_token INNER JOIN core_user on every request.
+    The cache is invalidated when a token is deleted and when its user is saved (deactivated, password changed...),
+    see core.signals and TokenCache for how other workers learn about it.
+    """
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            return cached
+        stamp = token_cache.stamp(key)
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, token, stamp)
+        return user, token
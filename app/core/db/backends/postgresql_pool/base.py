@@ -0,0 +1,60 @@
+"""
+PostgreSQL backend taking its connections from a pool of the process instead of opening one per request.
+Use it with CONN_MAX_AGE = 0, the default of app.settings with this backend: Django then closes its connection at the
+end of every request, which gives it back to the pool. The pool is sized per worker process by the POOL entry of the
+database settings, give it a connection for every thread of the worker using the database:
+'POOL': {'MAX_SIZE': 8, 'TIMEOUT': 10, 'HEALTH_CHECK_INTERVAL': 30}
+"""
+import psycopg2
+from psycopg2 import extensions
+
+from django.db.backends.postgresql import base
+
+from core.db.pool import ConnectionPool, get_pool
+
+
+def reset_connection(connection):
+    """Roll back what a request left open, a connection in an unknown state is not reused"""
+    if connection.closed:
+        return False
+    status = connection.info.transaction_status
+    if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    if status != extensions.TRANSACTION_STATUS_IDLE:
+        connection.rollback()
+    return True
+
+
+def check_connection(connection):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        return True
+    except psycopg2.Error:
+        return False
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_pool(self, conn_params):
+        options = self.settings_dict.get('POOL', {})
+        return get_pool(self.alias, lambda: ConnectionPool(
+            connect=lambda: super(DatabaseWrapper, self).get_new_connection(conn_params),
+            reset=reset_connection,
+            check=check_connection,
+            max_size=options.get('MAX_SIZE', 4),
+            timeout=options.get('TIMEOUT', 10),
+            health_check_interval=options.get('HEALTH_CHECK_INTERVAL', 30),
+        ))
+
+    def get_new_connection(self, conn_params):
+        self.pool = self.get_pool(conn_params)
+        connection = self.pool.acquire()
+        # The isolation level is read by the connection that opened it, set it on this wrapper too
+        self.isolation_level = self.settings_dict['OPTIONS'].get('isolation_level', connection.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool.release(self.connection)
@@ -0,0 +1,70 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import connections
+from django.db.utils import DatabaseError
+
+# HEALTH_CHECK_WORKERS threads running the checks, reused by every check and counted in the size of the connection
+# pools. A connect that hangs holds its thread until the connect_timeout of the database OPTIONS, checks beyond the
+# free threads wait in the queue and are reported as unavailable
+executor = ThreadPoolExecutor(max_workers=settings.HEALTH_CHECK_WORKERS, thread_name_prefix='db-health')
+
+
+def check_database(alias):
+    """Run SELECT 1 on a database alias, raising DatabaseError when it can't be reached"""
+    connection = connections[alias]
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+    finally:
+        # Checks run in threads of their own, whose connections would never be closed
+        connection.close()
+
+
+def check_databases(aliases, timeout):
+    """
+    Check database aliases in parallel, returning the error of each alias (None when it answered).
+    An alias that didn't answer within timeout seconds is reported as unavailable without waiting for it.
+    """
+    errors = {}
+    futures = {alias: executor.submit(check_database, alias) for alias in aliases}
+    wait(futures.values(), timeout=timeout)
+    for alias, future in futures.items():
+        if not future.done():
+            # A check still queued doesn't run late, the next check queues its own
+            future.cancel()
+            errors[alias] = f'No answer within {timeout} seconds'
+        elif future.exception() is not None:
+            error = future.exception()
+            if not isinstance(error, DatabaseError):
+                raise error
+            errors[alias] = ' '.join(str(error).split()) or type(error).__name__
+        else:
+            errors[alias] = None
+    return errors
+
+
+def wait_for_databases(aliases, deadline, check_timeout=5, delay=0.1, max_delay=5, on_retry=None):
+    """
+    Check database aliases until they all answered or deadline seconds passed, returning the errors of the aliases
+    still unavailable. Checks are retried after an exponential backoff with full jitter, so containers started
+    together don't retry in lockstep, and never past the deadline. on_retry(errors, delay) is called before waiting.
+    """
+    ends_at = time.monotonic() + deadline
+    pending = list(aliases)
+    attempt = 0
+    while True:
+        remaining = ends_at - time.monotonic()
+        errors = check_databases(pending, timeout=max(min(check_timeout, remaining), 0.001))
+        pending = [alias for alias, error in errors.items() if error is not None]
+        remaining = ends_at - time.monotonic()
+        if not pending or remaining <= 0:
+            return {alias: errors[alias] for alias in pending}
+        sleep = min(random.uniform(0, min(max_delay, delay * 2 ** attempt)), remaining)
+        attempt += 1
+        if on_retry is not None:
+            on_retry({alias: errors[alias] for alias in pending}, sleep)
+        time.sleep(sleep)
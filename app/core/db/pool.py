@@ -0,0 +1,139 @@
+import threading
+import time
+
+from django.db.utils import OperationalError
+
+
+class PoolTimeout(OperationalError):
+    """Raised when no connection of a full pool was released in time"""
+
+
+class ConnectionPool:
+    """
+    Thread safe pool of at most max_size DB-API connections to one database, shared by the threads of a process.
+    connect() opens a connection, reset(connection) makes a released one reusable (returning False when it can't
+    be) and check(connection) tells whether a connection still works. Connections idle for more than
+    health_check_interval seconds are checked before they are handed out again.
+    """
+
+    def __init__(self, connect, reset, check, max_size=4, timeout=10, health_check_interval=30):
+        self.connect = connect
+        self.reset = reset
+        self.check = check
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self._condition = threading.Condition()
+        # (connection, release time), the most recently released one is handed out first
+        self._idle = []
+        self._size = 0
+        self._stats = dict.fromkeys(
+            ('acquired', 'created', 'closed', 'waits', 'timeouts', 'health_checks', 'health_check_failures'), 0
+        )
+
+    def acquire(self):
+        """Return an idle connection, a new one while the pool isn't full, or wait for one to be released"""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            connection, released_at = self._take(deadline)
+            if connection is None:
+                try:
+                    connection = self.connect()
+                except Exception:
+                    self._forget()
+                    raise
+                self._count('created')
+            elif time.monotonic() - released_at > self.health_check_interval:
+                self._count('health_checks')
+                if not self.check(connection):
+                    self._count('health_check_failures')
+                    self._discard(connection)
+                    continue
+            self._count('acquired')
+            return connection
+
+    def release(self, connection):
+        """Give a connection back, closing it if it can't be reused"""
+        try:
+            reusable = self.reset(connection)
+        except Exception:
+            reusable = False
+        if not reusable:
+            self._discard(connection)
+            return
+        with self._condition:
+            self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+
+    def close(self):
+        """Close the idle connections"""
+        with self._condition:
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            self._discard(connection)
+
+    def snapshot(self):
+        """Return the size of the pool, how many connections are in use and idle, and the counters"""
+        with self._condition:
+            return {
+                'size': self._size,
+                'max_size': self.max_size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                **self._stats,
+            }
+
+    def _take(self, deadline):
+        """Reserve an idle connection, or a slot for a new one (returned as None)"""
+        with self._condition:
+            waited = False
+            while not self._idle and self._size >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(f'No database connection was released within {self.timeout} seconds')
+                if not waited:
+                    self._stats['waits'] += 1
+                    waited = True
+                self._condition.wait(remaining)
+            if self._idle:
+                return self._idle.pop()
+            self._size += 1
+            return None, None
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+        self._count('closed')
+        self._forget()
+
+    def _forget(self):
+        """Free the slot of a connection that was closed or never opened"""
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+    def _count(self, name):
+        with self._condition:
+            self._stats[name] += 1
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, factory):
+    """Return the pool of a database alias in this process, created by factory() on first use"""
+    with _pools_lock:
+        if alias not in _pools:
+            _pools[alias] = factory()
+        return _pools[alias]
+
+
+def pool_stats():
+    """Return the snapshot of every pool of this process by database alias"""
+    with _pools_lock:
+        pools = dict(_pools)
+    return {alias: pool.snapshot() for alias, pool in pools.items()}
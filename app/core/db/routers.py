@@ -0,0 +1,53 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# Whether the reads of the current request or task may be served by a replica
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+@contextmanager
+def replica_reads():
+    """Send the reads made inside the block to the replicas of DATABASE_REPLICAS"""
+    token = start_replica_reads()
+    try:
+        yield
+    finally:
+        stop_replica_reads(token)
+
+
+def start_replica_reads():
+    """Send the following reads to the replicas, returns the token to give to stop_replica_reads"""
+    return _replica_reads.set(True)
+
+
+def stop_replica_reads(token):
+    """Send the reads to the primary again"""
+    _replica_reads.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Route reads to a random replica of DATABASE_REPLICAS when they are made inside replica_reads(), everything else
+    to the default database. Reads are only sent to replicas when asked for, so a write and the reads of the same
+    request or transaction always see each other. Replicas are copies of the default database and are never
+    migrated.
+    """
+
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get() and settings.DATABASE_REPLICAS:
+            return random.choice(settings.DATABASE_REPLICAS)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        return obj1._state.db in databases and obj2._state.db in databases
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db not in settings.DATABASE_REPLICAS
@@ -0,0 +1,67 @@
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections
+from django.test import Client
+from rest_framework.authtoken.models import Token
+
+from core.db.backends.postgresql_pool.base import DatabaseWrapper as PooledDatabaseWrapper
+from core.db.pool import pool_stats
+
+
+class Command(BaseCommand):
+    """
+    Django command to compare the latency of a request when it opens its own database connection, reuses a persistent
+    one (CONN_MAX_AGE) and takes one from the pool of core.db.backends.postgresql_pool. Run it against PostgreSQL:
+    python manage.py bench_db_connections --email test@test.com --path /api/recipe/tags/
+    """
+    help = 'Compare request latencies with new, persistent and pooled database connections'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email', required=True, help='user sending the requests')
+        parser.add_argument('--path', default='/api/recipe/tags/')
+        parser.add_argument('--requests', type=int, default=500)
+
+    def handle(self, *args, **options):
+        original = connections[DEFAULT_DB_ALIAS]
+        if original.vendor != 'postgresql':
+            raise CommandError('The connection pool needs PostgreSQL')
+        user = get_user_model().objects.get(email=options['email'])
+        token, _ = Token.objects.get_or_create(user=user)
+        client = Client(HTTP_AUTHORIZATION=f'Token {token.key}', HTTP_ACCEPT='application/json')
+
+        modes = (
+            ('new connection', type(original), 0),
+            ('persistent', type(original), 600),
+            ('pool', PooledDatabaseWrapper, 0),
+        )
+        try:
+            for name, wrapper_class, conn_max_age in modes:
+                connections[DEFAULT_DB_ALIAS].close()
+                settings_dict = dict(original.settings_dict, CONN_MAX_AGE=conn_max_age)
+                connections[DEFAULT_DB_ALIAS] = wrapper_class(settings_dict, DEFAULT_DB_ALIAS)
+                latencies = self.run(client, options['path'], options['requests'])
+                self.stdout.write(self.style.SUCCESS(
+                    f'{name}: mean {statistics.mean(latencies) * 1000:.2f} ms, '
+                    f'p50 {statistics.median(latencies) * 1000:.2f} ms, '
+                    f'p95 {statistics.quantiles(latencies, n=20)[18] * 1000:.2f} ms'
+                ))
+        finally:
+            connections[DEFAULT_DB_ALIAS].close()
+            connections[DEFAULT_DB_ALIAS] = original
+        self.stdout.write(f'Pool: {pool_stats()}')
+
+    def run(self, client, path, count):
+        """Return the latency of every request, closing connections at the end of each like the request handler"""
+        latencies = []
+        for _ in range(count):
+            started = time.perf_counter()
+            response = client.get(path)
+            # The test client leaves connections open, do what the handler does on request_finished
+            close_old_connections()
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                raise CommandError(f'{path} answered {response.status_code}')
+        return latencies
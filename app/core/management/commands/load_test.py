@@ -0,0 +1,89 @@
+import http.client
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    """
+    Django command to measure the requests per second a running server answers, e.g. to compare runserver with the
+    production profile (docker-compose-deploy.yml):
+    python manage.py load_test --target runserver=http://localhost:8001 --target gunicorn=http://localhost:8000 \
+        --path /api/recipe/recipes/ --token <token>
+    """
+    help = 'Send concurrent GET requests to running servers and report requests per second and latencies'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', required=True, help='name=base URL, can be repeated')
+        parser.add_argument('--path', action='append', help='path to request, can be repeated')
+        parser.add_argument('--token', help='token of the user sending the requests')
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--duration', type=float, default=30)
+
+    def handle(self, *args, **options):
+        headers = {'Accept': 'application/json'}
+        if options['token']:
+            headers['Authorization'] = f'Token {options["token"]}'
+        paths = options['path'] or ['/api/recipe/recipes/']
+
+        for target in options['target']:
+            name, sep, base_url = target.partition('=')
+            if not sep:
+                raise CommandError(f'Expected name=base URL, got {target}')
+            results = self.run(base_url, paths, headers, options['concurrency'], options['duration'])
+            latencies = sorted(results['latencies'])
+            if not latencies:
+                raise CommandError(f'{name}: no request succeeded ({results["errors"]} errors)')
+            quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+            self.stdout.write(self.style.SUCCESS(
+                f'{name}: {len(latencies) / results["elapsed"]:.1f} requests/s, '
+                f'p50 {quantiles[49] * 1000:.1f} ms, p95 {quantiles[94] * 1000:.1f} ms, '
+                f'p99 {quantiles[98] * 1000:.1f} ms, {results["errors"]} errors'
+            ))
+
+    def run(self, base_url, paths, headers, concurrency, duration):
+        """Send requests from concurrency threads, each over its own keep-alive connection, for duration seconds"""
+        url = urlsplit(base_url)
+        connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+        prefix = url.path.rstrip('/')
+        results = {'latencies': [], 'errors': 0}
+        lock = threading.Lock()
+        deadline = time.monotonic() + duration
+
+        def worker():
+            connection = connection_class(url.netloc, timeout=30)
+            latencies = []
+            errors = 0
+            i = 0
+            while time.monotonic() < deadline:
+                path = prefix + paths[i % len(paths)]
+                i += 1
+                started = time.perf_counter()
+                try:
+                    connection.request('GET', path, headers=headers)
+                    response = connection.getresponse()
+                    response.read()
+                except (OSError, http.client.HTTPException):
+                    errors += 1
+                    connection.close()
+                    continue
+                if response.status == 200:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+            connection.close()
+            with lock:
+                results['latencies'] += latencies
+                results['errors'] += errors
+
+        started = time.monotonic()
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        results['elapsed'] = time.monotonic() - started
+        return results
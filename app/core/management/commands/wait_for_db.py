@@ -1,20 +1,44 @@
-import time
-
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.db import connections
-from django.db.utils import OperationalError
+
+from core.db.health import wait_for_databases
 
 
 class Command(BaseCommand):
-    """Django command to pause execution until database is available"""
+    """
+    Django command to pause execution until the databases answer a query, or fail once the deadline passed so the
+    container is restarted. Every alias of DATABASES is checked in parallel unless --database is given.
+    """
+    help = 'Wait until the databases answer SELECT 1, with exponential backoff, up to a deadline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', action='append', help='alias to check, can be repeated')
+        parser.add_argument('--timeout', type=float, default=60, help='seconds to wait at most')
+        parser.add_argument('--check-timeout', type=float, default=5, help='seconds a single check may take')
+        parser.add_argument('--delay', type=float, default=0.1, help='seconds to wait before the first retry')
+        parser.add_argument('--max-delay', type=float, default=5, help='seconds to wait at most between retries')
 
     def handle(self, *args, **options):
+        aliases = options['database'] or list(connections)
+        unknown = [alias for alias in aliases if alias not in connections.databases]
+        if unknown:
+            raise CommandError(f'Unknown database: {", ".join(unknown)}')
+
         self.stdout.write('Waiting for database...')
-        db_conn = None
-        while not db_conn:
-            try:
-                db_conn = connections['default']
-            except OperationalError:
-                self.stdout.write('Database unavailable, waiting 1 second...')
-                time.sleep(1)
+        errors = wait_for_databases(
+            aliases,
+            deadline=options['timeout'],
+            check_timeout=options['check_timeout'],
+            delay=options['delay'],
+            max_delay=options['max_delay'],
+            on_retry=self.on_retry,
+        )
+        if errors:
+            raise CommandError(f'Database unavailable after {options["timeout"]} seconds: {self.describe(errors)}')
         self.stdout.write(self.style.SUCCESS('Database available!'))
+
+    def on_retry(self, errors, delay):
+        self.stdout.write(f'Database unavailable ({self.describe(errors)}), waiting {delay:.2f} seconds...')
+
+    def describe(self, errors):
+        return '; '.join(f'{alias}: {error}' for alias, error in errors.items())
@@ -0,0 +1,331 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+from core.db.pool import pool_stats
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds of the request duration histogram
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Statistics of the connection pools and their kind, the gauges of exited workers are dropped, see archive_metrics
+POOL_STATS = (
+    ('size', 'gauge'), ('max_size', 'gauge'), ('idle', 'gauge'), ('in_use', 'gauge'),
+    ('acquired', 'counter'), ('created', 'counter'), ('closed', 'counter'), ('waits', 'counter'),
+    ('timeouts', 'counter'), ('health_checks', 'counter'), ('health_check_failures', 'counter'),
+)
+
+# Name of the file of METRICS_DIR the counters of exited workers are added to
+ARCHIVE_NAME = 'archive.json'
+
+# Timings of the sampled request being handled, None when it isn't sampled
+_current_timings = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """
+    SQL and serializer timings of one request.
+    An instance is an execute wrapper (see connection.execute_wrapper) counting the queries and their time.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.sql = 0.0
+        self.serializer = 0.0
+        self._timing = set()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql += time.perf_counter() - started
+
+    @contextmanager
+    def activate(self):
+        """Make these the timings of the current request"""
+        token = _current_timings.set(self)
+        try:
+            yield self
+        finally:
+            _current_timings.reset(token)
+
+
+@contextmanager
+def timer(name):
+    """Add the time spent in the block to the name timing of the current request, if it is sampled"""
+    timings = _current_timings.get()
+    # Nested blocks, e.g. a serializer rendering another, are only counted once
+    if timings is None or name in timings._timing:
+        yield
+        return
+    timings._timing.add(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        setattr(timings, name, getattr(timings, name) + time.perf_counter() - started)
+        timings._timing.discard(name)
+
+
+class TimedSerializerMixin:
+    """Count the validation and rendering of a serializer in the serializer time of the request metrics"""
+
+    def is_valid(self, *args, **kwargs):
+        with timer('serializer'):
+            return super().is_valid(*args, **kwargs)
+
+    @property
+    def data(self):
+        with timer('serializer'):
+            return super().data
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in labels) + '}'
+
+
+class RequestMetrics:
+    """
+    Thread safe request metrics of this process by view and method, rendered in the Prometheus text format.
+    Every request is counted with its duration, the SQL and serializer timings are summed over the sampled requests
+    only, divide them by http_requests_sampled_total for per request averages.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            # (view, method, status) -> count
+            self._requests = defaultdict(int)
+            # (view, method) -> count of every bucket, then the sum and count of the durations
+            self._durations = defaultdict(lambda: [0] * len(DURATION_BUCKETS) + [0.0, 0])
+            # (view, method) -> sampled requests, queries, SQL time, serializer time
+            self._sampled = defaultdict(lambda: [0, 0, 0.0, 0.0])
+
+    def observe(self, view, method, status, duration, timings=None):
+        with self._lock:
+            self._requests[view, method, status] += 1
+            histogram = self._durations[view, method]
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    histogram[i] += 1
+                    break
+            histogram[-2] += duration
+            histogram[-1] += 1
+            if timings is not None:
+                sampled = self._sampled[view, method]
+                sampled[0] += 1
+                sampled[1] += timings.queries
+                sampled[2] += timings.sql
+                sampled[3] += timings.serializer
+
+    def snapshot(self):
+        """Return the metrics as JSON serializable lists, to merge them into the metrics of another process"""
+        with self._lock:
+            return {
+                'requests': [[*key, count] for key, count in self._requests.items()],
+                'durations': [[*key, list(histogram)] for key, histogram in self._durations.items()],
+                'sampled': [[*key, list(values)] for key, values in self._sampled.items()],
+            }
+
+    def merge(self, snapshot):
+        """Add the metrics of a snapshot to these"""
+        with self._lock:
+            for view, method, status, count in snapshot['requests']:
+                self._requests[view, method, status] += count
+            for name in ('durations', 'sampled'):
+                metrics = getattr(self, f'_{name}')
+                for view, method, values in snapshot[name]:
+                    totals = metrics[view, method]
+                    for i, value in enumerate(values):
+                        totals[i] += value
+
+    def render(self):
+        """Return the lines of the metrics in the Prometheus text exposition format"""
+        with self._lock:
+            requests = dict(self._requests)
+            durations = {key: list(value) for key, value in self._durations.items()}
+            sampled = {key: list(value) for key, value in self._sampled.items()}
+
+        lines = [
+            '# HELP http_requests_total Requests handled.',
+            '# TYPE http_requests_total counter',
+        ]
+        for (view, method, status), count in sorted(requests.items()):
+            labels = format_labels((('view', view), ('method', method), ('status', status)))
+            lines.append(f'http_requests_total{labels} {count}')
+
+        lines += [
+            '# HELP http_request_duration_seconds Time to handle a request.',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        for (view, method), histogram in sorted(durations.items()):
+            cumulative = 0
+            for bound, count in zip(DURATION_BUCKETS, histogram):
+                cumulative += count
+                labels = format_labels((('view', view), ('method', method), ('le', bound)))
+                lines.append(f'http_request_duration_seconds_bucket{labels} {cumulative}')
+            labels = format_labels((('view', view), ('method', method), ('le', '+Inf')))
+            lines.append(f'http_request_duration_seconds_bucket{labels} {histogram[-1]}')
+            labels = format_labels((('view', view), ('method', method)))
+            lines.append(f'http_request_duration_seconds_sum{labels} {histogram[-2]}')
+            lines.append(f'http_request_duration_seconds_count{labels} {histogram[-1]}')
+
+        for i, (name, description) in enumerate((
+            ('http_requests_sampled_total', 'Requests whose SQL and serializer timings were recorded.'),
+            ('http_request_sql_queries_total', 'SQL queries of the sampled requests.'),
+            ('http_request_sql_duration_seconds_total', 'Time spent in SQL queries by the sampled requests.'),
+            ('http_request_serializer_duration_seconds_total', 'Time spent in serializers by the sampled requests.'),
+        )):
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} counter']
+            for (view, method), values in sorted(sampled.items()):
+                lines.append(f'{name}{format_labels((("view", view), ("method", method)))} {values[i]}')
+        return lines
+
+
+request_metrics = RequestMetrics()
+
+
+def worker_metrics():
+    """Return the request, response cache and connection pool metrics of this process"""
+    # core doesn't depend on the recipe app at import time
+    from recipe.caching import response_cache_stats
+
+    return {
+        'requests': request_metrics.snapshot(),
+        'response_cache': response_cache_stats.snapshot(),
+        'pools': pool_stats(),
+    }
+
+
+def merge_metrics(snapshots, gauges=True):
+    """Return the sum of metrics of several processes, without the pool gauges unless gauges is true"""
+    requests = RequestMetrics()
+    cache = {'hits': 0, 'misses': 0}
+    pools = {}
+    for snapshot in snapshots:
+        requests.merge(snapshot['requests'])
+        for name in cache:
+            cache[name] += snapshot['response_cache'][name]
+        for alias, stats in snapshot['pools'].items():
+            totals = pools.setdefault(alias, {})
+            for name, kind in POOL_STATS:
+                if gauges or kind == 'counter':
+                    totals[name] = totals.get(name, 0) + stats.get(name, 0)
+    return {'requests': requests.snapshot(), 'response_cache': cache, 'pools': pools}
+
+
+def write_json(path, data):
+    """Replace a file with the JSON of data at once, readers never see it half written"""
+    temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(data, f)
+    os.replace(temporary, path)
+
+
+def worker_metrics_path(directory, pid):
+    return os.path.join(directory, f'worker-{pid}.json')
+
+
+def write_worker_metrics(directory):
+    """Write the metrics of this process to its file of a directory shared by the workers"""
+    write_json(worker_metrics_path(directory, os.getpid()), worker_metrics())
+
+
+def read_metrics(directory):
+    """Return the metrics written to a directory by the workers, with the archive of the exited ones"""
+    snapshots = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                snapshots.append(json.load(f))
+        except FileNotFoundError:
+            # An exited worker whose metrics were archived meanwhile
+            continue
+    return snapshots
+
+
+def archive_metrics(directory, pid):
+    """
+    Add the counters of an exited worker to the archive of a directory and remove its file, so the totals don't
+    drop when gunicorn replaces a worker. Its pool gauges are dropped, its connections are closed.
+    Called by the gunicorn master, see gunicorn.conf.py, which reaps one worker at a time.
+    """
+    path = worker_metrics_path(directory, pid)
+    try:
+        with open(path) as f:
+            snapshots = [json.load(f)]
+    except FileNotFoundError:
+        return
+    archive = os.path.join(directory, ARCHIVE_NAME)
+    if os.path.exists(archive):
+        with open(archive) as f:
+            snapshots.append(json.load(f))
+    write_json(archive, merge_metrics(snapshots, gauges=False))
+    os.remove(path)
+
+
+def start_metrics_writer(directory, interval):
+    """Write the metrics of this process to directory every interval seconds from a daemon thread"""
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                write_worker_metrics(directory)
+            except Exception:
+                logger.exception('Writing the metrics to %s failed', directory)
+
+    thread = threading.Thread(target=run, name='metrics-writer', daemon=True)
+    thread.start()
+    return thread
+
+
+def render_metrics():
+    """
+    Return the request, response cache and connection pool metrics in the Prometheus format.
+    With METRICS_DIR they are the sum of every worker of the container, or of this process only without it.
+    """
+    if settings.METRICS_DIR:
+        write_worker_metrics(settings.METRICS_DIR)
+        metrics = merge_metrics(read_metrics(settings.METRICS_DIR))
+    else:
+        metrics = worker_metrics()
+
+    requests = RequestMetrics()
+    requests.merge(metrics['requests'])
+    lines = requests.render()
+    cache = metrics['response_cache']
+    for name in ('hits', 'misses'):
+        lines += [
+            f'# HELP response_cache_{name}_total Lookups of the response cache that were {name}.',
+            f'# TYPE response_cache_{name}_total counter',
+            f'response_cache_{name}_total {cache[name]}',
+        ]
+
+    pools = metrics['pools']
+    for name, kind in POOL_STATS:
+        if not pools:
+            break
+        metric = f'db_pool_{name}' + ('_total' if kind == 'counter' else '')
+        lines += [f'# HELP {metric} Connection pool {name.replace("_", " ")}.', f'# TYPE {metric} {kind}']
+        for alias, stats in sorted(pools.items()):
+            lines.append(f'{metric}{format_labels((("database", alias),))} {stats[name]}')
+    return '\n'.join(lines) + '\n'
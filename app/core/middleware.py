@@ -0,0 +1,54 @@
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from .metrics import RequestTimings, request_metrics, start_metrics_writer
+
+
+class RequestMetricsMiddleware:
+    """
+    Record the duration of every request by view (the URL name, e.g. recipe-list) and method into request_metrics.
+    METRICS_SAMPLE_RATE of the requests also record their SQL queries and serializer time, these cost a wrapper
+    around every query. With METRICS_SERVER_TIMING the timings are sent in a Server-Timing header.
+    Streamed responses are measured until the view returns them, sending their content isn't counted.
+    With METRICS_DIR the metrics of the process are written there every METRICS_WRITE_INTERVAL seconds, for the
+    /metrics of the other workers.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if settings.METRICS_DIR:
+            start_metrics_writer(settings.METRICS_DIR, settings.METRICS_WRITE_INTERVAL)
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        timings = None
+        if settings.METRICS_SAMPLE_RATE and random.random() < settings.METRICS_SAMPLE_RATE:
+            timings = RequestTimings()
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timings))
+                stack.enter_context(timings.activate())
+                response = self.get_response(request)
+        else:
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        view = (match.url_name or match.view_name) if match is not None else 'unmatched'
+        request_metrics.observe(view, request.method, response.status_code, duration, timings)
+        if settings.METRICS_SERVER_TIMING:
+            response['Server-Timing'] = self.server_timing(duration, timings)
+        return response
+
+    def server_timing(self, duration, timings):
+        entries = [f'total;dur={duration * 1000:.1f}']
+        if timings is not None:
+            entries += [
+                f'db;dur={timings.sql * 1000:.1f};desc="{timings.queries} queries"',
+                f'serializer;dur={timings.serializer * 1000:.1f}',
+            ]
+        return ', '.join(entries)
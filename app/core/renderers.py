@@ -0,0 +1,82 @@
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class StreamedList:
+    """List of a response whose items are only produced, and rendered, while the response is being sent"""
+
+    def __init__(self, items):
+        self.items = items
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSON renderer using orjson when it is installed, falling back to the stdlib json of JSONRenderer otherwise.
+    The output is the same as JSONRenderer's, only the compact unicode form (the default) is rendered by orjson.
+    """
+    chunk_size = 64 * 1024
+
+    def use_orjson(self, accepted_media_type, renderer_context):
+        return (
+            orjson is not None and self.compact and not self.ensure_ascii
+            and self.get_indent(accepted_media_type, renderer_context or {}) is None
+        )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None or not self.use_orjson(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+        # Datetimes are passed to the encoder so they are formatted like JSONRenderer does
+        ret = orjson.dumps(
+            data,
+            default=self.encoder_class().default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME,
+        )
+        # Like JSONRenderer, escape the line separators that are not valid in javascript strings
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+    def can_stream(self, accepted_media_type=None, renderer_context=None):
+        """Return whether render_stream renders the same bytes as render"""
+        return self.compact and self.get_indent(accepted_media_type, renderer_context or {}) is None
+
+    def render_stream(self, data, accepted_media_type=None, renderer_context=None):
+        """
+        Render data chunk by chunk. The items of a StreamedList in data are produced and rendered one at a time, so
+        the first bytes are sent before the whole list is serialized and it is never held in memory.
+        """
+        buffer = bytearray()
+        for part in self._render_parts(data, accepted_media_type, renderer_context):
+            buffer += part
+            if len(buffer) >= self.chunk_size:
+                yield bytes(buffer)
+                buffer.clear()
+        if buffer:
+            yield bytes(buffer)
+
+    def _render_parts(self, data, accepted_media_type, renderer_context):
+        if isinstance(data, StreamedList):
+            yield b'['
+            for i, item in enumerate(data):
+                if i:
+                    yield b','
+                yield self.render(item, accepted_media_type, renderer_context)
+            yield b']'
+        elif isinstance(data, dict) and any(isinstance(value, StreamedList) for value in data.values()):
+            yield b'{'
+            for i, (key, value) in enumerate(data.items()):
+                if i:
+                    yield b','
+                yield self.render(str(key), accepted_media_type, renderer_context) + b':'
+                yield from self._render_parts(value, accepted_media_type, renderer_context)
+            yield b'}'
+        elif data is None:
+            # render() returns an empty body for None
+            yield b'null'
+        else:
+            yield self.render(data, accepted_media_type, renderer_context)
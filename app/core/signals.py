@@ -0,0 +1,62 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.signals import request_finished, request_started
+from django.db import connections, transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from .authentication import token_cache
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, using, **kwargs):
+    """A deleted token must stop authenticating as soon as it is committed"""
+    # The key is the primary key, which the delete resets
+    key, user_id = instance.key, instance.user_id
+
+    def forget():
+        token_cache.delete(key)
+        # The other workers only learn about it from the revision of the user
+        token_cache.delete_user(user_id)
+
+    # Forgotten before the commit, a concurrent request could cache the row again
+    transaction.on_commit(forget, using=using)
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def forget_user_tokens(sender, instance, using, **kwargs):
+    """Deactivation, password and profile changes must not be served from a stale cached user"""
+    user_id = instance.pk
+    # Forgotten before the commit, a concurrent request could cache the row again
+    transaction.on_commit(lambda: token_cache.delete_user(user_id), using=using)
+
+
+@receiver(request_started)
+def check_persistent_connections(**kwargs):
+    """
+    Replace the persistent connections that stopped working while they were idle, before the request uses them.
+    Only connections idle for more than DB_CONN_HEALTH_CHECK_INTERVAL seconds are checked, with a SELECT 1.
+    """
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is None or connection.in_atomic_block:
+            continue
+        idle_since = getattr(connection, 'idle_since', None)
+        if idle_since is not None and now - idle_since <= settings.DB_CONN_HEALTH_CHECK_INTERVAL:
+            continue
+        if not connection.is_usable():
+            connection.close()
+
+
+@receiver(request_finished)
+def mark_connections_idle(**kwargs):
+    """Remember when the persistent connections were last used"""
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is not None:
+            connection.idle_since = now
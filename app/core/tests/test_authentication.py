@@ -0,0 +1,186 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.authentication import TokenCache, token_cache
+
+
+ME_URL = reverse('user:me')
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Test the cached token authentication"""
+
+    def setUp(self) -> None:
+        token_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email='test@test.com',
+            password='Test1234',
+            name='Test'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_token_lookup_is_cached(self):
+        """Test only the first request looks the token up"""
+        with self.assertNumQueries(1):
+            res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], self.user.email)
+
+    def test_deleted_token_is_rejected(self):
+        """Test deleting a token invalidates the cache"""
+        self.client.get(ME_URL)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token.delete()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_is_rejected(self):
+        """Test deactivating a user invalidates the cache"""
+        self.client.get(ME_URL)
+
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_updated_user_is_reloaded(self):
+        """Test changing the user through the API doesn't serve the stale user"""
+        self.client.get(ME_URL)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(ME_URL, {'name': 'New name', 'password': 'NewPass1234'})
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.data['name'], 'New name')
+
+    @override_settings(TOKEN_AUTH_CACHE_TTL=10)
+    def test_cache_entry_expires(self):
+        """Test tokens are looked up again after the TTL"""
+        with patch('core.authentication.time.monotonic', return_value=100):
+            self.client.get(ME_URL)
+        with patch('core.authentication.time.monotonic', return_value=111):
+            with self.assertNumQueries(1):
+                self.client.get(ME_URL)
+
+    @override_settings(TOKEN_AUTH_CACHE_SIZE=1)
+    def test_cache_is_bounded(self):
+        """Test the least recently used token is evicted"""
+        other = get_user_model().objects.create_user(email='other@test.com', password='Test1234')
+        other_token = Token.objects.create(user=other)
+        self.client.get(ME_URL)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {other_token.key}')
+        self.client.get(ME_URL)
+
+        self.assertIsNone(token_cache.get(self.token.key))
+        self.assertIsNotNone(token_cache.get(other_token.key))
+
+    @override_settings(
+        TOKEN_AUTH_SHARED_CACHE='default',
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'token-auth'}},
+    )
+    def test_shared_cache(self):
+        """Test a token authenticated by another worker is found in the shared cache"""
+        self.client.get(ME_URL)
+        token_cache.clear()
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token.delete()
+        token_cache.clear()
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_cached_user_is_not_shared(self):
+        """Test every hit returns new instances, so changing the user of a request doesn't change the cache"""
+        self.client.get(ME_URL)
+
+        user, token = token_cache.get(self.token.key)
+        user.name = 'Changed'
+
+        self.assertEqual(token_cache.get(self.token.key)[0].name, 'Test')
+        self.assertIsNot(token_cache.get(self.token.key)[1], token)
+
+    @override_settings(
+        TOKEN_AUTH_SHARED_CACHE='default',
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'token-auth'}},
+    )
+    def test_shared_cache_has_no_secrets(self):
+        """Test neither the raw token nor the password hash are put in the shared cache"""
+        self.client.get(ME_URL)
+
+        entry = caches['default'].get(TokenCache.shared_key(self.token.key))
+        self.assertIsNotNone(entry)
+        self.assertNotIn(self.token.key, repr(entry))
+        self.assertNotIn(self.user.password, repr(entry))
+
+    @override_settings(
+        TOKEN_AUTH_SHARED_CACHE='default',
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'token-auth'}},
+    )
+    def test_user_change_reaches_other_workers(self):
+        """Test a user deactivated by another worker is rejected by the local cache"""
+        self.client.get(ME_URL)
+
+        get_user_model().objects.filter(pk=self.user.pk).update(is_active=False)
+        # Another worker's cache, whose local entries this one doesn't see
+        TokenCache().delete_user(self.user.pk)
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_forgotten_on_commit(self):
+        """Test the cached user is only forgotten once the change is committed, not re-cached from the old row"""
+        self.client.get(ME_URL)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.user.is_active = False
+            self.user.save()
+        self.assertIsNotNone(token_cache.get(self.token.key))
+        for callback in callbacks:
+            callback()
+
+        self.assertIsNone(token_cache.get(self.token.key))
+
+    def test_user_changed_while_loading_is_not_cached(self):
+        """Test a user changed between the stamp and the database lookup isn't cached"""
+        stamp = token_cache.stamp(self.token.key)
+        token_cache.delete_user(self.user.pk)
+
+        token_cache.set(self.token.key, self.token, stamp)
+
+        self.assertIsNone(token_cache.get(self.token.key))
+
+    @override_settings(
+        TOKEN_AUTH_SHARED_CACHE='default',
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'token-auth'}},
+    )
+    def test_user_changed_by_other_worker_while_loading_is_not_cached(self):
+        """Test a user changed by another worker while it was loaded is looked up again by every worker"""
+        stamp = token_cache.stamp(self.token.key)
+        TokenCache().delete_user(self.user.pk)
+
+        token_cache.set(self.token.key, self.token, stamp)
+
+        self.assertIsNone(token_cache.get(self.token.key))
+        self.assertIsNone(TokenCache().get(self.token.key))
@@ -1,6 +1,7 @@
 from unittest.mock import patch
 
-from django.core.management import call_command
+from django.core.management import CommandError, call_command
+from django.db import connections
 from django.db.utils import OperationalError
 from django.test import TestCase
 
@@ -9,17 +10,60 @@ class CommandTests(TestCase):
 
     def test_wait_for_db_ready(self):
         """Test waiting for db when db is available"""
-        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
-            gi.return_value = True
+        with patch('core.db.health.check_database') as check:
             call_command('wait_for_db')
-            self.assertEqual(gi.call_count, 1)
+            self.assertEqual(check.call_count, 1)
 
-    # Because the wait_for_db command is trying to connect to the db each sec, we don't wait that time in our test
-    # ts is the return value of the time.sleep that we set
+    def test_wait_for_db_query(self):
+        """Test the database must answer a query"""
+        call_command('wait_for_db', timeout=5)
+
+    # Because the wait_for_db command is trying to connect to the db with a backoff, we don't wait that time in our test
+    # ts is the mock of time.sleep that we set
     @patch('time.sleep', return_value=True)
     def test_wait_for_db(self, ts):
         """Test waiting for db"""
-        with patch('django.db.utils.ConnectionHandler.__getitem__', ) as gi:
-            gi.side_effect = [OperationalError] * 5 + [True]
+        with patch('core.db.health.check_database') as check:
+            check.side_effect = [OperationalError] * 5 + [None]
             call_command('wait_for_db')
-            self.assertEqual(gi.call_count, 6)
+            self.assertEqual(check.call_count, 6)
+            self.assertEqual(ts.call_count, 5)
+
+    @patch('time.sleep', return_value=True)
+    def test_wait_for_db_backoff(self, ts):
+        """Test the waits grow exponentially, with jitter, up to the max delay"""
+        with patch('core.db.health.check_database') as check, \
+                patch('core.db.health.random.uniform', side_effect=lambda low, high: high) as uniform:
+            check.side_effect = [OperationalError] * 8 + [None]
+            call_command('wait_for_db', delay=0.5, max_delay=4)
+
+        self.assertEqual([args[1] for args, _ in uniform.call_args_list], [0.5, 1, 2, 4, 4, 4, 4, 4])
+
+    def test_wait_for_db_deadline(self):
+        """Test the command fails once the deadline passed"""
+        with patch('core.db.health.check_database', side_effect=OperationalError('refused')) as check, \
+                self.assertRaisesMessage(CommandError, 'default: refused'):
+            call_command('wait_for_db', timeout=0.2, delay=0.01)
+
+        self.assertGreater(check.call_count, 1)
+
+    def test_wait_for_db_aliases(self):
+        """Test every given alias is checked, and only the unavailable ones again"""
+        replica_errors = [OperationalError(), OperationalError()]
+
+        def check_database(alias):
+            if alias == 'replica1' and replica_errors:
+                raise replica_errors.pop()
+
+        with patch.dict(connections.databases, {'replica1': {}}), \
+                patch('core.db.health.check_database', side_effect=check_database) as check, patch('time.sleep'):
+            call_command('wait_for_db', database=['default', 'replica1'])
+
+        checked = [args[0] for args, _ in check.call_args_list]
+        self.assertEqual(checked.count('default'), 1)
+        self.assertEqual(checked.count('replica1'), 3)
+
+    def test_wait_for_db_unknown_alias(self):
+        """Test an unknown alias is an error"""
+        with self.assertRaisesMessage(CommandError, 'Unknown database: missing'):
+            call_command('wait_for_db', database=['missing'])
@@ -0,0 +1,103 @@
+import sqlite3
+import threading
+from unittest.mock import MagicMock, patch
+
+from django.test import SimpleTestCase, override_settings
+
+from core.db.pool import ConnectionPool, PoolTimeout
+from core.signals import check_persistent_connections
+
+
+def check_connection(connection):
+    try:
+        connection.execute('SELECT 1')
+        return True
+    except sqlite3.Error:
+        return False
+
+
+def sample_pool(**kwargs):
+    return ConnectionPool(
+        connect=lambda: sqlite3.connect(':memory:', check_same_thread=False),
+        reset=lambda connection: True,
+        check=check_connection,
+        **kwargs
+    )
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """Test the connection pool"""
+
+    def test_reuse_released_connection(self):
+        """Test a released connection is handed out again instead of opening a new one"""
+        pool = sample_pool()
+        connection = pool.acquire()
+        pool.release(connection)
+
+        self.assertIs(pool.acquire(), connection)
+        self.assertEqual(pool.snapshot()['created'], 1)
+        self.assertEqual(pool.snapshot()['in_use'], 1)
+
+    def test_wait_for_release(self):
+        """Test a full pool waits for a connection to be released, and times out when none is"""
+        pool = sample_pool(max_size=1, timeout=0.05)
+        connection = pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+
+        pool.timeout = 5
+        threading.Timer(0.05, pool.release, [connection]).start()
+        self.assertIs(pool.acquire(), connection)
+        stats = pool.snapshot()
+        self.assertEqual((stats['waits'], stats['timeouts'], stats['size']), (2, 1, 1))
+
+    def test_health_check(self):
+        """Test an idle connection that stopped working is replaced"""
+        pool = sample_pool(health_check_interval=0)
+        connection = pool.acquire()
+        pool.release(connection)
+        connection.close()
+
+        self.assertIsNot(pool.acquire(), connection)
+        stats = pool.snapshot()
+        self.assertEqual((stats['health_check_failures'], stats['closed'], stats['size']), (1, 1, 1))
+
+    def test_unusable_connection_not_reused(self):
+        """Test a connection that can't be reset is closed on release"""
+        pool = sample_pool()
+        pool.reset = lambda connection: False
+        pool.release(pool.acquire())
+
+        self.assertEqual(pool.snapshot()['size'], 0)
+
+
+class PersistentConnectionHealthCheckTests(SimpleTestCase):
+    """Test persistent connections are checked before a request uses them"""
+
+    def sample_connection(self, usable, idle_since=None):
+        connection = MagicMock(in_atomic_block=False, idle_since=idle_since)
+        connection.is_usable.return_value = usable
+        return connection
+
+    @override_settings(DB_CONN_HEALTH_CHECK_INTERVAL=30)
+    def test_close_broken_connection(self):
+        """Test a broken connection is closed, so the request opens a new one"""
+        broken = self.sample_connection(usable=False)
+        working = self.sample_connection(usable=True)
+        with patch('core.signals.connections') as connections:
+            connections.all.return_value = [broken, working]
+            check_persistent_connections()
+
+        broken.close.assert_called_once()
+        working.close.assert_not_called()
+
+    @override_settings(DB_CONN_HEALTH_CHECK_INTERVAL=30)
+    def test_recently_used_connection_not_checked(self):
+        """Test a connection used less than the interval ago isn't checked"""
+        with patch('core.signals.time.monotonic', return_value=100):
+            connection = self.sample_connection(usable=False, idle_since=90)
+            with patch('core.signals.connections') as connections:
+                connections.all.return_value = [connection]
+                check_persistent_connections()
+
+        connection.is_usable.assert_not_called()
@@ -0,0 +1,27 @@
+from django.db import router
+from django.test import SimpleTestCase, override_settings
+
+from core.db.routers import replica_reads
+from recipe.models import Recipe
+
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'])
+class ReplicaRouterTests(SimpleTestCase):
+    """Test the routing of queries to the read replicas"""
+
+    def test_reads_from_primary_by_default(self):
+        """Test reads outside replica_reads go to the primary"""
+        self.assertEqual(router.db_for_read(Recipe), 'default')
+
+    def test_replica_reads(self):
+        """Test reads inside replica_reads go to a replica and writes to the primary"""
+        with replica_reads():
+            self.assertIn(router.db_for_read(Recipe), ('replica1', 'replica2'))
+            self.assertEqual(router.db_for_write(Recipe), 'default')
+
+        self.assertEqual(router.db_for_read(Recipe), 'default')
+
+    def test_replicas_not_migrated(self):
+        """Test migrations only run on the primary"""
+        self.assertTrue(router.allow_migrate('default', 'recipe'))
+        self.assertFalse(router.allow_migrate('replica1', 'recipe'))
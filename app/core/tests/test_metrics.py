@@ -0,0 +1,142 @@
+import json
+import os
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core.metrics import (
+    RequestMetrics, RequestTimings, archive_metrics, merge_metrics, request_metrics, worker_metrics_path,
+)
+
+RECIPE_URL = reverse('recipe:recipe-list')
+
+
+class RequestMetricsTests(TestCase):
+    """Test the request metrics middleware and endpoint"""
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='test@test.com',
+            password='Test1234'
+        )
+        self.client.force_authenticate(self.user)
+        request_metrics.reset()
+
+    @override_settings(METRICS_SAMPLE_RATE=1)
+    def test_sampled_request(self):
+        """Test a sampled request sends its SQL and serializer timings"""
+        res = self.client.get(RECIPE_URL)
+
+        entries = [entry.split(';')[0] for entry in res['Server-Timing'].split(', ')]
+        self.assertEqual(entries, ['total', 'db', 'serializer'])
+        self.assertRegex(res['Server-Timing'], r'desc="[1-9]\d* queries"')
+
+    @override_settings(METRICS_SAMPLE_RATE=0)
+    def test_unsampled_request(self):
+        """Test a request that isn't sampled only records its duration"""
+        res = self.client.get(RECIPE_URL)
+
+        self.assertRegex(res['Server-Timing'], r'^total;dur=[\d.]+$')
+
+    @override_settings(METRICS_SERVER_TIMING=False)
+    def test_server_timing_disabled(self):
+        """Test the Server-Timing header can be turned off"""
+        res = self.client.get(RECIPE_URL)
+
+        self.assertNotIn('Server-Timing', res)
+
+    @override_settings(METRICS_SAMPLE_RATE=1)
+    def test_metrics_endpoint(self):
+        """Test the metrics of the requests are served in the Prometheus format"""
+        self.client.get(RECIPE_URL)
+        self.client.post(RECIPE_URL, {'title': 'Cake', 'time_minutes': 5, 'price': '1.00'})
+
+        res = self.client.get(reverse('metrics'))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res['Content-Type'].startswith('text/plain; version=0.0.4'))
+        content = res.content.decode()
+        self.assertIn('http_requests_total{view="recipe-list",method="GET",status="200"} 1', content)
+        self.assertIn('http_requests_total{view="recipe-list",method="POST",status="201"} 1', content)
+        self.assertIn('http_requests_sampled_total{view="recipe-list",method="GET"} 1', content)
+        self.assertIn('http_request_duration_seconds_count{view="recipe-list",method="GET"} 1', content)
+        self.assertIn('response_cache_misses_total', content)
+
+
+class RequestMetricsRegistryTests(TestCase):
+    """Test the rendering of the request metrics"""
+
+    def test_histogram(self):
+        """Test the duration buckets are cumulative"""
+        metrics = RequestMetrics()
+        timings = RequestTimings()
+        timings.queries, timings.sql, timings.serializer = 3, 0.002, 0.001
+        metrics.observe('tag-list', 'GET', 200, 0.004, timings)
+        metrics.observe('tag-list', 'GET', 200, 0.2)
+
+        lines = metrics.render()
+
+        self.assertIn('http_request_duration_seconds_bucket{view="tag-list",method="GET",le="0.005"} 1', lines)
+        self.assertIn('http_request_duration_seconds_bucket{view="tag-list",method="GET",le="0.25"} 2', lines)
+        self.assertIn('http_request_duration_seconds_bucket{view="tag-list",method="GET",le="+Inf"} 2', lines)
+        self.assertIn('http_request_sql_queries_total{view="tag-list",method="GET"} 3', lines)
+        self.assertIn('http_requests_sampled_total{view="tag-list",method="GET"} 1', lines)
+
+
+class WorkerMetricsTests(TestCase):
+    """Test the metrics of the gunicorn workers summed through METRICS_DIR"""
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        request_metrics.reset()
+
+    def worker(self, pid, count, pool_size=2, acquired=10):
+        metrics = RequestMetrics()
+        for _ in range(count):
+            metrics.observe('tag-list', 'GET', 200, 0.01)
+        snapshot = {
+            'requests': metrics.snapshot(),
+            'response_cache': {'hits': count, 'misses': 1},
+            'pools': {'default': {'size': pool_size, 'acquired': acquired}},
+        }
+        with open(worker_metrics_path(self.directory.name, pid), 'w') as f:
+            json.dump(snapshot, f)
+
+    def test_metrics_of_every_worker(self):
+        """Test /metrics returns the sum of the metrics written by the workers and its own"""
+        self.worker(1, 2)
+        self.worker(2, 3)
+
+        with override_settings(METRICS_DIR=self.directory.name):
+            res = self.client.get(reverse('metrics'))
+
+        content = res.content.decode()
+        self.assertIn('http_requests_total{view="tag-list",method="GET",status="200"} 5', content)
+        self.assertIn('http_request_duration_seconds_count{view="tag-list",method="GET"} 5', content)
+        self.assertIn('response_cache_hits_total 5', content)
+        self.assertIn('db_pool_size{database="default"} 4', content)
+        self.assertTrue(os.path.exists(worker_metrics_path(self.directory.name, os.getpid())))
+
+    def test_archive_exited_worker(self):
+        """Test the counters of an exited worker stay in the totals, its gauges don't"""
+        self.worker(1, 2)
+        self.worker(2, 3)
+        archive_metrics(self.directory.name, 1)
+        self.worker(3, 1)
+        archive_metrics(self.directory.name, 3)
+
+        self.assertEqual(sorted(os.listdir(self.directory.name)), ['archive.json', 'worker-2.json'])
+        snapshots = []
+        for name in os.listdir(self.directory.name):
+            with open(os.path.join(self.directory.name, name)) as f:
+                snapshots.append(json.load(f))
+        metrics = merge_metrics(snapshots)
+        self.assertEqual(metrics['requests']['requests'], [['tag-list', 'GET', 200, 6]])
+        self.assertEqual(metrics['pools']['default']['size'], 2)
+        self.assertEqual(metrics['pools']['default']['acquired'], 30)
@@ -0,0 +1,73 @@
+import datetime
+import io
+from collections import OrderedDict
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+from django.utils import timezone
+
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+
+from core.parsers import FastJSONParser
+from core.renderers import FastJSONRenderer, StreamedList
+
+
+SAMPLE = OrderedDict([
+    ('id', 1),
+    ('title', 'Crème brûlée  '),
+    ('price', Decimal('5.50')),
+    ('created', datetime.datetime(2021, 1, 2, 3, 4, 5, 678901, tzinfo=timezone.utc)),
+    ('tags', [1, 2]),
+    (3, None),
+])
+
+
+class FastJSONRendererTests(SimpleTestCase):
+    """Test the orjson backed renderer and parser"""
+
+    def test_render_like_json_renderer(self):
+        """Test the output is the same as the stdlib renderer"""
+        self.assertEqual(FastJSONRenderer().render(SAMPLE), JSONRenderer().render(SAMPLE))
+
+    def test_render_indented(self):
+        """Test indented output falls back to the stdlib renderer"""
+        media_type = 'application/json; indent=4'
+        self.assertEqual(
+            FastJSONRenderer().render(SAMPLE, media_type),
+            JSONRenderer().render(SAMPLE, media_type)
+        )
+
+    def test_render_without_orjson(self):
+        """Test the renderer works when orjson isn't installed"""
+        with patch('core.renderers.orjson', None):
+            self.assertEqual(FastJSONRenderer().render(SAMPLE), JSONRenderer().render(SAMPLE))
+
+    def test_render_stream(self):
+        """Test streaming a list renders the same bytes, the items only produced while streaming"""
+        produced = []
+
+        def items():
+            for i in range(3):
+                produced.append(i)
+                yield {'id': i}
+
+        renderer = FastJSONRenderer()
+        renderer.chunk_size = 1
+        data = OrderedDict([('next', None), ('results', StreamedList(items()))])
+        chunks = renderer.render_stream(data)
+
+        self.assertEqual(next(chunks), b'{')
+        self.assertEqual(produced, [])
+        self.assertEqual(
+            b'{' + b''.join(chunks),
+            JSONRenderer().render({'next': None, 'results': [{'id': 0}, {'id': 1}, {'id': 2}]})
+        )
+
+    def test_parse(self):
+        """Test parsing JSON, and invalid JSON raising a parse error"""
+        parser = FastJSONParser()
+        self.assertEqual(parser.parse(io.BytesIO(b'{"name": "Salt"}')), {'name': 'Salt'})
+        with self.assertRaises(ParseError):
+            parser.parse(io.BytesIO(b'{"name": '))
@@ -0,0 +1,53 @@
+import threading
+from unittest.mock import patch
+
+from django.db.utils import OperationalError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core.db.health import executor
+
+
+class HealthCheckTests(TestCase):
+    """Test the liveness and readiness probes"""
+
+    def test_liveness(self):
+        """Test the liveness probe doesn't query the databases"""
+        with self.assertNumQueries(0):
+            res = self.client.get(reverse('health-live'))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json(), {'status': 'ok'})
+
+    def test_readiness(self):
+        """Test the readiness probe answers 200 when the databases answer"""
+        res = self.client.get(reverse('health-ready'))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json(), {'status': 'ok', 'databases': {'default': 'ok'}})
+
+    def test_readiness_unavailable(self):
+        """Test the readiness probe answers 503 without the error when a database doesn't answer"""
+        with patch('core.db.health.check_database', side_effect=OperationalError('db.internal refused')), \
+                self.assertLogs('core.views', level='WARNING'):
+            res = self.client.get(reverse('health-ready'))
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.json(), {'status': 'unavailable', 'databases': {'default': 'unavailable'}})
+        self.assertNotIn(b'db.internal', res.content)
+
+    @override_settings(HEALTH_CHECK_TIMEOUT=0.01)
+    def test_readiness_hung_database(self):
+        """Test probes of a database that hangs fail without starting a thread each"""
+        release = threading.Event()
+        threads = threading.active_count()
+        try:
+            with patch('core.db.health.check_database', side_effect=lambda alias: release.wait(5)), \
+                    self.assertLogs('core.views', level='WARNING'):
+                for _ in range(executor._max_workers * 2):
+                    res = self.client.get(reverse('health-ready'))
+                    self.assertEqual(res.status_code, 503)
+        finally:
+            release.set()
+
+        self.assertLessEqual(threading.active_count(), threads + executor._max_workers)
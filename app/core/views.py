@@ -0,0 +1,41 @@
+import logging
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_safe
+
+from core.db.health import check_databases
+from core.metrics import render_metrics
+
+logger = logging.getLogger(__name__)
+
+
+@never_cache
+@require_safe
+def liveness(request):
+    """Answer as long as the process serves requests, without touching the databases"""
+    return JsonResponse({'status': 'ok'})
+
+
+@never_cache
+@require_safe
+def readiness(request):
+    """Answer 200 when every database answers SELECT 1 within HEALTH_CHECK_TIMEOUT seconds, 503 otherwise"""
+    errors = check_databases(list(connections), timeout=settings.HEALTH_CHECK_TIMEOUT)
+    for alias, error in errors.items():
+        if error is not None:
+            logger.warning('Database %s unavailable: %s', alias, error)
+    # The errors may name hosts, they are only logged
+    databases = {alias: 'ok' if error is None else 'unavailable' for alias, error in errors.items()}
+    if any(error is not None for error in errors.values()):
+        return JsonResponse({'status': 'unavailable', 'databases': databases}, status=503)
+    return JsonResponse({'status': 'ok', 'databases': databases})
+
+
+@never_cache
+@require_safe
+def metrics(request):
+    """Return the metrics of this worker process in the Prometheus text format"""
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
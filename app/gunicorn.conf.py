@@ -0,0 +1,55 @@
+"""
+Gunicorn configuration of the production profile: gunicorn -c gunicorn.conf.py app.wsgi
+Every setting can be overridden from the environment. For the ASGI application, install uvicorn and run
+GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py app.asgi:application
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+# The usual 2 processes per core plus one, each handling requests in a few threads while others wait on the database
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+# app.settings reads GUNICORN_THREADS too, to size the database connection pool of each worker
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Requests are proxied by nginx, which buffers slow clients, so workers only wait on the application
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# Recycle workers now and then so a leak can't grow forever, the jitter keeps them from restarting all at once
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 1000))
+
+# Every worker starts its own image processing threads, see recipe.images, so the application isn't preloaded
+preload_app = False
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+
+# Workers share their metrics through this directory, see METRICS_DIR in app/settings.py
+metrics_dir = os.environ.get('METRICS_DIR')
+
+
+def on_starting(server):
+    """Forget the metrics of a previous run"""
+    if metrics_dir:
+        os.makedirs(metrics_dir, exist_ok=True)
+        for name in os.listdir(metrics_dir):
+            os.remove(os.path.join(metrics_dir, name))
+
+
+def worker_exit(server, worker):
+    """Write the last metrics of a worker, run in the worker"""
+    if metrics_dir:
+        from core.metrics import write_worker_metrics
+        write_worker_metrics(metrics_dir)
+
+
+def child_exit(server, worker):
+    """Keep the counters of an exited worker in the totals, run in the master"""
+    if metrics_dir:
+        from core.metrics import archive_metrics
+        archive_metrics(metrics_dir, worker.pid)
@@ -0,0 +1,43 @@
+from collections import Counter
+
+from django.db import connections, router
+
+from .counters import adjust_recipe_counts
+
+
+def bulk_create(model, objs, batch_size=1000):
+    """
+    Insert objects in batches and return them with their primary keys set.
+    Only backends that can return rows from a bulk insert (PostgreSQL) get the ids back, elsewhere the objects are
+    saved one by one so they can still be linked to other rows.
+    """
+    connection = connections[router.db_for_write(model)]
+    if connection.features.can_return_rows_from_bulk_insert:
+        return model.objects.bulk_create(objs, batch_size=batch_size)
+    for obj in objs:
+        obj.save(force_insert=True)
+    return objs
+
+
+def bulk_link(instances, field_name, related_objs, batch_size=1000):
+    """
+    Link every instance to its related objects of a many to many field with one bulk insert into the through table.
+    related_objs is a list of iterables of related objects, one for each instance. Bulk inserts don't send
+    m2m_changed, so the recipe counters of the linked objects are incremented here. The instances must not be linked
+    to any of their related objects yet.
+    """
+    if not instances:
+        return
+    field = instances[0]._meta.get_field(field_name)
+    through = field.remote_field.through
+    source_column = f'{field.m2m_field_name()}_id'
+    target_column = f'{field.m2m_reverse_field_name()}_id'
+    rows = []
+    linked = Counter()
+    for instance, objs in zip(instances, related_objs):
+        # dict.fromkeys drops repeated objects while keeping their order
+        for obj in dict.fromkeys(objs):
+            rows.append(through(**{source_column: instance.pk, target_column: obj.pk}))
+            linked[obj.pk] += 1
+    through.objects.bulk_create(rows, batch_size=batch_size)
+    adjust_recipe_counts(field.related_model, linked)
@@ -0,0 +1,117 @@
+import hashlib
+import threading
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from rest_framework.response import Response
+
+from .conditional import DataVersionMixin
+
+# Query parameters holding comma separated ids, their order and repetitions don't change the response
+ID_LIST_PARAMS = ('tags', 'ingredients')
+
+
+class ResponseCacheStats:
+    """Thread safe hit and miss counters of the response cache of this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+    def reset(self):
+        with self._lock:
+            self.hits = self.misses = 0
+
+
+response_cache_stats = ResponseCacheStats()
+
+
+def normalize_query(query_params):
+    """Return the query string of query params in a canonical form: sorted, with the id lists sorted and deduplicated"""
+    items = []
+    for key in sorted(query_params):
+        for value in query_params.getlist(key):
+            if key in ID_LIST_PARAMS:
+                ids = {part.strip() for part in value.split(',') if part.strip()}
+                value = ','.join(sorted(ids, key=lambda part: (len(part), part)))
+            items.append((key, value))
+    return urlencode(items)
+
+
+class ResponseCacheMixin(DataVersionMixin):
+    """
+    Cache the rendered JSON responses of cached_actions per user in the RESPONSE_CACHE alias of CACHES.
+    Keys are made of the user's data version, the scheme and host, the view, the action and the normalized query, so
+    the signal handlers bumping the version on every post_save, post_delete and m2m_changed of recipes, tags and
+    ingredients invalidate all the cached responses of their owner at once. Outdated entries are never read again and
+    expire after RESPONSE_CACHE_TTL.
+    A request with Cache-Control: no-cache skips the lookup, with no-store the cache isn't used at all.
+    Responses read from a replica (see recipe.replicas) may be older than the data version they would be keyed on,
+    they are served from the cache but never stored in it.
+    """
+    cached_actions = ('list',)
+
+    def data_version_actions(self):
+        return (*super().data_version_actions(), *self.cached_actions)
+
+    def get_response_cache_key(self, request):
+        if not settings.RESPONSE_CACHE or self.action not in self.cached_actions:
+            return None
+        if request.method != 'GET' or getattr(request.accepted_renderer, 'format', None) != 'json':
+            return None
+        if 'no-store' in request.headers.get('Cache-Control', ''):
+            return None
+        if self.data_version is None:
+            return None
+        version, modified = self.data_version
+        # The modification time tells apart the rows of a user deleted and recreated with the same id. The host and
+        # scheme are those of the absolute next and previous links of the cached pages
+        key = ':'.join((
+            str(request.user.pk), str(version), modified.isoformat(), request.scheme, request.get_host(),
+            type(self).__name__, self.action, normalize_query(request.query_params), request.accepted_media_type,
+        ))
+        return 'response:' + hashlib.sha256(key.encode()).hexdigest()
+
+    def list(self, request, *args, **kwargs):
+        self.response_cache_key = self.get_response_cache_key(request)
+        if self.response_cache_key is None:
+            return super().list(request, *args, **kwargs)
+
+        if 'no-cache' not in request.headers.get('Cache-Control', ''):
+            cached = caches[settings.RESPONSE_CACHE].get(self.response_cache_key)
+            response_cache_stats.record(hit=cached is not None)
+            if cached is not None:
+                self.response_cache_key = None
+                content_type, content = cached
+                response = HttpResponse(content, content_type=content_type)
+                response['X-Cache'] = 'HIT'
+                return response
+        response = super().list(request, *args, **kwargs)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key = getattr(self, 'response_cache_key', None)
+        # Streamed responses are too big to be worth keeping
+        if key is not None and isinstance(response, Response) and response.status_code == 200 and \
+                not getattr(self, 'replica_reads', False):
+            response.render()
+            caches[settings.RESPONSE_CACHE].set(
+                key, (response['Content-Type'], response.content), settings.RESPONSE_CACHE_TTL
+            )
+        return response
@@ -0,0 +1,97 @@
+import hashlib
+
+from django.db.models import F
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import quote_etag
+
+from .models import UserDataVersion
+
+
+def bump_data_version(user_id):
+    """Mark the recipes, tags and ingredients of a user as changed"""
+    if user_id is not None:
+        UserDataVersion.objects.filter(user_id=user_id).update(version=F('version') + 1, modified=timezone.now())
+
+
+def get_data_version(user_id):
+    """
+    Return the version and last modification time of the data of a user.
+    The row is created with the user, see recipe.signals. None is returned for a user without one, e.g. inserted with
+    bulk_create, whose responses then get no validators and aren't cached.
+    """
+    return UserDataVersion.objects.filter(user_id=user_id).values_list('version', 'modified').first()
+
+
+class NotModified(Exception):
+    """Raised to stop handling a request whose response the client already has"""
+
+    def __init__(self, response):
+        super().__init__()
+        self.response = response
+
+
+class DataVersionMixin:
+    """
+    Read the user's data version once per request, into data_version, for the mixins deciding on it.
+    It is read for the GET and HEAD requests of the actions returned by data_version_actions, which the mixins extend.
+    """
+
+    def data_version_actions(self):
+        return ()
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.data_version = None
+        if request.method in ('GET', 'HEAD') and self.action in self.data_version_actions():
+            self.data_version = get_data_version(request.user.pk)
+
+
+class ConditionalRequestMixin(DataVersionMixin):
+    """
+    Answer GET and HEAD requests of conditional_actions with an ETag validator.
+    The ETag is derived from the user's data version, the scheme, host and URL and the negotiated media type, so when
+    a client sends it back and it still matches, a 304 is returned before the queryset and the serializer run.
+    There is no Last-Modified: with its one second resolution, a write in the second of a read would be answered
+    with a 304 of the stale response.
+    Responses read from a replica (see recipe.replicas) get no ETag, their body may be older than the version.
+    """
+    conditional_actions = ('list', 'retrieve')
+
+    def data_version_actions(self):
+        return (*super().data_version_actions(), *self.conditional_actions)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.validators = None
+        if self.data_version is None or self.action not in self.conditional_actions:
+            return
+
+        version, _ = self.data_version
+        # The absolute links of the responses differ by scheme and host
+        key = (
+            f'{request.user.pk}:{version}:{request.scheme}:{request.get_host()}:{request.get_full_path()}:'
+            f'{request.accepted_media_type}'
+        )
+        etag = quote_etag(hashlib.md5(key.encode()).hexdigest())
+
+        # The client's copy was read from the primary, so it is still current when the version matches
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            self.validators = etag
+            raise NotModified(response)
+        if not getattr(self, 'replica_reads', False):
+            self.validators = etag
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if getattr(self, 'validators', None) and response.status_code in (200, 304):
+            response['ETag'] = self.validators
+            # The same URL returns different data for every user
+            patch_vary_headers(response, ('Authorization',))
+        return response
@@ -0,0 +1,41 @@
+from collections import defaultdict
+
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_recipes(model):
+    """Return a subquery counting the recipes linked to the outer tag or ingredient"""
+    relation = model._meta.get_field('recipes')
+    column = f'{relation.field.m2m_reverse_field_name()}_id'
+    counts = relation.through.objects.filter(**{column: OuterRef('pk')})\
+                                     .order_by()\
+                                     .values(column)\
+                                     .annotate(total=Count('pk'))\
+                                     .values('total')
+    return Coalesce(Subquery(counts), 0)
+
+
+def adjust_recipe_counts(model, deltas):
+    """
+    Add deltas, a mapping of tag or ingredient ids to the number of recipes linked (or unlinked when negative), to
+    their recipe_count. The UPDATE ... SET recipe_count = recipe_count + delta runs on the locked row, so concurrent
+    link changes add up, and costs the same however many recipes the tag has. One UPDATE is sent per distinct delta.
+    """
+    ids_by_delta = defaultdict(list)
+    for pk, delta in deltas.items():
+        if delta:
+            ids_by_delta[delta].append(pk)
+    for delta, ids in ids_by_delta.items():
+        model.objects.filter(pk__in=ids).update(recipe_count=F('recipe_count') + delta)
+
+
+def refresh_recipe_counts(model, ids=None):
+    """
+    Recount the recipes of the given tags or ingredients (all of them if ids is None) with a single
+    UPDATE ... SET recipe_count = (SELECT COUNT(*) FROM through WHERE through.tag_id = tag.id).
+    It reads every link of the rows, only use it where the changed links aren't known: clear(), deletes cascading to
+    the links and repairs. Link changes whose ids are known go through adjust_recipe_counts.
+    """
+    queryset = model.objects.all() if ids is None else model.objects.filter(pk__in=ids)
+    return queryset.update(recipe_count=count_recipes(model))
@@ -0,0 +1,70 @@
+from django.db import transaction
+from django.db.models import Count, Min, Q
+
+from .conditional import bump_data_version
+from .counters import refresh_recipe_counts
+from .search import refresh_search_vectors
+
+
+def merge_objects(model, recipe_model, merges):
+    """
+    Merge tags or ingredients into others. merges maps the id of every object to remove to the id of the one to keep.
+    The recipes linked to a removed object are linked to the kept one instead, then the recipe counts, the search
+    vectors and the data versions of the owners are refreshed.
+    """
+    if not merges:
+        return
+    relation = model._meta.get_field('recipes')
+    through = relation.through
+    recipe_column = f'{relation.field.m2m_field_name()}_id'
+    column = f'{relation.field.m2m_reverse_field_name()}_id'
+    kept_ids = set(merges.values())
+
+    links = through.objects.filter(**{f'{column}__in': kept_ids | set(merges)}).values_list(recipe_column, column)
+    linked = set()
+    moved = set()
+    for recipe_id, obj_id in links:
+        if obj_id in merges:
+            moved.add((recipe_id, merges[obj_id]))
+        else:
+            linked.add((recipe_id, obj_id))
+    # A recipe already linked to the kept object, or to several of the removed ones, keeps a single link
+    moved -= linked
+
+    user_ids = set(model.objects.filter(pk__in=kept_ids).values_list('user_id', flat=True))
+    through.objects.filter(**{f'{column}__in': merges}).delete()
+    through.objects.bulk_create([through(**{recipe_column: recipe_id, column: obj_id}) for recipe_id, obj_id in moved])
+    model.objects.filter(pk__in=merges).delete()
+    refresh_recipe_counts(model, kept_ids)
+    refresh_search_vectors(recipe_model.objects.filter(pk__in={recipe_id for recipe_id, _ in moved}))
+    for user_id in user_ids:
+        bump_data_version(user_id)
+
+
+def merge_duplicate_names(model, recipe_model, batch_size=1000):
+    """
+    Merge up to batch_size groups of a user's tags or ingredients sharing a normalized name into their oldest object.
+    Every batch is its own transaction, so merging can be interrupted and resumed: merged groups are not found again.
+    Returns the number of removed objects, 0 once there are no duplicates left.
+    """
+    groups = list(
+        model.objects.filter(user__isnull=False)
+                     .values('user_id', 'normalized_name')
+                     .annotate(total=Count('pk'), kept_id=Min('pk'))
+                     .filter(total__gt=1)
+                     .order_by('user_id', 'normalized_name')[:batch_size]
+    )
+    if not groups:
+        return 0
+    members = Q()
+    kept_ids = {}
+    for group in groups:
+        members |= Q(user_id=group['user_id'], normalized_name=group['normalized_name'])
+        kept_ids[group['user_id'], group['normalized_name']] = group['kept_id']
+    merges = {}
+    for pk, user_id, name in model.objects.filter(members).values_list('pk', 'user_id', 'normalized_name'):
+        if pk != kept_ids[user_id, name]:
+            merges[pk] = kept_ids[user_id, name]
+    with transaction.atomic():
+        merge_objects(model, recipe_model, merges)
+    return len(merges)
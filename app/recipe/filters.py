@@ -0,0 +1,45 @@
+from django.db.models import Count, Exists, OuterRef
+
+MATCH_ANY = 'any'
+MATCH_ALL = 'all'
+MATCH_CHOICES = (MATCH_ANY, MATCH_ALL)
+
+
+def filter_by_related_ids(queryset, field_name, ids, match=MATCH_ANY):
+    """
+    Filter a queryset on the ids of one of its many to many fields.
+    Both modes only touch the through table so the outer query never joins, which means no duplicate rows and
+    no DISTINCT:
+    - any: WHERE EXISTS (SELECT 1 FROM through WHERE through.recipe_id = recipe.id AND through.tag_id IN (...))
+    - all: WHERE recipe.id IN (SELECT recipe_id FROM through WHERE tag_id IN (...) GROUP BY recipe_id
+           HAVING COUNT(*) = <number of ids>)
+    The (tag_id, recipe_id) indexes on the through tables let both be answered from the index alone.
+    """
+    field = queryset.model._meta.get_field(field_name)
+    through = field.remote_field.through
+    source_column = f'{field.m2m_field_name()}_id'
+    target_column = f'{field.m2m_reverse_field_name()}_id'
+    ids = set(ids)
+    links = through.objects.filter(**{f'{target_column}__in': ids})
+
+    if match == MATCH_ALL:
+        # The through table is unique on (recipe_id, tag_id), so counting rows counts distinct matched ids
+        matching = links.values(source_column)\
+                        .annotate(matched=Count('pk'))\
+                        .filter(matched=len(ids))\
+                        .values(source_column)
+        return queryset.filter(pk__in=matching)
+
+    return queryset.filter(Exists(links.filter(**{source_column: OuterRef('pk')})))
+
+
+def filter_assigned(queryset, related_name='recipes'):
+    """
+    Keep the objects of a queryset that are assigned to at least one recipe.
+    This is a semi join: WHERE EXISTS (SELECT 1 FROM through WHERE through.tag_id = tag.id), which stops at the
+    first link of every object instead of joining all of them and removing the duplicates with DISTINCT.
+    """
+    relation = queryset.model._meta.get_field(related_name)
+    column = f'{relation.field.m2m_reverse_field_name()}_id'
+    links = relation.through.objects.filter(**{column: OuterRef('pk')})
+    return queryset.filter(Exists(links))
@@ -0,0 +1,137 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import Recipe, IMAGE_PENDING, IMAGE_PROCESSING, IMAGE_READY, IMAGE_FAILED
+
+logger = logging.getLogger(__name__)
+
+# Bounding box of every variant, images are never upscaled
+VARIANT_SIZES = {
+    'thumbnail': (150, 150),
+    'medium': (600, 600),
+    'full': (2048, 2048),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def variant_path(image_name, variant):
+    """Return the storage path of a variant, next to the original image"""
+    root, _ = os.path.splitext(image_name)
+    return f'{root}_{variant}.jpg'
+
+
+def render_variants(image_file):
+    """
+    Return {variant: JPEG bytes} for an image file.
+    The image is rotated according to its EXIF orientation and re-encoded without any metadata. The upload itself
+    keeps the camera details and GPS position, process_recipe_image replaces it with the full variant.
+    """
+    with Image.open(image_file) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        variants = {}
+        for variant, size in VARIANT_SIZES.items():
+            resized = image.copy()
+            resized.thumbnail(size, Image.LANCZOS)
+            output = io.BytesIO()
+            resized.save(output, format='JPEG', quality=85, optimize=True, progressive=True)
+            variants[variant] = output.getvalue()
+        return variants
+
+
+def process_recipe_image(recipe_id):
+    """
+    Generate the variants of the current image of a recipe.
+    The full variant then becomes the image of the recipe and the upload is deleted, with its metadata.
+    """
+    recipe = Recipe.objects.filter(pk=recipe_id).first()
+    if recipe is None or not recipe.image:
+        return
+    image_name = recipe.image.name
+    # Only act on the upload this task was started for, a newer upload has its own task
+    current = Recipe.objects.filter(pk=recipe_id, image=image_name)
+    current.update(image_status=IMAGE_PROCESSING, image_status_changed=timezone.now())
+    try:
+        with recipe.image.open('rb') as image_file:
+            rendered = render_variants(image_file)
+        variants = {
+            variant: default_storage.save(variant_path(image_name, variant), ContentFile(content))
+            for variant, content in rendered.items()
+        }
+    except Exception:
+        logger.exception('Processing the image of recipe %s failed', recipe_id)
+        current.update(image_status=IMAGE_FAILED, image_status_changed=timezone.now())
+        return
+
+    if not current.update(
+        image=variants['full'], image_status=IMAGE_READY, image_status_changed=timezone.now(), image_variants=variants,
+    ):
+        # A newer upload replaced the image while this one was processed
+        for name in variants.values():
+            default_storage.delete(name)
+        return
+    default_storage.delete(image_name)
+
+
+def _run(recipe_id):
+    """
+    Run a task of the worker pool with its own database connection.
+    Nobody waits for the futures of the pool, so the errors raised outside of the processing are logged here.
+    """
+    try:
+        process_recipe_image(recipe_id)
+    except Exception:
+        logger.exception('Processing the image of recipe %s failed', recipe_id)
+    finally:
+        close_old_connections()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.RECIPE_IMAGE_WORKERS,
+                thread_name_prefix='recipe-image'
+            )
+        return _executor
+
+
+def enqueue_recipe_image(recipe):
+    """
+    Mark the image of a recipe as pending and process it once the transaction commits.
+    With RECIPE_IMAGE_WORKERS = 0 the image is processed in the calling thread. The pending status in the database
+    is the source of truth: images left pending or processing by a restarted worker are picked up by
+    process_recipe_images once they are older than RECIPE_IMAGE_STALE_AFTER.
+    """
+    stale = list(recipe.image_variants.values())
+    changed = timezone.now()
+    Recipe.objects.filter(pk=recipe.pk).update(
+        image_status=IMAGE_PENDING, image_status_changed=changed, image_variants={},
+    )
+    recipe.image_status = IMAGE_PENDING
+    recipe.image_status_changed = changed
+    recipe.image_variants = {}
+
+    def start():
+        for name in stale:
+            default_storage.delete(name)
+        if settings.RECIPE_IMAGE_WORKERS:
+            get_executor().submit(_run, recipe.pk)
+        else:
+            process_recipe_image(recipe.pk)
+
+    transaction.on_commit(start)
@@ -0,0 +1,49 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from recipe.filters import filter_assigned
+from recipe.models import Tag, Ingredient
+
+
+class Command(BaseCommand):
+    """
+    Django command to compare the old JOIN + DISTINCT assigned_only query with the EXISTS semi join.
+    It prints the query plan and the mean time of both for one user, e.g:
+    python manage.py bench_assigned_only --email test@test.com --model ingredient
+    """
+    help = 'Compare the query plan and timing of the assigned_only tag/ingredient queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email', required=True, help='Owner of the tags or ingredients')
+        parser.add_argument('--model', choices=('tag', 'ingredient'), default='tag')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--page-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(email=options['email'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'User {options["email"]} does not exist')
+
+        model = Tag if options['model'] == 'tag' else Ingredient
+        owned = model.objects.filter(user=user)
+        queries = {
+            'join + distinct': owned.filter(recipes__isnull=False).distinct(),
+            'exists': filter_assigned(owned),
+        }
+        # PostgreSQL is the only backend the project runs on that can EXPLAIN ANALYZE
+        explain_options = {'analyze': True} if connection.vendor == 'postgresql' else {}
+
+        for name, queryset in queries.items():
+            queryset = queryset.order_by('-name', 'id')[:options['page_size']]
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(queryset.explain(**explain_options))
+
+            started = time.perf_counter()
+            for _ in range(options['repeat']):
+                list(queryset.values_list('id', flat=True))
+            elapsed = (time.perf_counter() - started) / options['repeat']
+            self.stdout.write(self.style.SUCCESS(f'{name}: {elapsed * 1000:.2f} ms per query'))
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipe.models import Recipe
+from recipe.search import search_recipes, supports_full_text_search
+
+
+class Command(BaseCommand):
+    """
+    Django command to compare the full text search of recipes with a naive LIKE scan over the same rows.
+    Run it against a PostgreSQL database seeded with enough recipes, e.g:
+    python manage.py bench_recipe_search --text "chicken curry"
+    """
+    help = 'Compare the query plan and timing of the recipe full text search with icontains scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--text', default='chicken curry')
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--limit', type=int, default=100)
+
+    def handle(self, *args, **options):
+        if not supports_full_text_search(Recipe):
+            raise CommandError('Full text search needs PostgreSQL')
+
+        recipes = Recipe.objects.only('id')
+        like = recipes
+        for word in options['text'].split():
+            like = like.filter(title__icontains=word) | like.filter(tags__name__icontains=word)\
+                | like.filter(ingredients__name__icontains=word)
+        queries = {
+            'LIKE scan': like.distinct().order_by('-id'),
+            'full text': search_recipes(recipes, options['text']).order_by('-rank', '-id'),
+        }
+
+        self.stdout.write(f'{Recipe.objects.count()} recipes')
+        for name, queryset in queries.items():
+            queryset = queryset[:options['limit']]
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(queryset.explain(analyze=True))
+
+            started = time.perf_counter()
+            for _ in range(options['repeat']):
+                list(queryset.values_list('id', flat=True))
+            elapsed = (time.perf_counter() - started) / options['repeat']
+            self.stdout.write(self.style.SUCCESS(f'{name}: {elapsed * 1000:.2f} ms per query'))
@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Prefetch
+
+from core.renderers import FastJSONRenderer
+from recipe.models import Recipe, Tag, Ingredient
+from recipe.serializers import RecipeSerializer, RecipeRowSerializer
+
+
+class Command(BaseCommand):
+    """
+    Django command to compare rendering a page of recipes with RecipeSerializer and with RecipeRowSerializer.
+    Both read the same page with the queries of the list endpoint and are checked to render the same bytes, e.g:
+    python manage.py bench_recipe_serializers --limit 1000
+    """
+    help = 'Compare the time to query, serialize and render a page of recipes with the model and the row serializer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--limit', type=int, default=100)
+
+    def handle(self, *args, **options):
+        limit = options['limit']
+        renderer = FastJSONRenderer()
+
+        def model_serializer():
+            recipes = Recipe.objects.defer('search_vector').order_by('-id').prefetch_related(
+                Prefetch('tags', queryset=Tag.objects.only('id').order_by('id')),
+                Prefetch('ingredients', queryset=Ingredient.objects.only('id').order_by('id')),
+            )[:limit]
+            return renderer.render(RecipeSerializer(recipes, many=True).data)
+
+        def row_serializer():
+            rows = list(Recipe.objects.order_by('-id').values(*RecipeRowSerializer.get_columns())[:limit])
+            return renderer.render(RecipeRowSerializer(rows, many=True).data)
+
+        if model_serializer() != row_serializer():
+            raise CommandError('The serializers render different pages')
+
+        self.stdout.write(f'{min(Recipe.objects.count(), limit)} recipes per page')
+        timings = {}
+        for name, render in (('RecipeSerializer', model_serializer), ('RecipeRowSerializer', row_serializer)):
+            started = time.perf_counter()
+            for _ in range(options['repeat']):
+                render()
+            timings[name] = (time.perf_counter() - started) / options['repeat']
+            self.stdout.write(self.style.SUCCESS(f'{name}: {timings[name] * 1000:.2f} ms per page'))
+        speedup = timings['RecipeSerializer'] / timings['RecipeRowSerializer']
+        self.stdout.write(self.style.SUCCESS(f'Speedup: {speedup:.1f}x'))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from recipe.duplicates import merge_duplicate_names
+from recipe.models import Tag, Ingredient, Recipe
+from recipe.names import fill_normalized_names
+
+
+class Command(BaseCommand):
+    """Django command to merge the tags and ingredients of a user that only differ by case or whitespace"""
+    help = 'Merge duplicate tag and ingredient names in batches, can be interrupted and run again to resume'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for model in (Tag, Ingredient):
+            filled = fill_normalized_names(model, batch_size)
+            if filled:
+                self.stdout.write(f'Normalized {filled} {model._meta.verbose_name_plural}')
+            merged = 0
+            while True:
+                # Every batch commits, so an interrupted run only redoes the batch it was in
+                removed = merge_duplicate_names(model, Recipe, batch_size)
+                if not removed:
+                    break
+                merged += removed
+                self.stdout.write(f'Merged {merged} duplicate {model._meta.verbose_name_plural}')
+            self.stdout.write(self.style.SUCCESS(f'Merged {merged} duplicate {model._meta.verbose_name_plural}'))
@@ -0,0 +1,39 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from recipe.images import process_recipe_image
+from recipe.models import Recipe, IMAGE_PENDING, IMAGE_PROCESSING, IMAGE_FAILED
+
+
+class Command(BaseCommand):
+    """
+    Django command to generate the image variants the background workers didn't finish.
+    Pending and processing images are only picked up once their status is older than --stale-after seconds, younger
+    ones may still be in the queue or the hands of a live worker.
+    """
+    help = 'Process recipe images that are stuck pending or processing or (with --retry-failed) failed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retry-failed', action='store_true')
+        parser.add_argument(
+            '--stale-after', type=int, default=settings.RECIPE_IMAGE_STALE_AFTER,
+            help='seconds after which a pending or processing image is considered abandoned',
+        )
+
+    def handle(self, *args, **options):
+        stale_before = timezone.now() - timedelta(seconds=options['stale_after'])
+        # Images enqueued before their status had a timestamp are stale too
+        stale = Q(image_status_changed__lt=stale_before) | Q(image_status_changed__isnull=True)
+        condition = Q(image_status__in=(IMAGE_PENDING, IMAGE_PROCESSING)) & stale
+        if options['retry_failed']:
+            condition |= Q(image_status=IMAGE_FAILED)
+        recipe_ids = Recipe.objects.filter(condition).values_list('pk', flat=True)
+        count = 0
+        for recipe_id in recipe_ids.iterator():
+            process_recipe_image(recipe_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'Processed {count} recipe images'))
@@ -0,0 +1,27 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipe.models import RecipeImageUpload
+
+
+class Command(BaseCommand):
+    """
+    Django command to delete the chunked uploads of recipe images abandoned by their clients, with their file.
+    Run it periodically, uploads are only removed on their own once complete or with their recipe.
+    """
+    help = 'Delete the chunked image uploads started more than --older-than seconds ago and their files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than', type=int, default=settings.RECIPE_IMAGE_UPLOAD_EXPIRY,
+            help='seconds after its first chunk an upload is considered abandoned',
+        )
+
+    def handle(self, *args, **options):
+        created_before = timezone.now() - timedelta(seconds=options['older_than'])
+        # Deleted one by one, so the files are removed by the post_delete handler
+        deleted, _ = RecipeImageUpload.objects.filter(created__lt=created_before).delete()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} abandoned image uploads'))
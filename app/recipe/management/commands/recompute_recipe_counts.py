@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from recipe.conditional import bump_data_version
+from recipe.counters import count_recipes, refresh_recipe_counts
+from recipe.models import Tag, Ingredient
+
+
+class Command(BaseCommand):
+    """
+    Django command to recompute the recipe_count of every tag and ingredient.
+    Only the drifted counters are written, and the data version of their owners bumped so their cached responses and
+    ETags stop serving the old counts.
+    """
+    help = 'Recompute the denormalized recipe_count of tags and ingredients in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        user_ids = set()
+        for model in (Tag, Ingredient):
+            updated = 0
+            last_id = 0
+            while True:
+                # Walk the primary key so every batch is a short UPDATE instead of one long table lock
+                ids = list(
+                    model.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size]
+                )
+                if not ids:
+                    break
+                drifted = list(model.objects.filter(pk__in=ids)
+                                            .annotate(actual=count_recipes(model))
+                                            .exclude(recipe_count=F('actual'))
+                                            .values_list('pk', 'user_id'))
+                if drifted:
+                    updated += refresh_recipe_counts(model, [pk for pk, _ in drifted])
+                    user_ids.update(user_id for _, user_id in drifted)
+                last_id = ids[-1]
+            self.stdout.write(self.style.SUCCESS(f'Recomputed {updated} {model._meta.verbose_name_plural}'))
+        for user_id in user_ids:
+            bump_data_version(user_id)
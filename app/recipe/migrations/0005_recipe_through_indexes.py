@@ -0,0 +1,25 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Index the recipe many to many tables on (attribute, recipe).
+    The tables already have a unique index on (recipe_id, attribute_id), the reversed order lets the tag and
+    ingredient filters of the recipe list find and group the matching recipes using only the index.
+    """
+
+    dependencies = [
+        ('recipe', '0004_recipe_image'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX recipe_recipe_tags_tag_id_recipe_id_idx ON recipe_recipe_tags (tag_id, recipe_id)',
+            reverse_sql='DROP INDEX recipe_recipe_tags_tag_id_recipe_id_idx',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX recipe_recipe_ingredients_ingredient_id_recipe_id_idx '
+            'ON recipe_recipe_ingredients (ingredient_id, recipe_id)',
+            reverse_sql='DROP INDEX recipe_recipe_ingredients_ingredient_id_recipe_id_idx',
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 3.2.25 on 2026-10-18 17:44
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_existing_recipes(apps, schema_editor):
+    """Fill recipe_count for the tags and ingredients that already exist"""
+    db_alias = schema_editor.connection.alias
+    recipe_model = apps.get_model('recipe', 'Recipe')
+    for field_name, column in (('tags', 'tag_id'), ('ingredients', 'ingredient_id')):
+        field = recipe_model._meta.get_field(field_name)
+        counts = field.remote_field.through.objects.using(db_alias)\
+                                                   .filter(**{column: OuterRef('pk')})\
+                                                   .order_by()\
+                                                   .values(column)\
+                                                   .annotate(total=Count('pk'))\
+                                                   .values('total')
+        field.related_model.objects.using(db_alias).update(recipe_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0006_user_name_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['user', '-recipe_count', 'id'], name='recipe_ingr_user_id_701480_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', '-recipe_count', 'id'], name='recipe_tag_user_id_06d9e7_idx'),
+        ),
+        migrations.RunPython(count_existing_recipes, migrations.RunPython.noop),
+    ]
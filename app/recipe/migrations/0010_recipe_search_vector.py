@@ -0,0 +1,56 @@
+# Generated by Django 3.2.25 on 2026-10-18 17:56
+
+from django.contrib.postgres.aggregates import StringAgg
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+import recipe.operations
+
+
+def fill_search_vectors(apps, schema_editor):
+    """Index the recipes that already exist, search vectors are only maintained on PostgreSQL"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    db_alias = schema_editor.connection.alias
+    recipe_model = apps.get_model('recipe', 'Recipe')
+
+    def names(field_name, target):
+        through = recipe_model._meta.get_field(field_name).remote_field.through
+        return Coalesce(Subquery(
+            through.objects.using(db_alias)
+                           .filter(recipe_id=OuterRef('pk'))
+                           .order_by()
+                           .values('recipe_id')
+                           .annotate(names=StringAgg(f'{target}__name', ' '))
+                           .values('names')
+        ), Value(''))
+
+    recipe_model.objects.using(db_alias).update(search_vector=(
+        SearchVector('title', weight='A')
+        + SearchVector(names('tags', 'tag'), weight='B')
+        + SearchVector(names('ingredients', 'ingredient'), weight='C')
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0009_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        recipe.operations.AddPostgresIndex(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='recipe_reci_search__f79904_gin'),
+        ),
+        migrations.RunPython(fill_search_vectors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.25 on 2026-10-18 17:58
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import BtreeGinExtension, TrigramExtension
+from django.db import migrations
+
+import recipe.operations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0010_recipe_search_vector'),
+    ]
+
+    operations = [
+        # Both extensions are only created on PostgreSQL
+        BtreeGinExtension(),
+        TrigramExtension(),
+        recipe.operations.AddPostgresIndex(
+            model_name='ingredient',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['user', 'name'], name='recipe_ingredient_name_trgm', opclasses=['int8_ops', 'gin_trgm_ops']),
+        ),
+        recipe.operations.AddPostgresIndex(
+            model_name='tag',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['user', 'name'], name='recipe_tag_name_trgm', opclasses=['int8_ops', 'gin_trgm_ops']),
+        ),
+    ]
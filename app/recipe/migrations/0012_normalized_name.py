@@ -0,0 +1,50 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:31
+
+import unicodedata
+
+from django.db import migrations, models
+
+
+def normalize_existing_names(apps, schema_editor, batch_size=1000):
+    """Fill normalized_name for the tags and ingredients that already exist, batch by batch"""
+    db_alias = schema_editor.connection.alias
+    for model_name in ('Tag', 'Ingredient'):
+        model = apps.get_model('recipe', model_name)
+        last_id = 0
+        while True:
+            objs = list(
+                model.objects.using(db_alias)
+                             .filter(pk__gt=last_id)
+                             .order_by('pk')
+                             .only('pk', 'name')[:batch_size]
+            )
+            if not objs:
+                break
+            for obj in objs:
+                # The normalization of recipe.names at the time, cut to fit the column
+                obj.normalized_name = unicodedata.normalize('NFKC', ' '.join(obj.name.split())).casefold()[:255]
+            model.objects.using(db_alias).bulk_update(objs, ['normalized_name'])
+            last_id = objs[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0011_name_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='normalized_name',
+            field=models.CharField(default='', editable=False, max_length=255),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='normalized_name',
+            field=models.CharField(default='', editable=False, max_length=255),
+            preserve_default=False,
+        ),
+        migrations.RunPython(normalize_existing_names, migrations.RunPython.noop),
+    ]
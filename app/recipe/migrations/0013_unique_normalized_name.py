@@ -0,0 +1,121 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:31
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models, transaction
+from django.db.models import Count, F, Min, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+def merge_objects(apps, schema_editor, field_name, column, merges):
+    """
+    Link the recipes of the tags or ingredients of merges (removed id -> kept id) to the kept ones, then refresh the
+    recipe counts, the search vectors and the data versions of the owners.
+    """
+    db_alias = schema_editor.connection.alias
+    recipe_model = apps.get_model('recipe', 'Recipe')
+    field = recipe_model._meta.get_field(field_name)
+    model = field.related_model
+    through = field.remote_field.through.objects.using(db_alias)
+    kept_ids = set(merges.values())
+
+    linked = set()
+    moved = set()
+    for recipe_id, obj_id in through.filter(**{f'{column}__in': kept_ids | set(merges)}).values_list('recipe_id', column):
+        if obj_id in merges:
+            moved.add((recipe_id, merges[obj_id]))
+        else:
+            linked.add((recipe_id, obj_id))
+    # A recipe already linked to the kept object, or to several of the removed ones, keeps a single link
+    moved -= linked
+
+    user_ids = set(model.objects.using(db_alias).filter(pk__in=kept_ids).values_list('user_id', flat=True))
+    through.filter(**{f'{column}__in': merges}).delete()
+    through.bulk_create([through.model(**{'recipe_id': recipe_id, column: obj_id}) for recipe_id, obj_id in moved])
+    model.objects.using(db_alias).filter(pk__in=merges).delete()
+
+    counts = through.filter(**{column: OuterRef('pk')}).order_by().values(column).annotate(total=Count('pk'))
+    model.objects.using(db_alias).filter(pk__in=kept_ids)\
+                                 .update(recipe_count=Coalesce(Subquery(counts.values('total')), 0))
+    if schema_editor.connection.vendor == 'postgresql':
+        recipe_model.objects.using(db_alias)\
+                            .filter(pk__in={recipe_id for recipe_id, _ in moved})\
+                            .update(search_vector=search_vector(apps, db_alias))
+    apps.get_model('recipe', 'UserDataVersion').objects.using(db_alias)\
+                                               .filter(user_id__in=user_ids)\
+                                               .update(version=F('version') + 1, modified=timezone.now())
+
+
+def search_vector(apps, db_alias):
+    """The search vector of a recipe as recipe.search computed it at the time"""
+    recipe_model = apps.get_model('recipe', 'Recipe')
+
+    def names(field_name, target):
+        through = recipe_model._meta.get_field(field_name).remote_field.through
+        return Coalesce(Subquery(
+            through.objects.using(db_alias)
+                           .filter(recipe_id=OuterRef('pk'))
+                           .order_by()
+                           .values('recipe_id')
+                           .annotate(names=StringAgg(f'{target}__name', ' '))
+                           .values('names')
+        ), Value(''))
+
+    return (
+        SearchVector('title', weight='A')
+        + SearchVector(names('tags', 'tag'), weight='B')
+        + SearchVector(names('ingredients', 'ingredient'), weight='C')
+    )
+
+
+def merge_existing_duplicates(apps, schema_editor, batch_size=1000):
+    """
+    Merge the duplicates left before the unique constraints are added, every group of a user's tags or ingredients
+    sharing a normalized name into its oldest object. Every batch of groups commits on its own.
+    On large tables run the merge_duplicate_names command after 0012 first, so this finds nothing to do.
+    """
+    db_alias = schema_editor.connection.alias
+    for field_name, column, model_name in (('tags', 'tag_id', 'Tag'), ('ingredients', 'ingredient_id', 'Ingredient')):
+        model = apps.get_model('recipe', model_name)
+        while True:
+            groups = list(
+                model.objects.using(db_alias)
+                             .filter(user__isnull=False)
+                             .values('user_id', 'normalized_name')
+                             .annotate(total=Count('pk'), kept_id=Min('pk'))
+                             .filter(total__gt=1)
+                             .order_by('user_id', 'normalized_name')[:batch_size]
+            )
+            if not groups:
+                break
+            members = Q()
+            kept_ids = {}
+            for group in groups:
+                members |= Q(user_id=group['user_id'], normalized_name=group['normalized_name'])
+                kept_ids[group['user_id'], group['normalized_name']] = group['kept_id']
+            objs = model.objects.using(db_alias).filter(members).values_list('pk', 'user_id', 'normalized_name')
+            merges = {pk: kept_ids[user_id, name] for pk, user_id, name in objs if pk != kept_ids[user_id, name]}
+            with transaction.atomic(using=db_alias):
+                merge_objects(apps, schema_editor, field_name, column, merges)
+
+
+class Migration(migrations.Migration):
+    # Every batch of merges commits on its own, and PostgreSQL can't alter a table with pending deferred triggers
+    atomic = False
+
+    dependencies = [
+        ('recipe', '0012_normalized_name'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_existing_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('user', 'normalized_name'), name='recipe_ingredient_unique_name'),
+        ),
+        migrations.AddConstraint(
+            model_name='tag',
+            constraint=models.UniqueConstraint(fields=('user', 'normalized_name'), name='recipe_tag_unique_name'),
+        ),
+    ]
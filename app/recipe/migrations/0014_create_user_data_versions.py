@@ -0,0 +1,24 @@
+# Generated by Django 3.2.25 on 2026-10-18 21:05
+
+from django.conf import settings
+from django.db import migrations
+
+
+def create_data_versions(apps, schema_editor):
+    """Create the data version of the users who have none, new users get theirs from recipe.signals"""
+    user_model = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    data_version_model = apps.get_model('recipe', 'UserDataVersion')
+    user_ids = user_model.objects.filter(recipe_data_version__isnull=True).values_list('pk', flat=True)
+    data_version_model.objects.bulk_create([data_version_model(user_id=user_id) for user_id in user_ids], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipe', '0013_unique_normalized_name'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_data_versions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0014_create_user_data_versions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_status_changed',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0015_recipe_image_status_changed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeImageUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('total', models.PositiveIntegerField()),
+                ('received', models.PositiveIntegerField(default=0)),
+                ('parts', models.JSONField(default=list)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='image_uploads', to='recipe.recipe')),
+            ],
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:53
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.expressions
+import django.db.models.functions.text
+
+import recipe.operations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0016_recipe_image_upload'),
+    ]
+
+    operations = [
+        # Operator classes only exist in PostgreSQL
+        recipe.operations.AddPostgresIndex(
+            model_name='ingredient',
+            index=models.Index(django.db.models.expressions.F('user'), django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('name'), name='text_pattern_ops'), name='recipe_ingredient_upper_name'),
+        ),
+        recipe.operations.AddPostgresIndex(
+            model_name='tag',
+            index=models.Index(django.db.models.expressions.F('user'), django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('name'), name='text_pattern_ops'), name='recipe_tag_upper_name'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:55
+
+from django.db import migrations, models
+import recipe.names
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0017_autocomplete_prefix_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ingredient',
+            name='name',
+            field=models.CharField(max_length=255, validators=[recipe.names.validate_normalized_length]),
+        ),
+        migrations.AlterField(
+            model_name='tag',
+            name='name',
+            field=models.CharField(max_length=255, validators=[recipe.names.validate_normalized_length]),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:20
+
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+
+def delete_chunked_uploads(apps, schema_editor):
+    """Uploads stored as separate parts can't be resumed by appending to a file, their clients start over"""
+    RecipeImageUpload = apps.get_model('recipe', 'RecipeImageUpload')
+    uploads = RecipeImageUpload.objects.using(schema_editor.connection.alias)
+    for parts in uploads.values_list('parts', flat=True):
+        for name in parts:
+            default_storage.delete(name)
+    uploads.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0018_name_normalized_length'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_chunked_uploads, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='recipeimageupload',
+            name='parts',
+        ),
+        migrations.AddField(
+            model_name='recipeimageupload',
+            name='name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
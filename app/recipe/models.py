@@ -1,8 +1,15 @@
 import uuid
 import os
 
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Upper
 from django.conf import settings
+from django.utils import timezone
+
+from .names import NAME_MAX_LENGTH, normalize_name, validate_normalized_length
 
 
 def recipe_image_file_path(instance, filename):
@@ -13,30 +20,108 @@ def recipe_image_file_path(instance, filename):
     return os.path.join('uploads', 'recipe', new_filename)
 
 
+IMAGE_PENDING = 'pending'
+IMAGE_PROCESSING = 'processing'
+IMAGE_READY = 'ready'
+IMAGE_FAILED = 'failed'
+IMAGE_STATUS_CHOICES = (
+    (IMAGE_PENDING, 'Pending'),
+    (IMAGE_PROCESSING, 'Processing'),
+    (IMAGE_READY, 'Ready'),
+    (IMAGE_FAILED, 'Failed'),
+)
+
+
 class Tag(models.Model):
     """Tag to be used for a recipe"""
-    name = models.CharField(max_length=255)
+    name = models.CharField(max_length=NAME_MAX_LENGTH, validators=[validate_normalized_length])
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         null=True,
         on_delete=models.SET_NULL
     )
 
+    # Case and whitespace insensitive form of name, see recipe.names.normalize_name
+    normalized_name = models.CharField(max_length=NAME_MAX_LENGTH, editable=False)
+    # Number of recipes using this object, maintained by the signal handlers in recipe.signals
+    recipe_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Serves the per-user listing, which is ordered by name
+            models.Index(fields=['user', 'name']),
+            # Serves ?ordering=-recipe_count without aggregating the recipes
+            models.Index(fields=['user', '-recipe_count', 'id']),
+            # Serves ?q= of the autocomplete of one user, needs the btree_gin and pg_trgm extensions
+            GinIndex(
+                fields=['user', 'name'],
+                opclasses=['int8_ops', 'gin_trgm_ops'],
+                name='recipe_tag_name_trgm'
+            ),
+            # Serves ?prefix= of the autocomplete, istartswith compares UPPER(name::text), which the indexes on name
+            # can't answer
+            models.Index(
+                F('user'), OpClass(Upper('name'), name='text_pattern_ops'),
+                name='recipe_tag_upper_name'
+            ),
+        ]
+        constraints = [
+            # Also serves the get or create lookups by name
+            models.UniqueConstraint(fields=['user', 'normalized_name'], name='recipe_tag_unique_name'),
+        ]
+
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.normalized_name = normalize_name(self.name)
+        super().save(*args, **kwargs)
+
 
 class Ingredient(models.Model):
     """Ingredient to be used in a recipe"""
-    name = models.CharField(max_length=255)
+    name = models.CharField(max_length=NAME_MAX_LENGTH, validators=[validate_normalized_length])
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE
     )
 
+    # Case and whitespace insensitive form of name, see recipe.names.normalize_name
+    normalized_name = models.CharField(max_length=NAME_MAX_LENGTH, editable=False)
+    # Number of recipes using this object, maintained by the signal handlers in recipe.signals
+    recipe_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Serves the per-user listing, which is ordered by name
+            models.Index(fields=['user', 'name']),
+            # Serves ?ordering=-recipe_count without aggregating the recipes
+            models.Index(fields=['user', '-recipe_count', 'id']),
+            # Serves ?q= of the autocomplete of one user, needs the btree_gin and pg_trgm extensions
+            GinIndex(
+                fields=['user', 'name'],
+                opclasses=['int8_ops', 'gin_trgm_ops'],
+                name='recipe_ingredient_name_trgm'
+            ),
+            # Serves ?prefix= of the autocomplete, istartswith compares UPPER(name::text), which the indexes on name
+            # can't answer
+            models.Index(
+                F('user'), OpClass(Upper('name'), name='text_pattern_ops'),
+                name='recipe_ingredient_upper_name'
+            ),
+        ]
+        constraints = [
+            # Also serves the get or create lookups by name
+            models.UniqueConstraint(fields=['user', 'normalized_name'], name='recipe_ingredient_unique_name'),
+        ]
+
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.normalized_name = normalize_name(self.name)
+        super().save(*args, **kwargs)
+
 
 class Recipe(models.Model):
     """Recipe objects"""
@@ -51,6 +136,55 @@ class Recipe(models.Model):
     ingredients = models.ManyToManyField(Ingredient, related_name='recipes')
     tags = models.ManyToManyField(Tag, related_name='recipes')
     image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    # The resized variants of image are generated in the background, see recipe.images
+    image_status = models.CharField(max_length=10, choices=IMAGE_STATUS_CHOICES, blank=True)
+    # When image_status last changed, tells apart images a worker is processing from the ones it abandoned
+    image_status_changed = models.DateTimeField(null=True, blank=True, editable=False)
+    image_variants = models.JSONField(default=dict, blank=True)
+    # Title, tag and ingredient names for ?search=, maintained by the signal handlers in recipe.signals
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector']),
+        ]
 
     def __str__(self):
         return self.title
+
+
+class RecipeImageUpload(models.Model):
+    """
+    A resumable upload of a recipe image, whose chunks are appended to the file of the image, see recipe.uploads.
+    Its row is locked while a chunk is appended, so concurrent chunks of an upload are received one after the other.
+    Uploads abandoned for RECIPE_IMAGE_UPLOAD_EXPIRY seconds are deleted by purge_image_uploads.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='image_uploads')
+    # Size announced by the first chunk, every other chunk must announce the same
+    total = models.PositiveIntegerField()
+    received = models.PositiveIntegerField(default=0)
+    # Storage name of the file the chunks are appended to, at its final location
+    name = models.CharField(max_length=255, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.id.hex}: {self.received}/{self.total}'
+
+
+class UserDataVersion(models.Model):
+    """
+    Version of a user's recipes, tags and ingredients, bumped on every write to them.
+    Conditional GET requests are answered by comparing against it, see recipe.conditional.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name='recipe_data_version'
+    )
+    version = models.PositiveBigIntegerField(default=0)
+    modified = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f'{self.user_id}: {self.version}'
@@ -0,0 +1,58 @@
+import unicodedata
+
+from django.core.exceptions import ValidationError
+
+# Length of the name and normalized_name columns of tags and ingredients
+NAME_MAX_LENGTH = 255
+
+
+def normalize_name(name):
+    """Return the form of a tag or ingredient name that is unique per user: "Salt", "salt " and "SALT" are one"""
+    return unicodedata.normalize('NFKC', ' '.join(name.split())).casefold()
+
+
+def validate_normalized_length(name):
+    """Refuse names whose normalized form doesn't fit normalized_name, NFKC and case folding can lengthen a name"""
+    if len(normalize_name(name)) > NAME_MAX_LENGTH:
+        raise ValidationError(
+            'Ensure this name has no more than %(limit_value)d characters once normalized.',
+            code='max_length', params={'limit_value': NAME_MAX_LENGTH},
+        )
+
+
+def get_or_create_by_names(model, user, names, batch_size=1000):
+    """
+    Return the user's tags or ingredients for a list of names, in the same order, creating the missing ones.
+    Names are matched by their normalized form, so a repeated name returns the same object. One query fetches the
+    existing objects and one bulk insert creates the others, conflicting inserts of concurrent requests are ignored
+    and the winners read back.
+    """
+    normalized = [normalize_name(name) for name in names]
+    objs = {obj.normalized_name: obj for obj in model.objects.filter(user=user, normalized_name__in=set(normalized))}
+    missing = {}
+    for name, key in zip(names, normalized):
+        if key not in objs and key not in missing:
+            missing[key] = model(user=user, name=name, normalized_name=key)
+    if missing:
+        model.objects.bulk_create(missing.values(), batch_size=batch_size, ignore_conflicts=True)
+        objs.update({obj.normalized_name: obj for obj in model.objects.filter(user=user, normalized_name__in=missing)})
+    return [objs[key] for key in normalized]
+
+
+def fill_normalized_names(model, batch_size=1000):
+    """Set the normalized name of the tags or ingredients that don't have one yet, batch by batch"""
+    filled = 0
+    last_id = 0
+    while True:
+        # Walk the primary key, a name made only of whitespace normalizes to '' and would be selected again
+        objs = list(
+            model.objects.filter(pk__gt=last_id, normalized_name='').order_by('pk').only('pk', 'name')[:batch_size]
+        )
+        if not objs:
+            return filled
+        for obj in objs:
+            # Names saved before their normalized length was validated are cut to fit
+            obj.normalized_name = normalize_name(obj.name)[:NAME_MAX_LENGTH]
+        model.objects.bulk_update(objs, ['normalized_name'])
+        filled += len(objs)
+        last_id = objs[-1].pk
@@ -0,0 +1,17 @@
+from django.db import migrations
+
+
+class AddPostgresIndex(migrations.AddIndex):
+    """
+    AddIndex for index types that only exist in PostgreSQL (GIN, trigram...).
+    The migration state always gets the index, the database only when it is PostgreSQL, so the same migrations run
+    against the SQLite databases used to run the tests outside of docker.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
@@ -0,0 +1,40 @@
+from django.conf import settings
+
+from rest_framework import pagination
+
+
+class RecipeCursorPagination(pagination.CursorPagination):
+    """
+    Keyset pagination for recipes.
+    Pages are fetched with `WHERE id < cursor` instead of OFFSET, so the cost of a page doesn't grow with its
+    position and no COUNT(*) is needed. Cursors stay stable when rows are inserted while a client is paging.
+    """
+    ordering = '-id'
+    page_size_query_param = 'page_size'
+
+    @property
+    def max_page_size(self):
+        """Upper bound for the page_size query param"""
+        return settings.API_MAX_PAGE_SIZE
+
+    def get_ordering(self, request, queryset, view):
+        """
+        Views can override the ordering for a request with a pagination_ordering attribute, e.g. to order search
+        results by rank. The ordering always ends with the primary key so rows with equal values keep a stable order,
+        the cursor itself only holds the value of the first field and an offset into the rows sharing it.
+        """
+        ordering = getattr(view, 'pagination_ordering', None) or super().get_ordering(request, queryset, view)
+        ordering = tuple(ordering)
+        if 'id' not in ordering and '-id' not in ordering:
+            ordering += ('id',)
+        return ordering
+
+
+class RecipeAttrCursorPagination(RecipeCursorPagination):
+    """
+    Cursor pagination for tags and ingredients.
+    DRF positions the cursor on the first ordering field only, id just makes the order deterministic: rows sharing
+    the value of the cursor are skipped with an offset. Names are unique per user so the default ordering has no
+    ties, ?ordering=recipe_count has many and pages through runs of equal counts with offsets.
+    """
+    ordering = ('-name', 'id')
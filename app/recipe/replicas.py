@@ -0,0 +1,51 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from core.db.routers import start_replica_reads, stop_replica_reads
+
+from .conditional import DataVersionMixin
+
+
+class ReplicaReadMixin(DataVersionMixin):
+    """
+    Serve the GET and HEAD requests of replica_actions from the read replicas of DATABASE_REPLICAS.
+    A user whose recipes, tags or ingredients changed less than DATABASE_REPLICA_LAG seconds ago reads from the
+    primary, so they see their own writes before the replicas caught up. The last write time is the modification time
+    of the user's data version, which is always read from the primary.
+    replica_reads tells whether the request reads from a replica, its response may then be older than the data version
+    and is neither cached nor given validators.
+    """
+    replica_actions = ('list', 'retrieve')
+
+    def data_version_actions(self):
+        actions = super().data_version_actions()
+        if settings.DATABASE_REPLICAS:
+            actions = (*actions, *self.replica_actions)
+        return actions
+
+    def use_replica(self, request):
+        """Return whether the reads of the request can be served by a replica"""
+        if not settings.DATABASE_REPLICAS or request.method not in ('GET', 'HEAD'):
+            return False
+        if self.action not in self.replica_actions:
+            return False
+        if self.data_version is None:
+            # Without a last write time the primary is the only safe choice
+            return False
+        _, modified = self.data_version
+        return timezone.now() - modified > timedelta(seconds=settings.DATABASE_REPLICA_LAG)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.replica_reads = self.use_replica(request)
+        if self.replica_reads:
+            self._replica_reads_token = start_replica_reads()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_replica_reads_token', None)
+        if token is not None:
+            self._replica_reads_token = None
+            stop_replica_reads(token)
+        return super().finalize_response(request, response, *args, **kwargs)
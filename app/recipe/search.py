@@ -0,0 +1,87 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from django.db import connections, router
+from django.db.models import BigIntegerField, Exists, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Cast, Coalesce, Lower
+
+# Ranks are kept to this many parts of one in rank_key, recipes whose ranks only differ further are ordered by id
+RANK_KEY_SCALE = 10 ** 6
+
+
+def supports_full_text_search(model):
+    """Full text search needs PostgreSQL, other databases (like the test SQLite) fall back to icontains"""
+    return connections[router.db_for_read(model)].vendor == 'postgresql'
+
+
+def related_names(model, field_name):
+    """Return a subquery of the space separated names of the tags or ingredients of every recipe"""
+    field = model._meta.get_field(field_name)
+    source_column = f'{field.m2m_field_name()}_id'
+    target = field.m2m_reverse_field_name()
+    names = field.remote_field.through.objects.filter(**{source_column: OuterRef('pk')})\
+                                              .order_by()\
+                                              .values(source_column)\
+                                              .annotate(names=StringAgg(f'{target}__name', ' '))\
+                                              .values('names')
+    return Coalesce(Subquery(names), Value(''))
+
+
+def refresh_search_vectors(queryset):
+    """
+    Recompute the stored search vector of the recipes of a queryset with a single UPDATE.
+    Titles weigh more than tag names, which weigh more than ingredient names.
+    """
+    if not supports_full_text_search(queryset.model):
+        return 0
+    model = queryset.model
+    return queryset.update(search_vector=(
+        SearchVector('title', weight='A')
+        + SearchVector(related_names(model, 'tags'), weight='B')
+        + SearchVector(related_names(model, 'ingredients'), weight='C')
+    ))
+
+
+def search_recipes(queryset, text):
+    """
+    Filter recipes matching a web search style text ("chicken curry", "soup -tomato") and annotate their rank.
+    PostgreSQL answers it from the GIN index on search_vector. Elsewhere every word must be contained in the title,
+    a tag name or an ingredient name, and rank is not annotated.
+    rank_key is the rank as an integer to order and paginate by: a float rank doesn't survive the round trip through
+    a pagination cursor exactly, so pages would repeat or skip the rows next to the cursor.
+    """
+    if supports_full_text_search(queryset.model):
+        query = SearchQuery(text, search_type='websearch')
+        return queryset.filter(search_vector=query)\
+                       .annotate(rank=SearchRank(F('search_vector'), query))\
+                       .annotate(rank_key=Cast(F('rank') * RANK_KEY_SCALE, BigIntegerField()))
+
+    model = queryset.model
+    for word in text.split():
+        matches = Q(title__icontains=word)
+        for field_name in ('tags', 'ingredients'):
+            field = model._meta.get_field(field_name)
+            links = field.remote_field.through.objects.filter(**{
+                f'{field.m2m_field_name()}_id': OuterRef('pk'),
+                f'{field.m2m_reverse_field_name()}__name__icontains': word,
+            })
+            matches |= Exists(links)
+        queryset = queryset.filter(matches)
+    return queryset
+
+
+def autocomplete(queryset, prefix=None, text=None, limit=10):
+    """
+    Return the best limit tags or ingredients of a queryset for what a user is typing.
+    With prefix, names starting with it are returned alphabetically. With text, names similar to it (typos and word
+    order don't matter) are returned by trigram similarity on PostgreSQL, names containing it elsewhere.
+    On PostgreSQL istartswith is written UPPER(name::text) LIKE UPPER('prefix%'), which is answered by the
+    (user, UPPER(name)) text_pattern_ops index, and the similarity operator by the trigram GIN index on (user, name).
+    Neither gives the rows in the order returned, the matches are sorted before the limit is applied.
+    """
+    if prefix:
+        return queryset.filter(name__istartswith=prefix).order_by(Lower('name'), 'id')[:limit]
+    if supports_full_text_search(queryset.model):
+        return queryset.filter(Q(name__istartswith=text) | Q(name__trigram_similar=text))\
+                       .annotate(similarity=TrigramSimilarity('name', text))\
+                       .order_by('-similarity', Lower('name'), 'id')[:limit]
+    return queryset.filter(name__icontains=text).order_by(Lower('name'), 'id')[:limit]
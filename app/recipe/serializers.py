@@ -1,33 +1,249 @@
+from collections import Counter
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
+
+from core.metrics import TimedSerializerMixin
+
+from .bulk import bulk_create, bulk_link
+from .counters import adjust_recipe_counts
+from .models import Tag, Ingredient, Recipe, IMAGE_READY
+from .names import NAME_MAX_LENGTH, get_or_create_by_names, normalize_name, validate_normalized_length
+from .rows import RowSerializer
+from .search import refresh_search_vectors
+
+
+class RecipeAttrListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    """Get or create many tags or ingredients with one query and one bulk insert"""
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        if not validated_data:
+            return []
+        user = validated_data[0]['user']
+        with transaction.atomic():
+            return get_or_create_by_names(model, user, [attrs['name'] for attrs in validated_data])
 
-from .models import Tag, Ingredient, Recipe
 
+class RecipeAttrSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """Base serializer for tags and ingredients, creating returns the user's object of the same name if there is one"""
 
-class TagSerializer(serializers.ModelSerializer):
+    def create(self, validated_data):
+        model = self.Meta.model
+        instance, self.created = model.objects.get_or_create(
+            user=validated_data['user'],
+            normalized_name=normalize_name(validated_data['name']),
+            defaults=validated_data,
+        )
+        return instance
+
+
+class TagSerializer(RecipeAttrSerializer):
     """Serializer for tag objects"""
 
     class Meta:
         model = Tag
-        fields = ('id', 'name')
-        read_only_fields = ('id',)
+        fields = ('id', 'name', 'recipe_count')
+        read_only_fields = ('id', 'recipe_count')
+        list_serializer_class = RecipeAttrListSerializer
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(RecipeAttrSerializer):
     """Serializer for Ingredient objects"""
 
     class Meta:
         model = Ingredient
-        fields = ('id', 'name')
-        read_only_fields = ('id',)
+        fields = ('id', 'name', 'recipe_count')
+        read_only_fields = ('id', 'recipe_count')
+        list_serializer_class = RecipeAttrListSerializer
+
+
+class RecipeAttrRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Tag or ingredient of a recipe given by id (12 or {"id": 12}) or by name ({"name": "Salt"}), of the request's user.
+    Ids are looked up all at once by RecipeAttrManyRelatedField, and names are returned as unsaved objects that the
+    serializer resolves all at once with resolve_names.
+    """
+    default_error_messages = {
+        'invalid_spec': 'Expected an id or an object with an "id" or a "name".',
+    }
+    name_field = serializers.CharField(max_length=NAME_MAX_LENGTH, validators=[validate_normalized_length])
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return RecipeAttrManyRelatedField(**list_kwargs)
+
+    def get_queryset(self):
+        request = self.context.get('request')
+        queryset = super().get_queryset()
+        return queryset.filter(user=request.user) if request else queryset
+
+    def to_internal_value(self, data):
+        """Return the id, or an unsaved object for a name"""
+        if isinstance(data, dict):
+            if 'name' in data and 'id' not in data:
+                return self.get_queryset().model(name=self.name_field.run_validation(data['name']))
+            if 'id' not in data:
+                self.fail('invalid_spec')
+            data = data['id']
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+
+class RecipeAttrManyRelatedField(serializers.ManyRelatedField):
+    """
+    Validate all the ids of a list with one id__in query instead of one query per id.
+    In a list of recipes, the ids of all the items were looked up at once by RecipeListSerializer already.
+    """
+
+    def to_internal_value(self, data):
+        items = super().to_internal_value(data)
+        ids = [item for item in items if isinstance(item, int)]
+        if not ids:
+            return items
+        looked_up, objs = getattr(self.root, 'related_objs', {}).get(self.field_name, (set(), {}))
+        missing = [pk for pk in ids if pk not in looked_up]
+        if missing:
+            objs = {**objs, **self.child_relation.get_queryset().in_bulk(missing)}
+        for pk in ids:
+            if pk not in objs:
+                self.child_relation.fail('does_not_exist', pk_value=pk)
+        return [objs[item] if isinstance(item, int) else item for item in items]
+
+
+def spec_ids(specs):
+    """Return the ids given in a list of tag or ingredient specs, skipping names and invalid values"""
+    if not isinstance(specs, list):
+        return
+    for spec in specs:
+        if isinstance(spec, dict):
+            spec = spec.get('id')
+        if isinstance(spec, bool):
+            continue
+        try:
+            yield int(spec)
+        except (TypeError, ValueError):
+            pass
+
+
+def resolve_names(model, user, related_objs):
+    """
+    Replace the unsaved objects given by name in lists of tags or ingredients by the user's objects of that name.
+    All the names of all the lists are looked up with one query, the missing ones created with one bulk insert.
+    """
+    names = [obj.name for objs in related_objs for obj in objs if obj.pk is None]
+    if not names:
+        return related_objs
+    resolved = iter(get_or_create_by_names(model, user, names))
+    return [[obj if obj.pk is not None else next(resolved) for obj in objs] for objs in related_objs]
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    """
+    Create or update many recipes with bulk queries for the recipes and for their tag and ingredient links.
+    The tag and ingredient ids of all the items are validated with one query per field.
+    """
+    related_fields = ('tags', 'ingredients')
+
+    def to_internal_value(self, data):
+        self.related_objs = {}
+        if isinstance(data, list):
+            for name in self.related_fields:
+                ids = {pk for item in data if isinstance(item, dict) for pk in spec_ids(item.get(name))}
+                if ids:
+                    queryset = self.child.fields[name].child_relation.get_queryset()
+                    self.related_objs[name] = (ids, queryset.in_bulk(ids))
+        return super().to_internal_value(data)
+
+    def ordered_prefetches(self):
+        """Prefetch the related objects in the order of the list endpoint"""
+        return [
+            Prefetch(name, queryset=Recipe._meta.get_field(name).related_model.objects.order_by('id'))
+            for name in self.related_fields
+        ]
+
+    def create(self, validated_data):
+        if not validated_data:
+            return []
+        user = validated_data[0]['user']
+        related = {name: [attrs.pop(name, []) for attrs in validated_data] for name in self.related_fields}
+        with transaction.atomic():
+            recipes = bulk_create(Recipe, [Recipe(**attrs) for attrs in validated_data])
+            for name, related_objs in related.items():
+                model = Recipe._meta.get_field(name).related_model
+                bulk_link(recipes, name, resolve_names(model, user, related_objs))
+            refresh_search_vectors(Recipe.objects.filter(pk__in=[recipe.pk for recipe in recipes]))
+        # Render the response with two queries instead of two per recipe
+        prefetch_related_objects(recipes, *self.ordered_prefetches())
+        return recipes
+
+    def update(self, instances, validated_data):
+        """Update recipes given in the same order as their validated data, replacing the given links"""
+        if not instances:
+            return []
+        user = instances[0].user
+        related = {name: [attrs.pop(name, None) for attrs in validated_data] for name in self.related_fields}
+        fields = set()
+        for instance, attrs in zip(instances, validated_data):
+            for field, value in attrs.items():
+                setattr(instance, field, value)
+            fields.update(attrs)
+        with transaction.atomic():
+            if fields:
+                Recipe.objects.bulk_update(instances, fields)
+            for name, related_objs in related.items():
+                changed = [(instance, objs) for instance, objs in zip(instances, related_objs) if objs is not None]
+                if not changed:
+                    continue
+                field = Recipe._meta.get_field(name)
+                links = field.remote_field.through.objects.filter(recipe__in=[instance for instance, _ in changed])
+                # Every deleted link takes one recipe off its object, bulk_link adds the new ones back
+                unlinked = Counter(links.values_list(f'{field.m2m_reverse_field_name()}_id', flat=True))
+                links.delete()
+                adjust_recipe_counts(field.related_model, {pk: -count for pk, count in unlinked.items()})
+                resolved = resolve_names(field.related_model, user, [objs for _, objs in changed])
+                bulk_link([instance for instance, _ in changed], name, resolved)
+            refresh_search_vectors(Recipe.objects.filter(pk__in=[instance.pk for instance in instances]))
+        for instance in instances:
+            getattr(instance, '_prefetched_objects_cache', {}).clear()
+        prefetch_related_objects(instances, *self.ordered_prefetches())
+        return instances
+
+
+class ExpandableFieldsMixin:
+    """
+    Serializer taking the names of the fields to render (fields, all of them if None) and of the related fields to
+    render nested with their serializer instead of as ids (expand, any of expandable_fields).
+    """
+    expandable_fields = {}
+
+    def __init__(self, *args, fields=None, expand=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        for name in expand:
+            self.fields[name] = self.expandable_fields[name](many=True, read_only=True)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class RecipeSerializer(TimedSerializerMixin, ExpandableFieldsMixin, serializers.ModelSerializer):
     """Serializer for recipe objects"""
-    ingredients = serializers.PrimaryKeyRelatedField(
+    ingredients = RecipeAttrRelatedField(
         many=True,
         queryset=Ingredient.objects.all()
     )
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = RecipeAttrRelatedField(
         many=True,
         queryset=Tag.objects.all()
     )
@@ -35,10 +251,30 @@ class RecipeSerializer(serializers.ModelSerializer):
     # ingredients = serializers.SlugRelatedField(slug_field='name', queryset=Ingredient.objects.all(), many=True)
     # tags = serializers.SlugRelatedField(slug_field='name', queryset=Tag.objects.all(), many=True)
 
+    expandable_fields = {'tags': TagSerializer, 'ingredients': IngredientSerializer}
+
     class Meta:
         model = Recipe
         fields = ('id', 'title', 'time_minutes', 'ingredients', 'tags', 'price', 'link')
         read_only_fields = ('id',)
+        list_serializer_class = RecipeListSerializer
+
+    def create(self, validated_data):
+        with transaction.atomic():
+            self.resolve_names(validated_data, validated_data['user'])
+            return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        with transaction.atomic():
+            self.resolve_names(validated_data, instance.user)
+            return super().update(instance, validated_data)
+
+    def resolve_names(self, validated_data, user):
+        """Get or create the tags and ingredients given by name"""
+        for name in ('tags', 'ingredients'):
+            if name in validated_data:
+                model = Recipe._meta.get_field(name).related_model
+                validated_data[name], = resolve_names(model, user, [validated_data[name]])
 
 
 class RecipeDetailSerializer(RecipeSerializer):
@@ -47,10 +283,43 @@ class RecipeDetailSerializer(RecipeSerializer):
     tags = TagSerializer(many=True, read_only=True)
 
 
-class RecipeImageSerializer(serializers.ModelSerializer):
-    """Serializer for uploading images to recipes"""
+class TagRowSerializer(RowSerializer):
+    """Fast path of TagSerializer for reads"""
+    serializer_class = TagSerializer
+
+
+class IngredientRowSerializer(RowSerializer):
+    """Fast path of IngredientSerializer for reads"""
+    serializer_class = IngredientSerializer
+
+
+class RecipeRowSerializer(RowSerializer):
+    """Fast path of RecipeSerializer for reads, RecipeDetailSerializer when tags and ingredients are expanded"""
+    serializer_class = RecipeSerializer
+    related_serializers = {'tags': TagRowSerializer, 'ingredients': IngredientRowSerializer}
+
+
+class RecipeImageSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """Serializer for uploading images to recipes and reading the state of their resized variants"""
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'image')
-        read_only_fields = ('id',)
+        fields = ('id', 'image', 'image_status', 'image_variants')
+        read_only_fields = ('id', 'image_status')
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if instance.image_status != IMAGE_READY:
+            # Until it is replaced by its full variant, the upload carries the camera details and GPS position
+            data['image'] = None
+        return data
+
+    def get_image_variants(self, obj):
+        """Return the URL of every generated variant"""
+        request = self.context.get('request')
+        urls = {}
+        for variant, name in obj.image_variants.items():
+            url = default_storage.url(name)
+            urls[variant] = request.build_absolute_uri(url) if request else url
+        return urls
@@ -0,0 +1,155 @@
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.signals import m2m_changed, pre_delete, post_delete, post_save
+from django.dispatch import receiver
+
+from .conditional import bump_data_version
+from .counters import adjust_recipe_counts, refresh_recipe_counts
+from .search import refresh_search_vectors, supports_full_text_search
+from .models import Tag, Ingredient, Recipe, RecipeImageUpload, UserDataVersion
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def update_recipe_counts_on_link_change(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """
+    Keep recipe_count of tags and ingredients up to date when they are added to or removed from recipes.
+    Added and removed links move the counters by their number, clear() doesn't tell the removed ids and recounts.
+    """
+    if reverse:
+        # tag.recipes.add(...): the instance is the tag, pk_set are recipe ids
+        attr_model = type(instance)
+        column = f'{attr_model._meta.model_name}_id'
+        if action == 'pre_remove' and pk_set:
+            # remove() sends the given ids, linked or not, count the links before they are deleted
+            links = sender.objects.filter(**{column: instance.pk, 'recipe_id__in': pk_set})
+            instance._removed_recipe_count = links.count()
+        elif action == 'post_remove' and pk_set:
+            adjust_recipe_counts(attr_model, {instance.pk: -instance._removed_recipe_count})
+        elif action == 'post_add' and pk_set:
+            # add() only sends the ids it linked
+            adjust_recipe_counts(attr_model, {instance.pk: len(pk_set)})
+        elif action == 'post_clear':
+            refresh_recipe_counts(attr_model, [instance.pk])
+        return
+
+    column = f'{model._meta.model_name}_id'
+    if action == 'pre_clear':
+        # clear() doesn't send the removed ids, so remember them while the links still exist
+        pending = getattr(instance, '_cleared_recipe_attrs', {})
+        pending[sender] = list(sender.objects.filter(recipe_id=instance.pk).values_list(column, flat=True))
+        instance._cleared_recipe_attrs = pending
+    elif action == 'post_clear':
+        refresh_recipe_counts(model, instance._cleared_recipe_attrs.pop(sender, []))
+    elif action == 'pre_remove' and pk_set:
+        # Only the ids that are linked lose a recipe
+        linked = sender.objects.filter(recipe_id=instance.pk, **{f'{column}__in': pk_set})
+        pending = getattr(instance, '_removed_recipe_links', {})
+        pending[sender] = {pk: -1 for pk in linked.values_list(column, flat=True)}
+        instance._removed_recipe_links = pending
+    elif action == 'post_remove' and pk_set:
+        adjust_recipe_counts(model, instance._removed_recipe_links.pop(sender, {}))
+    elif action == 'post_add' and pk_set:
+        adjust_recipe_counts(model, dict.fromkeys(pk_set, 1))
+
+
+@receiver(pre_delete, sender=Recipe)
+def remember_recipe_attrs(sender, instance, **kwargs):
+    """Remember the tags and ingredients of a recipe before the delete cascades to its links"""
+    instance._deleted_recipe_attrs = {
+        Tag: list(instance.tags.values_list('pk', flat=True)),
+        Ingredient: list(instance.ingredients.values_list('pk', flat=True)),
+    }
+
+
+@receiver(post_delete, sender=Recipe)
+def update_recipe_counts_on_delete(sender, instance, **kwargs):
+    """Recount the tags and ingredients of a deleted recipe"""
+    for model, ids in getattr(instance, '_deleted_recipe_attrs', {}).items():
+        if ids:
+            refresh_recipe_counts(model, ids)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def bump_data_version_on_write(sender, instance, **kwargs):
+    """Invalidate the validators handed out for the owner's data"""
+    bump_data_version(instance.user_id)
+
+
+@receiver(post_save, sender=get_user_model())
+def create_data_version(sender, instance, created, raw=False, **kwargs):
+    """Create the data version of a new user, so conditional reads never write"""
+    if created and not raw:
+        UserDataVersion.objects.create(user=instance)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def bump_data_version_on_link_change(sender, instance, action, **kwargs):
+    """Invalidate the validators handed out for the owner's data"""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_data_version(instance.user_id)
+
+
+@receiver(post_save, sender=Recipe)
+def update_search_vector_on_save(sender, instance, update_fields=None, **kwargs):
+    """Index the title of a saved recipe"""
+    if update_fields is None or 'title' in update_fields:
+        refresh_search_vectors(Recipe.objects.filter(pk=instance.pk))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def update_search_vector_on_link_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """Index the tag and ingredient names of recipes whose links changed"""
+    if not supports_full_text_search(Recipe):
+        return
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            refresh_search_vectors(Recipe.objects.filter(pk=instance.pk))
+    elif action == 'pre_clear':
+        # tag.recipes.clear() doesn't send the recipe ids, remember them while the links still exist
+        instance._cleared_recipe_ids = list(instance.recipes.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        refresh_search_vectors(Recipe.objects.filter(pk__in=instance._cleared_recipe_ids))
+    elif action in ('post_add', 'post_remove'):
+        refresh_search_vectors(Recipe.objects.filter(pk__in=pk_set))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def update_search_vector_on_rename(sender, instance, created, **kwargs):
+    """Index the new name of a tag or ingredient in the recipes using it"""
+    if not created and supports_full_text_search(Recipe):
+        refresh_search_vectors(Recipe.objects.filter(pk__in=instance.recipes.values('pk')))
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def remember_recipes_of_deleted_attr(sender, instance, **kwargs):
+    """Remember the recipes of a tag or ingredient before the delete cascades to its links"""
+    if supports_full_text_search(Recipe):
+        instance._deleted_recipe_ids = list(instance.recipes.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def update_search_vector_on_attr_delete(sender, instance, **kwargs):
+    """Stop matching the recipes of a deleted tag or ingredient on its name"""
+    recipe_ids = getattr(instance, '_deleted_recipe_ids', None)
+    if recipe_ids:
+        refresh_search_vectors(Recipe.objects.filter(pk__in=recipe_ids))
+
+
+@receiver(post_delete, sender=RecipeImageUpload)
+def delete_upload_file(sender, instance, using, **kwargs):
+    """Remove the file of an upload deleted before it completed: purged, or deleted with its recipe"""
+    name = instance.name
+    if name:
+        transaction.on_commit(lambda: default_storage.delete(name), using=using)
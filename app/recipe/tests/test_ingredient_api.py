@@ -10,6 +10,7 @@ from recipe.serializers import IngredientSerializer
 
 
 INGREDIENT_URL = reverse('recipe:ingredient-list')
+AUTOCOMPLETE_URL = reverse('recipe:ingredient-autocomplete')
 
 
 def create_user(email='test@test.com', password='Test1234'):
@@ -49,7 +50,7 @@ class PrivateIngredientApiTests(TestCase):
         serializer = IngredientSerializer(ingredients, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_ingredients_limited_to_user(self):
         """Test that only ingredients for the authenticated user are returned"""
@@ -59,8 +60,8 @@ class PrivateIngredientApiTests(TestCase):
         res = self.client.get(INGREDIENT_URL)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]['name'], ingredients.name)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['name'], ingredients.name)
 
     def test_create_ingredient_successful(self):
         """Test create a new ingredient"""
@@ -78,6 +79,16 @@ class PrivateIngredientApiTests(TestCase):
         self.assertTrue(ingredient.exists())
         self.assertEqual(res.status_code, status.HTTP_201_CREATED)
 
+    def test_create_ingredient_existing_name(self):
+        """Test creating an ingredient whose name only differs by case and whitespace returns the existing one"""
+        ingredient = Ingredient.objects.create(user=self.user, name='Olive oil')
+
+        res = self.client.post(INGREDIENT_URL, {'name': 'olive  OIL'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['id'], ingredient.id)
+        self.assertEqual(Ingredient.objects.filter(user=self.user).count(), 1)
+
     def test_create_ingredient_invalid(self):
         """Test creating invalid ingredient fails"""
         payload = {
@@ -104,11 +115,12 @@ class PrivateIngredientApiTests(TestCase):
             INGREDIENT_URL,
             {'assigned_only': 1}
         )
+        ingredient1.refresh_from_db()
         serializer1 = IngredientSerializer(ingredient1)
         serializer2 = IngredientSerializer(ingredient2)
 
-        self.assertIn(serializer1.data, res.data)
-        self.assertNotIn(serializer2.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertNotIn(serializer2.data, res.data['results'])
 
     def test_retrieve_ingredients_assigned_unique(self):
         """Test filtering ingredients by assigned unique items"""
@@ -133,7 +145,37 @@ class PrivateIngredientApiTests(TestCase):
             INGREDIENT_URL,
             {'assigned_only': 1}
         )
+        ingredient.refresh_from_db()
         serializer = IngredientSerializer(ingredient)
 
-        self.assertEqual(len(res.data), 1)
-        self.assertIn(serializer.data, res.data)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertIn(serializer.data, res.data['results'])
+
+    def test_autocomplete_prefix(self):
+        """Test suggesting the user's ingredients starting with a prefix"""
+        Ingredient.objects.create(user=self.user, name='Salt')
+        salmon = Ingredient.objects.create(user=self.user, name='salmon')
+        sage = Ingredient.objects.create(user=self.user, name='Sage')
+        Ingredient.objects.create(user=create_user(email='other@test.com'), name='Sage')
+
+        res = self.client.get(AUTOCOMPLETE_URL, {'prefix': 'sa', 'limit': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in res.data], [sage.id, salmon.id])
+
+    def test_autocomplete_text(self):
+        """Test suggesting ingredients containing the typed text"""
+        pepper = Ingredient.objects.create(user=self.user, name='Black pepper')
+        Ingredient.objects.create(user=self.user, name='Salt')
+
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': 'pepper'})
+
+        self.assertEqual([item['id'] for item in res.data], [pepper.id])
+
+    def test_autocomplete_without_text(self):
+        """Test nothing is suggested before anything is typed"""
+        Ingredient.objects.create(user=self.user, name='Salt')
+
+        res = self.client.get(AUTOCOMPLETE_URL)
+
+        self.assertEqual(res.data, [])
@@ -1,11 +1,19 @@
+import io
+from datetime import timedelta
 from unittest.mock import patch
 
-from django.test import TestCase
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 from rest_framework.test import APIClient
 
-from recipe.models import Tag, Ingredient, Recipe
+from recipe.duplicates import merge_objects
+from recipe.images import _run
+from recipe.models import Tag, Ingredient, Recipe, UserDataVersion
 from recipe import models
 
 
@@ -28,6 +36,12 @@ class TestTag(TestCase):
         )
         self.assertEqual(str(tag), tag.name)
 
+    def test_tag_normalized_name(self):
+        """Test the normalized name of a tag ignores case and whitespace"""
+        tag = Tag.objects.create(user=create_user(), name='  Main   COURSE ')
+
+        self.assertEqual(tag.normalized_name, 'main course')
+
 
 class TestIngredient(TestCase):
     """Test the Ingredient model"""
@@ -71,3 +85,258 @@ class TestRecipe(TestCase):
 
         exp_path = f'uploads/recipe/{uuid}.jpg'
         self.assertEqual(file_path, exp_path)
+
+
+class TestRecipeCount(TestCase):
+    """Test the denormalized recipe_count of tags and ingredients"""
+
+    def setUp(self) -> None:
+        self.user = create_user()
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+        self.recipe1 = Recipe.objects.create(user=self.user, title='Soup', time_minutes=5, price=5.00)
+        self.recipe2 = Recipe.objects.create(user=self.user, title='Salad', time_minutes=5, price=5.00)
+
+    def assertRecipeCount(self, obj, expected):
+        obj.refresh_from_db()
+        self.assertEqual(obj.recipe_count, expected)
+
+    def test_count_on_add_and_remove(self):
+        """Test adding and removing recipes updates the counter"""
+        self.recipe1.tags.add(self.tag)
+        self.recipe2.tags.add(self.tag)
+        self.recipe2.tags.add(self.tag)
+        self.recipe1.ingredients.add(self.ingredient)
+        self.assertRecipeCount(self.tag, 2)
+        self.assertRecipeCount(self.ingredient, 1)
+
+        self.recipe1.tags.remove(self.tag)
+        self.recipe1.tags.remove(self.tag)
+        self.assertRecipeCount(self.tag, 1)
+
+    def test_count_on_reverse_add_and_clear(self):
+        """Test changing the links from the tag side updates the counter"""
+        self.tag.recipes.add(self.recipe1, self.recipe2)
+        self.assertRecipeCount(self.tag, 2)
+
+        self.tag.recipes.clear()
+        self.assertRecipeCount(self.tag, 0)
+
+    def test_count_on_clear_and_set(self):
+        """Test clearing and setting the tags of a recipe updates the counter"""
+        other = Tag.objects.create(user=self.user, name='Dessert')
+        self.recipe1.tags.add(self.tag)
+
+        self.recipe1.tags.set([other])
+        self.assertRecipeCount(self.tag, 0)
+        self.assertRecipeCount(other, 1)
+
+        self.recipe1.tags.clear()
+        self.assertRecipeCount(other, 0)
+
+    def test_count_on_recipe_delete(self):
+        """Test deleting a recipe decrements its tags and ingredients"""
+        self.recipe1.tags.add(self.tag)
+        self.recipe1.ingredients.add(self.ingredient)
+        self.recipe2.tags.add(self.tag)
+
+        self.recipe1.delete()
+
+        self.assertRecipeCount(self.tag, 1)
+        self.assertRecipeCount(self.ingredient, 0)
+
+    def test_count_on_reverse_remove(self):
+        """Test removing recipes from the tag side only counts the linked ones"""
+        self.tag.recipes.add(self.recipe1, self.recipe2)
+
+        self.tag.recipes.remove(self.recipe1)
+        self.tag.recipes.remove(self.recipe1)
+
+        self.assertRecipeCount(self.tag, 1)
+
+    def test_count_incremented(self):
+        """Test link changes move the stored counter instead of recounting the links"""
+        Tag.objects.update(recipe_count=10)
+
+        self.recipe1.tags.add(self.tag)
+        self.tag.recipes.add(self.recipe2)
+        self.assertRecipeCount(self.tag, 12)
+
+        self.recipe1.tags.remove(self.tag)
+        self.assertRecipeCount(self.tag, 11)
+
+    def test_recompute_recipe_counts_command(self):
+        """Test the management command repairs drifted counters and invalidates their owner's responses"""
+        self.recipe1.tags.add(self.tag)
+        Tag.objects.update(recipe_count=42)
+        version = UserDataVersion.objects.get(user=self.user).version
+
+        call_command('recompute_recipe_counts', batch_size=1, stdout=io.StringIO())
+
+        self.assertRecipeCount(self.tag, 1)
+        self.assertEqual(UserDataVersion.objects.get(user=self.user).version, version + 1)
+
+    def test_recompute_recipe_counts_command_exact(self):
+        """Test exact counters are left alone, their owner's responses stay cached"""
+        self.recipe1.tags.add(self.tag)
+        version = UserDataVersion.objects.get(user=self.user).version
+
+        call_command('recompute_recipe_counts', stdout=io.StringIO())
+
+        self.assertEqual(UserDataVersion.objects.get(user=self.user).version, version)
+
+
+class TestSearchVectorSignals(TestCase):
+    """Test the search vectors of recipes are refreshed when what they index changes"""
+
+    @patch('recipe.signals.refresh_search_vectors')
+    @patch('recipe.signals.supports_full_text_search', return_value=True)
+    def test_refreshed_on_tag_delete(self, supported, refresh):
+        """Test deleting a tag refreshes the recipes that were linked to it"""
+        user = create_user()
+        tag = Tag.objects.create(user=user, name='Vegan')
+        linked = Recipe.objects.create(user=user, title='Soup', time_minutes=5, price=5.00)
+        Recipe.objects.create(user=user, title='Salad', time_minutes=5, price=5.00)
+        linked.tags.add(tag)
+        refresh.reset_mock()
+
+        tag.delete()
+
+        refresh.assert_called_once()
+        self.assertEqual(list(refresh.call_args[0][0].values_list('pk', flat=True)), [linked.pk])
+
+
+class TestMergeDuplicates(TestCase):
+    """Test merging tags and ingredients"""
+
+    def setUp(self) -> None:
+        self.user = create_user()
+        self.recipe1 = Recipe.objects.create(user=self.user, title='Soup', time_minutes=5, price=5.00)
+        self.recipe2 = Recipe.objects.create(user=self.user, title='Salad', time_minutes=5, price=5.00)
+
+    def test_merge_objects(self):
+        """Test merged tags move their recipes to the kept tag without linking a recipe twice"""
+        kept = Tag.objects.create(user=self.user, name='Vegan')
+        merged1 = Tag.objects.create(user=self.user, name='Vegetarian')
+        merged2 = Tag.objects.create(user=self.user, name='Plant based')
+        self.recipe1.tags.add(kept, merged1)
+        self.recipe2.tags.add(merged1, merged2)
+
+        merge_objects(Tag, Recipe, {merged1.id: kept.id, merged2.id: kept.id})
+
+        self.assertFalse(Tag.objects.filter(pk__in=[merged1.id, merged2.id]).exists())
+        self.assertEqual(Recipe.tags.through.objects.filter(tag=kept).count(), 2)
+        kept.refresh_from_db()
+        self.assertEqual(kept.recipe_count, 2)
+
+    def test_merge_duplicate_names_command_keeps_unique_names(self):
+        """Test the command leaves the unique names alone"""
+        Ingredient.objects.create(user=self.user, name='Salt')
+        Ingredient.objects.create(user=create_user('other@test.com'), name='salt')
+
+        call_command('merge_duplicate_names', batch_size=1)
+
+        self.assertEqual(Ingredient.objects.count(), 2)
+
+
+class TestNormalizedNameMigrations(TransactionTestCase):
+    """
+    Test merging the duplicates left from before names were unique per user. The database is migrated back to before
+    the unique constraints, the only state where duplicates can exist, and the objects created with the historical
+    models of that state.
+    """
+
+    def tearDown(self) -> None:
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def migrate(self, migration):
+        """Migrate the recipe app to a migration and return the historical models of that state"""
+        targets = [('recipe', migration)]
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def test_merge_duplicate_names_command(self):
+        """Test tags only differing by case are merged into the oldest, with their recipes"""
+        apps = self.migrate('0012_normalized_name')
+        user_model = apps.get_model('core', 'User')
+        tag_model = apps.get_model('recipe', 'Tag')
+        recipe_model = apps.get_model('recipe', 'Recipe')
+        user = user_model.objects.create(email='test@test.com')
+        kept = tag_model.objects.create(user=user, name='Vegan', normalized_name='vegan')
+        duplicate = tag_model.objects.create(user=user, name=' VEGAN', normalized_name='vegan')
+        other = tag_model.objects.create(user=user_model.objects.create(email='other@test.com'), name='vegan',
+                                         normalized_name='vegan')
+        recipe1 = recipe_model.objects.create(user=user, title='Soup', time_minutes=5, price=5.00)
+        recipe2 = recipe_model.objects.create(user=user, title='Salad', time_minutes=5, price=5.00)
+        recipe1.tags.add(kept, duplicate)
+        recipe2.tags.add(duplicate)
+
+        call_command('merge_duplicate_names', batch_size=1, stdout=io.StringIO())
+
+        tags = tag_model.objects.order_by('pk')
+        self.assertEqual([(tag.pk, tag.recipe_count) for tag in tags], [(kept.pk, 2), (other.pk, 0)])
+        self.assertEqual(list(recipe1.tags.all()), [kept])
+        self.assertEqual(list(recipe2.tags.all()), [kept])
+
+    def test_duplicates_merged_before_unique_constraint(self):
+        """Test the migrations normalize the names and merge the duplicates with their recipes"""
+        apps = self.migrate('0011_name_trigram_indexes')
+        user = apps.get_model('core', 'User').objects.create(email='test@test.com')
+        tag_model = apps.get_model('recipe', 'Tag')
+        kept = tag_model.objects.create(user=user, name='Vegan')
+        duplicate = tag_model.objects.create(user=user, name='VEGAN ')
+        recipe = apps.get_model('recipe', 'Recipe').objects.create(
+            user=user, title='Soup', time_minutes=5, price=5.00,
+        )
+        recipe.tags.add(duplicate)
+
+        apps = self.migrate('0013_unique_normalized_name')
+
+        tags = apps.get_model('recipe', 'Tag').objects.all()
+        self.assertEqual([(tag.pk, tag.normalized_name, tag.recipe_count) for tag in tags], [(kept.pk, 'vegan', 1)])
+        links = apps.get_model('recipe', 'Recipe').tags.through.objects.values_list('tag_id', flat=True)
+        self.assertEqual(list(links), [kept.pk])
+
+
+class TestProcessRecipeImages(TestCase):
+    """Test the command finishing the images left by the background workers"""
+
+    def setUp(self) -> None:
+        self.user = create_user()
+
+    def create_recipe(self, image_status, age):
+        return Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=5, price=5.00, image_status=image_status,
+            image_status_changed=timezone.now() - timedelta(seconds=age),
+        )
+
+    @patch('recipe.management.commands.process_recipe_images.process_recipe_image')
+    def test_only_stale_images_are_processed(self, process):
+        """Test images a live worker may still be processing are left alone"""
+        stale_pending = self.create_recipe(models.IMAGE_PENDING, 120)
+        stale_processing = self.create_recipe(models.IMAGE_PROCESSING, 120)
+        self.create_recipe(models.IMAGE_PROCESSING, 10)
+        self.create_recipe(models.IMAGE_FAILED, 120)
+
+        call_command('process_recipe_images', stale_after=60)
+
+        self.assertEqual(
+            sorted(call.args[0] for call in process.call_args_list), [stale_pending.id, stale_processing.id],
+        )
+
+    @patch('recipe.management.commands.process_recipe_images.process_recipe_image')
+    def test_retry_failed_images(self, process):
+        """Test --retry-failed processes the failed images whatever their age"""
+        failed = self.create_recipe(models.IMAGE_FAILED, 0)
+
+        call_command('process_recipe_images', retry_failed=True)
+
+        process.assert_called_once_with(failed.id)
+
+    @patch('recipe.images.process_recipe_image', side_effect=RuntimeError('boom'))
+    def test_worker_errors_are_logged(self, process):
+        """Test an error escaping the processing of a worker task is logged instead of lost in its future"""
+        with self.assertLogs('recipe.images', 'ERROR'):
+            _run(1)
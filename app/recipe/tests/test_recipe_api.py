@@ -1,19 +1,36 @@
+import io
+import json
 import os
 import tempfile
+import time
+from datetime import timedelta
+from unittest.mock import patch
 
-from django.test import TestCase
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
 from django.contrib.auth import get_user_model
 
-from rest_framework.test import APIClient
+from rest_framework.test import APIClient, APIRequestFactory
 from rest_framework import status
 from PIL import Image
 
-from recipe.models import Recipe, Tag, Ingredient
-from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
+from recipe.models import Recipe, RecipeImageUpload, Tag, Ingredient, UserDataVersion
+from recipe.caching import response_cache_stats
+from recipe.conditional import get_data_version
+from recipe.images import render_variants
+from recipe.uploads import receive_chunk
+from recipe.serializers import RecipeSerializer, RecipeDetailSerializer, TagSerializer
+from recipe.views import RecipeViewSet
 
 
 RECIPE_URL = reverse('recipe:recipe-list')
+RECIPE_BULK_URL = reverse('recipe:recipe-bulk-create')
 
 
 def image_upload_url(recipe_id):
@@ -83,7 +100,7 @@ class PrivateRecipeApiTests(TestCase):
         serializer = RecipeSerializer(recipes, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_recipe_limited_to_user(self):
         """Test only recipe for the authenticated user are returned"""
@@ -99,8 +116,8 @@ class PrivateRecipeApiTests(TestCase):
         serializer = RecipeSerializer(recipes, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_view_recipe_detail(self):
         """Test viewing recipe detail"""
@@ -174,6 +191,69 @@ class PrivateRecipeApiTests(TestCase):
         self.assertIn(ingredient1, ingredients)
         self.assertIn(ingredient2, ingredients)
 
+    def test_create_recipe_with_names(self):
+        """Test creating a recipe with tags and ingredients given by name creates only the missing ones"""
+        tag = sample_tag(user=self.user, name='Vegan')
+        other = get_user_model().objects.create_user(email='other@test.com', password='Test1234')
+        sample_ingredient(user=other, name='Tomato')
+        payload = {
+            'title': 'Tomato soup',
+            'tags': [{'name': 'vegan'}, {'name': 'Soup'}],
+            'ingredients': [{'name': 'Tomato'}, {'name': 'Basil'}],
+            'time_minutes': 30,
+            'price': 5.00
+        }
+        res = self.client.post(RECIPE_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=res.data['id'])
+        self.assertEqual(res.data['tags'][0], tag.id)
+        self.assertEqual(sorted(recipe.tags.values_list('name', flat=True)), ['Soup', 'Vegan'])
+        self.assertEqual(
+            sorted(recipe.ingredients.values_list('name', flat=True)),
+            ['Basil', 'Tomato']
+        )
+        self.assertFalse(recipe.ingredients.exclude(user=self.user).exists())
+
+    def test_create_recipe_with_invalid_spec(self):
+        """Test a tag given by neither id nor name is rejected"""
+        payload = {'title': 'Soup', 'tags': [{'title': 'Vegan'}], 'ingredients': [], 'time_minutes': 5, 'price': 1.00}
+        res = self.client.post(RECIPE_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('tags', res.data)
+
+    def test_create_recipe_with_other_users_tag(self):
+        """Test a recipe can't be linked to a tag of another user"""
+        other = get_user_model().objects.create_user(email='other@test.com', password='Test1234')
+        tag = sample_tag(user=other)
+        payload = {'title': 'Soup', 'tags': [tag.id], 'ingredients': [], 'time_minutes': 5, 'price': 1.00}
+        res = self.client.post(RECIPE_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('tags', res.data)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_validate_related_ids_in_one_query(self):
+        """Test the ids of many ingredients are validated with one query"""
+        ingredients = [sample_ingredient(user=self.user, name=f'Ingredient {i}') for i in range(50)]
+        tag = sample_tag(user=self.user)
+        payload = {
+            'title': 'Stew',
+            'tags': [tag.id],
+            'ingredients': [ingredient.id for ingredient in ingredients],
+            'time_minutes': 5,
+            'price': 1.00
+        }
+        request = APIRequestFactory().post(RECIPE_URL)
+        request.user = self.user
+        serializer = RecipeSerializer(data=payload, context={'request': request})
+
+        # tags, ingredients
+        with self.assertNumQueries(2):
+            self.assertTrue(serializer.is_valid())
+        self.assertEqual(serializer.validated_data['ingredients'], ingredients)
+
     def test_partial_update_recipe(self):
         """Test updating a recipe with patch"""
         recipe = sample_recipe(user=self.user)
@@ -213,6 +293,72 @@ class PrivateRecipeApiTests(TestCase):
         tags = recipe.tags.all()
         self.assertEqual(tags.count(), 0)
 
+    def test_filter_recipes_by_tags_no_duplicates(self):
+        """Test a recipe matching several of the given tags is returned once"""
+        recipe = sample_recipe(user=self.user)
+        tag1 = sample_tag(user=self.user, name='Vegan')
+        tag2 = sample_tag(user=self.user, name='Dessert')
+        recipe.tags.add(tag1, tag2)
+
+        res = self.client.get(RECIPE_URL, {'tags': f'{tag1.id},{tag2.id}'})
+
+        self.assertEqual([item['id'] for item in res.data['results']], [recipe.id])
+
+    def test_filter_recipes_matching_all_tags(self):
+        """Test match=all only returns recipes having every given tag"""
+        tag1 = sample_tag(user=self.user, name='Vegan')
+        tag2 = sample_tag(user=self.user, name='Dessert')
+        tag3 = sample_tag(user=self.user, name='Quick')
+        recipe1 = sample_recipe(user=self.user, title='Sorbet')
+        recipe1.tags.add(tag1, tag2, tag3)
+        recipe2 = sample_recipe(user=self.user, title='Salad')
+        recipe2.tags.add(tag1, tag3)
+
+        res = self.client.get(RECIPE_URL, {'tags': f'{tag1.id},{tag2.id},{tag2.id}', 'match': 'all'})
+
+        self.assertEqual([item['id'] for item in res.data['results']], [recipe1.id])
+
+    def test_filter_recipes_matching_all_tags_and_ingredients(self):
+        """Test match=all applies to both tags and ingredients"""
+        tag = sample_tag(user=self.user)
+        ingredient1 = sample_ingredient(user=self.user, name='Rice')
+        ingredient2 = sample_ingredient(user=self.user, name='Saffron')
+        recipe1 = sample_recipe(user=self.user, title='Tahchin')
+        recipe1.tags.add(tag)
+        recipe1.ingredients.add(ingredient1, ingredient2)
+        recipe2 = sample_recipe(user=self.user, title='Kateh')
+        recipe2.tags.add(tag)
+        recipe2.ingredients.add(ingredient1)
+
+        res = self.client.get(RECIPE_URL, {
+            'tags': f'{tag.id}',
+            'ingredients': f'{ingredient1.id},{ingredient2.id}',
+            'match': 'all',
+        })
+
+        self.assertEqual([item['id'] for item in res.data['results']], [recipe1.id])
+
+    def test_filter_recipes_invalid_match(self):
+        """Test an unknown match mode is rejected"""
+        res = self.client.get(RECIPE_URL, {'tags': '1', 'match': 'some'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_search_recipes(self):
+        """Test searching recipes by title, tag and ingredient names"""
+        curry = sample_recipe(user=self.user, title='Chicken curry')
+        stew = sample_recipe(user=self.user, title='Ghorme sabzi')
+        stew.ingredients.add(sample_ingredient(user=self.user, name='Chicken'))
+        stew.tags.add(sample_tag(user=self.user, name='Curry night'))
+        sample_recipe(user=self.user, title='Chicken soup')
+        other = get_user_model().objects.create_user(email='other@test.com', password='Test1234')
+        sample_recipe(user=other, title='Chicken curry')
+
+        res = self.client.get(RECIPE_URL, {'search': 'chicken curry'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(sorted(item['id'] for item in res.data['results']), [curry.id, stew.id])
+
 
 class RecipeImageUploadTest(TestCase):
 
@@ -226,6 +372,9 @@ class RecipeImageUploadTest(TestCase):
         self.recipe = sample_recipe(user=self.user)
 
     def tearDown(self) -> None:
+        self.recipe.refresh_from_db()
+        for name in self.recipe.image_variants.values():
+            default_storage.delete(name)
         self.recipe.image.delete()
 
     def test_upload_image_to_recipe(self):
@@ -242,6 +391,279 @@ class RecipeImageUploadTest(TestCase):
         self.assertIn('image', res.data)
         self.assertTrue(os.path.exists(self.recipe.image.path))
 
+    @override_settings(RECIPE_IMAGE_WORKERS=0)
+    def test_upload_image_generates_variants(self):
+        """Test resized variants are generated once the upload is committed"""
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.png') as ntf:
+            Image.new('RGBA', (1200, 800)).save(ntf, format='PNG')
+            ntf.seek(0)
+            with self.captureOnCommitCallbacks(execute=True):
+                res = self.client.post(url, {'image': ntf}, format='multipart')
+
+        self.assertEqual(res.data['image_status'], 'pending')
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_status, 'ready')
+        self.assertEqual(set(self.recipe.image_variants), {'thumbnail', 'medium', 'full'})
+        with default_storage.open(self.recipe.image_variants['thumbnail']) as thumbnail:
+            with Image.open(thumbnail) as img:
+                self.assertEqual(img.format, 'JPEG')
+                self.assertEqual(img.size, (150, 100))
+
+        res = self.client.get(reverse('recipe:recipe-image', args=[self.recipe.id]))
+
+        self.assertEqual(res.data['image_status'], 'ready')
+        self.assertTrue(res.data['image_variants']['medium'].startswith('http://testserver/media/'))
+
+    @override_settings(RECIPE_IMAGE_WORKERS=0)
+    def test_upload_replaced_by_full_variant(self):
+        """Test the upload and its EXIF are never served, the full variant replaces it once processed"""
+        img = Image.new('RGB', (40, 20))
+        exif = img.getexif()
+        exif[0x010F] = 'Camera maker'
+        source = io.BytesIO()
+        img.save(source, format='JPEG', exif=exif)
+        source.seek(0)
+        source.name = 'photo.jpg'
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post(image_upload_url(self.recipe.id), {'image': source}, format='multipart')
+            upload = Recipe.objects.get(pk=self.recipe.id).image.name
+
+        self.assertIsNone(res.data['image'])
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image.name, self.recipe.image_variants['full'])
+        self.assertFalse(default_storage.exists(upload))
+        with Image.open(self.recipe.image.path) as image:
+            self.assertEqual(len(image.getexif()), 0)
+        res = self.client.get(reverse('recipe:recipe-image', args=[self.recipe.id]))
+        self.assertEqual(res.data['image'], res.data['image_variants']['full'])
+
+    @override_settings(RECIPE_IMAGE_WORKERS=0)
+    def test_new_upload_replaces_variants(self):
+        """Test uploading another image removes the variants of the previous one"""
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            Image.new('RGB', (10, 10)).save(ntf, format='JPEG')
+            with self.captureOnCommitCallbacks(execute=True):
+                ntf.seek(0)
+                self.client.post(url, {'image': ntf}, format='multipart')
+            self.recipe.refresh_from_db()
+            old_image = self.recipe.image.name
+            old_variants = list(self.recipe.image_variants.values())
+            with self.captureOnCommitCallbacks(execute=True):
+                ntf.seek(0)
+                self.client.post(url, {'image': ntf}, format='multipart')
+
+        self.assertTrue(old_variants)
+        self.assertFalse(any(default_storage.exists(name) for name in old_variants))
+        default_storage.delete(old_image)
+
+    def test_variants_strip_exif(self):
+        """Test the variants are rotated by their EXIF orientation and carry no EXIF"""
+        img = Image.new('RGB', (40, 20))
+        exif = img.getexif()
+        exif[0x0112] = 6  # Orientation: rotate 90
+        exif[0x010F] = 'Camera maker'
+        source = io.BytesIO()
+        img.save(source, format='JPEG', exif=exif)
+        source.seek(0)
+
+        variants = render_variants(source)
+
+        with Image.open(io.BytesIO(variants['full'])) as full:
+            self.assertEqual(full.size, (20, 40))
+            self.assertEqual(len(full.getexif()), 0)
+
+    @override_settings(RECIPE_IMAGE_MAX_UPLOAD_SIZE=1024)
+    def test_upload_image_too_large(self):
+        """Test images over the size limit are refused and nothing is left on disk"""
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.png') as ntf:
+            Image.effect_noise((300, 300), 100).save(ntf, format='PNG')
+            ntf.seek(0)
+            res = self.client.post(url, {'image': ntf}, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.recipe.refresh_from_db()
+        self.assertFalse(self.recipe.image)
+
+    def test_upload_not_an_image(self):
+        """Test a file without an image signature is refused on its first chunk"""
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            ntf.write(b'not an image' * 100)
+            ntf.seek(0)
+            res = self.client.post(url, {'image': ntf}, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('image', res.data)
+
+    def test_chunked_upload(self):
+        """Test uploading an image in chunks and resuming after a misplaced chunk"""
+        url = reverse('recipe:recipe-upload-image-chunk', args=[self.recipe.id])
+        content = io.BytesIO()
+        Image.effect_noise((64, 64), 100).save(content, format='PNG')
+        content = content.getvalue()
+        total = len(content)
+        middle = total // 2
+
+        res = self.client.put(url, content[:middle], content_type='application/octet-stream',
+                              HTTP_CONTENT_RANGE=f'bytes 0-{middle - 1}/{total}')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertFalse(res.data['complete'])
+        upload_id = res.data['upload_id']
+        image_name = RecipeImageUpload.objects.get(pk=upload_id).name
+
+        res = self.client.put(f'{url}?upload_id={upload_id}', content[1:], content_type='application/octet-stream',
+                              HTTP_CONTENT_RANGE=f'bytes 1-{total - 1}/{total}')
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(res.data['offset'], middle)
+        res = self.client.get(url, {'upload_id': upload_id})
+        self.assertEqual(res.data['offset'], middle)
+
+        res = self.client.put(f'{url}?upload_id={upload_id}', content[middle:],
+                              content_type='application/octet-stream',
+                              HTTP_CONTENT_RANGE=f'bytes {middle}-{total - 1}/{total}')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.data['complete'])
+        self.assertEqual(res.data['image_status'], 'pending')
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image.name, image_name)
+        with open(self.recipe.image.path, 'rb') as image:
+            self.assertEqual(image.read(), content)
+
+    def test_chunked_upload_total_must_not_change(self):
+        """Test every chunk must announce the total size of the first one"""
+        url = reverse('recipe:recipe-upload-image-chunk', args=[self.recipe.id])
+        res = self.client.put(url, b'\xff\xd8\xff' + b'0' * 97, content_type='application/octet-stream',
+                              HTTP_CONTENT_RANGE='bytes 0-99/300')
+        upload_id = res.data['upload_id']
+
+        res = self.client.put(f'{url}?upload_id={upload_id}', b'0' * 100, content_type='application/octet-stream',
+                              HTTP_CONTENT_RANGE='bytes 100-199/200')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(url, {'upload_id': upload_id}).data['offset'], 100)
+        with self.captureOnCommitCallbacks(execute=True):
+            RecipeImageUpload.objects.get(pk=upload_id).delete()
+
+    def test_chunked_upload_written_in_place(self):
+        """Test the chunks are appended to the final file of the image, which the completed upload leaves"""
+        url = reverse('recipe:recipe-upload-image-chunk', args=[self.recipe.id])
+        content = io.BytesIO()
+        Image.new('RGB', (10, 10)).save(content, format='JPEG')
+        content = content.getvalue()
+        middle = len(content) // 2
+        res = self.client.put(url, content[:middle], content_type='application/octet-stream',
+                              HTTP_CONTENT_RANGE=f'bytes 0-{middle - 1}/{len(content)}')
+        upload = RecipeImageUpload.objects.get(pk=res.data['upload_id'])
+        self.assertRegex(upload.name, r'^uploads/recipe/[0-9a-f-]{36}\.jpg$')
+        with default_storage.open(upload.name) as image:
+            self.assertEqual(image.read(), content[:middle])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(f'{url}?upload_id={upload.id.hex}', content[middle:],
+                            content_type='application/octet-stream',
+                            HTTP_CONTENT_RANGE=f'bytes {middle}-{len(content) - 1}/{len(content)}')
+
+        self.assertFalse(RecipeImageUpload.objects.exists())
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image.name, upload.name)
+        self.assertTrue(default_storage.exists(upload.name))
+
+    def test_chunked_upload_resumes_after_unrecorded_bytes(self):
+        """Test bytes written by a chunk whose transaction didn't commit are overwritten by the next chunk"""
+        url = reverse('recipe:recipe-upload-image-chunk', args=[self.recipe.id])
+        res = self.client.put(url, b'\xff\xd8\xff' + b'0' * 97, content_type='application/octet-stream',
+                              HTTP_CONTENT_RANGE='bytes 0-99/300')
+        upload = RecipeImageUpload.objects.get(pk=res.data['upload_id'])
+        with default_storage.open(upload.name, 'ab') as image:
+            image.write(b'x' * 50)
+
+        self.client.put(f'{url}?upload_id={upload.id.hex}', b'1' * 100, content_type='application/octet-stream',
+                        HTTP_CONTENT_RANGE='bytes 100-199/300')
+
+        with default_storage.open(upload.name) as image:
+            self.assertEqual(image.read()[100:], b'1' * 100)
+        with self.captureOnCommitCallbacks(execute=True):
+            upload.delete()
+        self.assertFalse(default_storage.exists(upload.name))
+
+    def test_chunked_upload_failed_first_chunk_leaves_no_file(self):
+        """Test the file of a new upload is removed when its row can't be saved"""
+        created = []
+
+        def save(upload, *args, **kwargs):
+            created.append(upload.name)
+            raise DatabaseError('gone')
+
+        with patch.object(RecipeImageUpload, 'save', save), self.assertRaises(DatabaseError):
+            receive_chunk(self.recipe, None, 'bytes 0-99/300', 100, io.BytesIO(b'\xff\xd8\xff' + b'0' * 97))
+
+        self.assertTrue(created[0])
+        self.assertFalse(default_storage.exists(created[0]))
+
+    def test_chunked_upload_deleted_with_recipe(self):
+        """Test deleting a recipe removes the files of its unfinished uploads"""
+        recipe = sample_recipe(user=self.user)
+        url = reverse('recipe:recipe-upload-image-chunk', args=[recipe.id])
+        res = self.client.put(url, b'\xff\xd8\xff' + b'0' * 97, content_type='application/octet-stream',
+                              HTTP_CONTENT_RANGE='bytes 0-99/300')
+        name = RecipeImageUpload.objects.get(pk=res.data['upload_id']).name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+
+        self.assertFalse(default_storage.exists(name))
+
+    def test_purge_abandoned_uploads(self):
+        """Test uploads older than the expiry are deleted with their file, younger ones are kept"""
+        url = reverse('recipe:recipe-upload-image-chunk', args=[self.recipe.id])
+        names = []
+        for _ in range(2):
+            res = self.client.put(url, b'\xff\xd8\xff' + b'0' * 97, content_type='application/octet-stream',
+                                  HTTP_CONTENT_RANGE='bytes 0-99/300')
+            names.append(RecipeImageUpload.objects.get(pk=res.data['upload_id']).name)
+        RecipeImageUpload.objects.filter(name=names[0]).update(created=timezone.now() - timedelta(days=2))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('purge_image_uploads', older_than=24 * 60 * 60, stdout=io.StringIO())
+
+        self.assertFalse(default_storage.exists(names[0]))
+        self.assertEqual(list(RecipeImageUpload.objects.values_list('name', flat=True)), [names[1]])
+        with self.captureOnCommitCallbacks(execute=True):
+            RecipeImageUpload.objects.all().delete()
+
+    def test_chunked_upload_invalid_content_length(self):
+        """Test a Content-Length that isn't a number is a validation error"""
+        url = reverse('recipe:recipe-upload-image-chunk', args=[self.recipe.id])
+
+        res = self.client.put(url, b'\xff\xd8\xff' + b'0' * 97, content_type='application/octet-stream',
+                              HTTP_CONTENT_RANGE='bytes 0-99/300', CONTENT_LENGTH='lots')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Content-Length', res.data)
+
+    def test_chunked_upload_rejects_non_image(self):
+        """Test the first chunk of a chunked upload must be an image"""
+        url = reverse('recipe:recipe-upload-image-chunk', args=[self.recipe.id])
+
+        res = self.client.put(url, b'0' * 100, content_type='application/octet-stream',
+                              HTTP_CONTENT_RANGE='bytes 0-99/200')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(RECIPE_IMAGE_MAX_UPLOAD_SIZE=100)
+    def test_chunked_upload_too_large(self):
+        """Test a chunked upload is refused from its announced total size"""
+        url = reverse('recipe:recipe-upload-image-chunk', args=[self.recipe.id])
+
+        res = self.client.put(url, b'\xff\xd8\xff' + b'0' * 97, content_type='application/octet-stream',
+                              HTTP_CONTENT_RANGE='bytes 0-99/1000')
+
+        self.assertEqual(res.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
     def test_upload_image_bad_request(self):
         """Test uploading an invalid image"""
         url = image_upload_url(self.recipe.id)
@@ -267,9 +689,9 @@ class RecipeImageUploadTest(TestCase):
         serializer2 = RecipeSerializer(recipe2)
         serializer3 = RecipeSerializer(recipe3)
 
-        self.assertIn(serializer1.data, res.data)
-        self.assertIn(serializer2.data, res.data)
-        self.assertNotIn(serializer3.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertIn(serializer2.data, res.data['results'])
+        self.assertNotIn(serializer3.data, res.data['results'])
 
     def test_filter_recipes_by_ingredients(self):
         """Test returning recipes with specific ingredients"""
@@ -289,6 +711,693 @@ class RecipeImageUploadTest(TestCase):
         serializer2 = RecipeSerializer(recipe2)
         serializer3 = RecipeSerializer(recipe3)
 
-        self.assertIn(serializer1.data, res.data)
-        self.assertIn(serializer2.data, res.data)
-        self.assertNotIn(serializer3.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertIn(serializer2.data, res.data['results'])
+        self.assertNotIn(serializer3.data, res.data['results'])
+
+
+class RecipeQueryCountTests(TestCase):
+    """Pin the number of queries per recipe endpoint so N+1 regressions fail"""
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='test@test.com',
+            password='Test1234'
+        )
+        self.client.force_authenticate(self.user)
+
+    def create_recipes(self, count):
+        """Create recipes that each have a tag and an ingredient"""
+        recipes = []
+        # Tag and ingredient names are unique per user
+        start = Recipe.objects.count()
+        for i in range(start, start + count):
+            recipe = sample_recipe(user=self.user, title=f'Recipe {i}')
+            recipe.tags.add(sample_tag(user=self.user, name=f'Tag {i}'))
+            recipe.ingredients.add(sample_ingredient(user=self.user, name=f'Ingredient {i}'))
+            recipes.append(recipe)
+        return recipes
+
+    def test_list_query_count_is_constant(self):
+        """Test listing recipes uses the same number of queries for any number of recipes"""
+        self.create_recipes(2)
+        # data version, recipes, tags, ingredients
+        with self.assertNumQueries(4):
+            res = self.client.get(RECIPE_URL)
+        self.assertEqual(len(res.data['results']), 2)
+
+        self.create_recipes(10)
+        with self.assertNumQueries(4):
+            res = self.client.get(RECIPE_URL)
+        self.assertEqual(len(res.data['results']), 12)
+
+    def test_list_renders_prefetched_ids(self):
+        """Test the prefetched list still renders related ids"""
+        recipe = self.create_recipes(1)[0]
+
+        res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res.data['results'][0]['tags'], [recipe.tags.get().id])
+        self.assertEqual(res.data['results'][0]['ingredients'], [recipe.ingredients.get().id])
+
+    def test_detail_query_count(self):
+        """Test retrieving a recipe uses a fixed number of queries"""
+        recipe = self.create_recipes(1)[0]
+        recipe.tags.add(sample_tag(user=self.user, name='Extra'))
+
+        # data version, recipe, tags, ingredients
+        with self.assertNumQueries(4):
+            res = self.client.get(detail_url(recipe.id))
+        self.assertEqual(len(res.data['tags']), 2)
+
+
+class RecipeStreamingListTests(TestCase):
+    """Test streaming big pages of recipes"""
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='test@test.com',
+            password='Test1234'
+        )
+        self.client.force_authenticate(self.user)
+        for i in range(3):
+            sample_recipe(user=self.user, title=f'Recipe {i}')
+
+    def test_stream_big_page(self):
+        """Test a page over the threshold is streamed with the same body"""
+        res = self.client.get(RECIPE_URL)
+        self.assertFalse(res.streaming)
+
+        with override_settings(API_STREAMING_MIN_ITEMS=2):
+            streamed = self.client.get(RECIPE_URL, HTTP_CACHE_CONTROL='no-cache')
+
+        self.assertEqual(streamed.status_code, status.HTTP_200_OK)
+        self.assertTrue(streamed.streaming)
+        self.assertEqual(streamed['Content-Type'], 'application/json')
+        self.assertEqual(streamed['X-Accel-Buffering'], 'no')
+        self.assertNotIn('X-Accel-Buffering', res)
+        self.assertEqual(b''.join(streamed.streaming_content), res.content)
+
+    @override_settings(API_STREAMING_MIN_ITEMS=2)
+    def test_stream_runs_no_queries(self):
+        """Test every query runs before the response is returned, streaming only renders"""
+        for i, recipe in enumerate(Recipe.objects.all()):
+            recipe.tags.add(sample_tag(user=self.user, name=f'Tag {i}'))
+
+        for params in ({}, {'expand': 'tags,ingredients'}):
+            with patch.object(RecipeViewSet, 'use_rows', return_value=False):
+                model_streamed = self.client.get(RECIPE_URL, params, HTTP_CACHE_CONTROL='no-cache')
+            rows_streamed = self.client.get(RECIPE_URL, params, HTTP_CACHE_CONTROL='no-cache')
+
+            for streamed in (model_streamed, rows_streamed):
+                self.assertTrue(streamed.streaming)
+                with self.assertNumQueries(0):
+                    content = b''.join(streamed.streaming_content)
+                self.assertEqual(len(json.loads(content)['results']), 3)
+
+
+class RecipeRowSerializerTests(TestCase):
+    """Test the rows read path renders the same bytes as the model serializers"""
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='test@test.com',
+            password='Test1234'
+        )
+        self.client.force_authenticate(self.user)
+        tags = [sample_tag(user=self.user, name=name) for name in ('Vegan', 'Dessert')]
+        ingredients = [sample_ingredient(user=self.user, name=name) for name in ('Salt', 'Crème fraîche')]
+        self.recipe = sample_recipe(user=self.user, title='Soup', price=5.5, link='https://example.com')
+        self.recipe.tags.add(*tags)
+        self.recipe.ingredients.add(*ingredients)
+        sample_recipe(user=self.user, title='Toast')
+
+    def assertSameContent(self, url, params=None):
+        res = self.client.get(url, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        with patch.object(RecipeViewSet, 'use_rows', return_value=False):
+            expected = self.client.get(url, params, HTTP_CACHE_CONTROL='no-cache')
+        self.assertEqual(res.content, expected.content)
+
+    def test_list(self):
+        """Test the recipe list, also with sparse fields and expanded tags"""
+        self.assertSameContent(RECIPE_URL)
+        self.assertSameContent(RECIPE_URL, {'fields': 'id,tags,price', 'expand': 'tags'})
+
+    def test_detail(self):
+        """Test the recipe detail"""
+        self.assertSameContent(detail_url(self.recipe.id))
+
+    def test_list_without_queryset_rows(self):
+        """Test the list reads rows instead of model instances"""
+        with patch.object(Recipe, '__init__', side_effect=AssertionError('model instance created')):
+            res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_browsable_api(self):
+        """Test the browsable API keeps rendering with the model serializer"""
+        res = self.client.get(RECIPE_URL, HTTP_ACCEPT='text/html')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+
+class RecipeResponseCacheTests(TestCase):
+    """Test the per user cache of recipe list responses"""
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='test@test.com',
+            password='Test1234'
+        )
+        self.client.force_authenticate(self.user)
+        self.tag1 = sample_tag(user=self.user, name='Vegan')
+        self.tag2 = sample_tag(user=self.user, name='Dessert')
+        self.recipe = sample_recipe(user=self.user)
+        self.recipe.tags.add(self.tag1)
+        response_cache_stats.reset()
+
+    def test_cached_list(self):
+        """Test the second request of a list is answered from the cache"""
+        res = self.client.get(RECIPE_URL)
+        self.assertEqual(res['X-Cache'], 'MISS')
+
+        # data version
+        with self.assertNumQueries(1):
+            cached = self.client.get(RECIPE_URL)
+
+        self.assertEqual(cached['X-Cache'], 'HIT')
+        self.assertEqual(cached.content, res.content)
+        self.assertEqual(cached['ETag'], res['ETag'])
+        self.assertEqual(response_cache_stats.snapshot(), {'hits': 1, 'misses': 1})
+
+    def test_keyed_by_host(self):
+        """Test a page cached through one host isn't served with its links to another"""
+        sample_recipe(user=self.user, title='Second')
+        with override_settings(ALLOWED_HOSTS=['api.example.com', 'testserver']):
+            self.client.get(RECIPE_URL, {'page_size': 1}, HTTP_HOST='api.example.com')
+
+            res = self.client.get(RECIPE_URL, {'page_size': 1})
+            secure = self.client.get(RECIPE_URL, {'page_size': 1}, secure=True)
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertTrue(res.data['next'].startswith('http://testserver/'))
+        self.assertEqual(secure['X-Cache'], 'MISS')
+
+    def test_normalized_query(self):
+        """Test the order and repetitions of filtered ids share a cached response"""
+        self.client.get(RECIPE_URL, {'tags': f'{self.tag2.id},{self.tag1.id}'})
+
+        res = self.client.get(RECIPE_URL, {'tags': f'{self.tag1.id},{self.tag2.id},{self.tag1.id}'})
+
+        self.assertEqual(res['X-Cache'], 'HIT')
+
+    def test_invalidated_by_writes(self):
+        """Test changing the recipes of a user invalidates their cached responses"""
+        self.client.get(RECIPE_URL)
+
+        self.recipe.tags.add(self.tag2)
+        res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(len(res.data['results'][0]['tags']), 2)
+
+    def test_not_shared_between_users(self):
+        """Test a user never gets the cached responses of another"""
+        self.client.get(RECIPE_URL)
+        other = get_user_model().objects.create_user(email='other@test.com', password='Test1234')
+        self.client.force_authenticate(other)
+
+        res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(res.data['results'], [])
+
+    def test_cache_control(self):
+        """Test no-cache skips the lookup and no-store the whole cache"""
+        self.client.get(RECIPE_URL)
+
+        res = self.client.get(RECIPE_URL, HTTP_CACHE_CONTROL='no-cache')
+        self.assertEqual(res['X-Cache'], 'MISS')
+        res = self.client.get(RECIPE_URL, HTTP_CACHE_CONTROL='no-store')
+        self.assertNotIn('X-Cache', res)
+
+    @override_settings(RESPONSE_CACHE='')
+    def test_disabled(self):
+        """Test the cache can be turned off"""
+        self.client.get(RECIPE_URL)
+        res = self.client.get(RECIPE_URL)
+
+        self.assertNotIn('X-Cache', res)
+
+
+@override_settings(DATABASE_REPLICAS=['default'], DATABASE_REPLICA_LAG=5)
+class RecipeReplicaReadTests(TestCase):
+    """Test the reads of the recipe endpoints sent to the read replicas"""
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='test@test.com',
+            password='Test1234'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = sample_recipe(user=self.user)
+        UserDataVersion.objects.update(modified=timezone.now() - timedelta(minutes=1))
+
+    def get(self, url, **kwargs):
+        """Send a GET request, returning the response and whether a replica was picked"""
+        with patch('core.db.routers.random.choice', return_value='default') as choice:
+            res = self.client.get(url, HTTP_CACHE_CONTROL='no-cache', **kwargs)
+        return res, choice.called
+
+    def test_reads_from_replica(self):
+        """Test list and retrieve read from a replica"""
+        res, replica = self.get(RECIPE_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(replica)
+
+        res, replica = self.get(detail_url(self.recipe.id))
+        self.assertEqual(res.data['id'], self.recipe.id)
+        self.assertTrue(replica)
+
+    def test_reads_own_writes_from_primary(self):
+        """Test a user reads from the primary right after changing their recipes"""
+        self.client.patch(detail_url(self.recipe.id), {'title': 'Changed'})
+
+        res, replica = self.get(detail_url(self.recipe.id))
+
+        self.assertFalse(replica)
+        self.assertEqual(res.data['title'], 'Changed')
+
+    def test_writes_go_to_primary(self):
+        """Test write requests never read from a replica"""
+        with patch('core.db.routers.random.choice') as choice:
+            self.client.post(RECIPE_URL, {'title': 'New', 'time_minutes': 5, 'price': '1.00'})
+
+        choice.assert_not_called()
+
+    def test_reads_data_version_once(self):
+        """Test the replica choice, the validators and the cache share one read of the data version"""
+        with patch('recipe.conditional.get_data_version', wraps=get_data_version) as read:
+            self.get(detail_url(self.recipe.id))
+
+        read.assert_called_once_with(self.user.pk)
+
+    def test_replica_response_not_cached_or_validated(self):
+        """Test a response read from a replica gets no ETag and isn't cached, it may be older than the version"""
+        with patch('core.db.routers.random.choice', return_value='default'):
+            res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertNotIn('ETag', res)
+        with override_settings(DATABASE_REPLICAS=[]):
+            res = self.client.get(RECIPE_URL)
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertIn('ETag', res)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas(self):
+        """Test everything is read from the primary when there are no replicas"""
+        _, replica = self.get(RECIPE_URL)
+
+        self.assertFalse(replica)
+
+
+class RecipeFieldsetTests(TestCase):
+    """Test ?fields= and ?expand= of the recipe endpoints"""
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='test@test.com',
+            password='Test1234'
+        )
+        self.client.force_authenticate(self.user)
+        self.tag = sample_tag(user=self.user)
+        self.recipe = sample_recipe(user=self.user)
+        self.recipe.tags.add(self.tag)
+        self.tag.refresh_from_db()
+
+    def test_list_sparse_fields(self):
+        """Test listing only some fields reads neither the other columns nor the related objects"""
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(RECIPE_URL, {'fields': 'id,title'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'], [{'id': self.recipe.id, 'title': self.recipe.title}])
+        # data version, recipes
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn('price', queries[1]['sql'])
+
+    def test_list_expand_tags(self):
+        """Test expanded tags are nested and the ingredients not fetched when left out"""
+        with self.assertNumQueries(3):
+            res = self.client.get(RECIPE_URL, {'fields': 'id,tags', 'expand': 'tags'})
+
+        self.assertEqual(res.data['results'][0]['tags'], [TagSerializer(self.tag).data])
+        self.assertNotIn('ingredients', res.data['results'][0])
+
+    def test_detail_sparse_fields(self):
+        """Test retrieving only some fields of a recipe"""
+        res = self.client.get(detail_url(self.recipe.id), {'fields': 'title,tags'})
+
+        self.assertEqual(set(res.data), {'title', 'tags'})
+        self.assertEqual(res.data['tags'][0]['name'], self.tag.name)
+
+    def test_unknown_field(self):
+        """Test asking for a field that doesn't exist is rejected"""
+        res = self.client.get(RECIPE_URL, {'fields': 'id,owner'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('fields', res.data)
+
+
+class RecipePaginationTests(TestCase):
+    """Test cursor pagination of the recipe list"""
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='test@test.com',
+            password='Test1234'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_pages_follow_cursor(self):
+        """Test walking the pages returns every recipe once, newest first"""
+        recipes = [sample_recipe(user=self.user, title=f'Recipe {i}') for i in range(5)]
+
+        res = self.client.get(RECIPE_URL, {'page_size': 2})
+        ids = [recipe['id'] for recipe in res.data['results']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            ids += [recipe['id'] for recipe in res.data['results']]
+
+        self.assertEqual(ids, [recipe.id for recipe in reversed(recipes)])
+
+    def test_cursor_is_stable_after_insert(self):
+        """Test a new recipe doesn't shift the next page"""
+        recipes = [sample_recipe(user=self.user, title=f'Recipe {i}') for i in range(4)]
+        res = self.client.get(RECIPE_URL, {'page_size': 2})
+        sample_recipe(user=self.user, title='New recipe')
+
+        res = self.client.get(res.data['next'])
+
+        self.assertEqual([recipe['id'] for recipe in res.data['results']], [recipes[1].id, recipes[0].id])
+
+    @override_settings(API_MAX_PAGE_SIZE=3)
+    def test_page_size_is_capped(self):
+        """Test the requested page size can't exceed the configured maximum"""
+        for i in range(5):
+            sample_recipe(user=self.user, title=f'Recipe {i}')
+
+        res = self.client.get(RECIPE_URL, {'page_size': 100})
+
+        self.assertEqual(len(res.data['results']), 3)
+
+    def test_no_count_query(self):
+        """Test listing recipes doesn't count the whole table"""
+        sample_recipe(user=self.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(RECIPE_URL)
+
+        self.assertFalse(any('COUNT(' in query['sql'].upper() for query in queries))
+
+
+class RecipeBulkCreateTests(TestCase):
+    """Test creating many recipes with one request"""
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='test@test.com',
+            password='Test1234'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_create_recipes(self):
+        """Test creating recipes with their tags and ingredients"""
+        tag = sample_tag(user=self.user)
+        ingredient1 = sample_ingredient(user=self.user, name='Rice')
+        ingredient2 = sample_ingredient(user=self.user, name='Saffron')
+        payload = [
+            {'title': 'Tahchin', 'time_minutes': 90, 'price': 12.00,
+             'tags': [tag.id], 'ingredients': [ingredient1.id, ingredient2.id]},
+            {'title': 'Kateh', 'time_minutes': 30, 'price': 3.00,
+             'tags': [tag.id, tag.id], 'ingredients': [ingredient1.id]},
+        ]
+
+        res = self.client.post(RECIPE_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(res.data), 2)
+        recipes = Recipe.objects.filter(user=self.user).order_by('id')
+        self.assertEqual([recipe.title for recipe in recipes], ['Tahchin', 'Kateh'])
+        self.assertEqual(list(recipes[0].ingredients.order_by('id')), [ingredient1, ingredient2])
+        self.assertEqual(res.data[1]['tags'], [tag.id])
+        tag.refresh_from_db()
+        ingredient1.refresh_from_db()
+        self.assertEqual(tag.recipe_count, 2)
+        self.assertEqual(ingredient1.recipe_count, 2)
+
+    def test_bulk_create_recipes_with_names(self):
+        """Test the names of all the recipes are resolved with one lookup and one insert"""
+        payload = [
+            {'title': 'Tahchin', 'time_minutes': 90, 'price': 12.00,
+             'tags': [{'name': 'Persian'}], 'ingredients': [{'name': 'Rice'}, {'name': 'Saffron'}]},
+            {'title': 'Kateh', 'time_minutes': 30, 'price': 3.00,
+             'tags': [{'name': 'persian'}], 'ingredients': [{'name': 'rice'}]},
+        ]
+
+        res = self.client.post(RECIPE_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data[0]['tags'], res.data[1]['tags'])
+        self.assertEqual(Ingredient.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(Ingredient.objects.get(normalized_name='rice').recipe_count, 2)
+
+    def test_bulk_create_errors_per_item(self):
+        """Test an invalid item fails the whole request and reports where the error is"""
+        payload = [
+            {'title': 'Soup', 'time_minutes': 10, 'price': 2.00, 'tags': [], 'ingredients': []},
+            {'title': '', 'time_minutes': 10, 'price': 2.00, 'tags': [], 'ingredients': []},
+        ]
+
+        res = self.client.post(RECIPE_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn('title', res.data[1])
+        self.assertFalse(Recipe.objects.exists())
+
+    @override_settings(API_MAX_BULK_SIZE=1)
+    def test_bulk_create_size_limit(self):
+        """Test lists longer than the configured maximum are rejected"""
+        payload = [
+            {'title': f'Soup {i}', 'time_minutes': 10, 'price': 2.00, 'tags': [], 'ingredients': []}
+            for i in range(2)
+        ]
+
+        res = self.client.post(RECIPE_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Recipe.objects.exists())
+
+
+class RecipeBulkUpdateTests(TestCase):
+    """Test updating many recipes with one request"""
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='test@test.com',
+            password='Test1234'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_partial_update_recipes(self):
+        """Test patching the titles and tags of recipes, the recipe counts follow"""
+        tag1 = sample_tag(user=self.user, name='Vegan')
+        tag2 = sample_tag(user=self.user, name='Dessert')
+        recipe1 = sample_recipe(user=self.user, title='Soup')
+        recipe2 = sample_recipe(user=self.user, title='Cake')
+        recipe1.tags.add(tag1)
+        recipe2.tags.add(tag1)
+        payload = [
+            {'id': recipe1.id, 'title': 'Tomato soup'},
+            {'id': recipe2.id, 'tags': [tag2.id, {'name': 'Sweet'}]},
+        ]
+
+        res = self.client.patch(RECIPE_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        recipe1.refresh_from_db()
+        recipe2.refresh_from_db()
+        self.assertEqual(recipe1.title, 'Tomato soup')
+        self.assertEqual(recipe2.title, 'Cake')
+        self.assertEqual(list(recipe1.tags.all()), [tag1])
+        self.assertEqual(set(recipe2.tags.values_list('name', flat=True)), {'Dessert', 'Sweet'})
+        self.assertEqual(res.data[1]['tags'], list(recipe2.tags.order_by('id').values_list('id', flat=True)))
+        tag1.refresh_from_db()
+        tag2.refresh_from_db()
+        self.assertEqual(tag1.recipe_count, 1)
+        self.assertEqual(tag2.recipe_count, 1)
+
+    def test_bulk_update_recipes(self):
+        """Test a PUT replaces every field of the recipes"""
+        recipe = sample_recipe(user=self.user, title='Soup')
+        recipe.tags.add(sample_tag(user=self.user))
+        payload = [{'id': recipe.id, 'title': 'Stew', 'time_minutes': 45, 'price': 7.00,
+                    'tags': [], 'ingredients': []}]
+
+        res = self.client.put(RECIPE_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        recipe.refresh_from_db()
+        self.assertEqual((recipe.title, recipe.time_minutes), ('Stew', 45))
+        self.assertFalse(recipe.tags.exists())
+
+        res = self.client.put(RECIPE_BULK_URL, [{'id': recipe.id, 'title': 'Broth'}], format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('time_minutes', res.data[0])
+
+    def test_bulk_update_errors_per_item(self):
+        """Test unknown, missing, repeated ids and invalid fields are reported per item and nothing is updated"""
+        other_user = get_user_model().objects.create_user('other@test.com', 'Test1234')
+        recipe = sample_recipe(user=self.user, title='Soup')
+        other_recipe = sample_recipe(user=other_user)
+        payload = [
+            {'id': recipe.id, 'title': 'Stew'},
+            {'id': other_recipe.id, 'title': 'Mine'},
+            {'title': 'No id'},
+            {'id': recipe.id, 'title': ''},
+        ]
+
+        res = self.client.patch(RECIPE_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn('id', res.data[1])
+        self.assertIn('id', res.data[2])
+        self.assertEqual(set(res.data[3]), {'id', 'title'})
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'Soup')
+
+    def test_bulk_update_queries(self):
+        """Test the queries of a bulk update don't grow with the number of recipes"""
+        tags = [sample_tag(user=self.user, name=f'Tag {i}') for i in range(10)]
+
+        def update(count):
+            recipes = [sample_recipe(user=self.user, title=f'Recipe {i}') for i in range(count)]
+            payload = [{'id': recipe.id, 'title': 'Updated', 'tags': [tags[i].id]} for i, recipe in enumerate(recipes)]
+            with CaptureQueriesContext(connection) as queries:
+                res = self.client.patch(RECIPE_BULK_URL, payload, format='json')
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            return len(queries)
+
+        self.assertEqual(update(2), update(10))
+
+
+class RecipeConditionalRequestTests(TestCase):
+    """Test ETag handling of the recipe endpoints"""
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='test@test.com',
+            password='Test1234'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = sample_recipe(user=self.user)
+
+    def test_list_not_modified(self):
+        """Test a matching ETag is answered with 304 without querying the recipes"""
+        res = self.client.get(RECIPE_URL)
+        self.assertIn('ETag', res)
+
+        # Only the data version is read
+        with self.assertNumQueries(1):
+            res = self.client.get(RECIPE_URL, HTTP_IF_NONE_MATCH=res['ETag'])
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res.content, b'')
+
+    def test_detail_not_modified(self):
+        """Test the detail is answered with 304 when nothing changed"""
+        url = detail_url(self.recipe.id)
+        res = self.client.get(url)
+
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=res['ETag'])
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_etag_differs_by_host(self):
+        """Test responses with absolute links to another scheme or host don't share an ETag"""
+        res = self.client.get(RECIPE_URL)
+
+        with override_settings(ALLOWED_HOSTS=['api.example.com', 'testserver']):
+            other_host = self.client.get(RECIPE_URL, HTTP_HOST='api.example.com', HTTP_IF_NONE_MATCH=res['ETag'])
+        secure = self.client.get(RECIPE_URL, secure=True, HTTP_IF_NONE_MATCH=res['ETag'])
+
+        self.assertEqual(other_host.status_code, status.HTTP_200_OK)
+        self.assertEqual(secure.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(other_host['ETag'], res['ETag'])
+
+    def test_write_in_same_second_changes_response(self):
+        """Test a write in the second of a read isn't answered with a 304 of the stale response"""
+        res = self.client.get(RECIPE_URL)
+        self.assertNotIn('Last-Modified', res)
+        if_modified_since = http_date(time.time() + 1)
+
+        sample_recipe(user=self.user, title='Second recipe')
+        res = self.client.get(RECIPE_URL, HTTP_IF_NONE_MATCH=res['ETag'], HTTP_IF_MODIFIED_SINCE=if_modified_since)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 2)
+
+    def test_data_version_created_with_user(self):
+        """Test reads don't create the data version, users have one from their creation"""
+        other = get_user_model().objects.create_user(email='other@test.com', password='Test1234')
+
+        self.assertTrue(UserDataVersion.objects.filter(user=other).exists())
+
+    def test_write_changes_etag(self):
+        """Test writes to recipes and their tags invalidate the ETag"""
+        etag = self.client.get(RECIPE_URL)['ETag']
+
+        self.recipe.tags.add(sample_tag(user=self.user))
+        res = self.client.get(RECIPE_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+
+    def test_etag_differs_per_query(self):
+        """Test different query params of the list have different ETags"""
+        etag = self.client.get(RECIPE_URL)['ETag']
+
+        res = self.client.get(RECIPE_URL, {'page_size': 1}, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_etag_differs_per_user(self):
+        """Test a user can't get a 304 with the ETag of another user"""
+        etag = self.client.get(RECIPE_URL)['ETag']
+        other = get_user_model().objects.create_user(email='other@test.com', password='Test1234')
+        self.client.force_authenticate(other)
+
+        res = self.client.get(RECIPE_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_deleting_user_with_recipes(self):
+        """Test deleting a user doesn't recreate its data version"""
+        self.user.delete()
+
+        self.assertFalse(UserDataVersion.objects.exists())
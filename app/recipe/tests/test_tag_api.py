@@ -1,4 +1,8 @@
+from unittest.mock import patch
+
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 
@@ -8,6 +12,7 @@ from rest_framework import status
 from ..models import Tag, Recipe
 # from recipe.models import Tag
 from ..serializers import TagSerializer
+from ..views import TagViewSet
 
 
 TAG_URL = reverse('recipe:tag-list')
@@ -50,7 +55,7 @@ class PrivateTagApiTests(TestCase):
         serializer = TagSerializer(tags, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_tags_limited_to_user(self):
         """Test that tags returned are for the authenticated user"""
@@ -61,8 +66,8 @@ class PrivateTagApiTests(TestCase):
         res = self.client.get(TAG_URL)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]['name'], tag.name)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['name'], tag.name)
 
     def test_create_tag_successful(self):
         """Test creating a new tag"""
@@ -77,6 +82,17 @@ class PrivateTagApiTests(TestCase):
         self.assertTrue(exists)
         self.assertEqual(res.status_code, status.HTTP_201_CREATED)
 
+    def test_create_tag_existing_name(self):
+        """Test creating a tag whose name only differs by case and whitespace returns the existing tag"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        Tag.objects.create(user=create_user('other@test.com'), name='vegan')
+
+        res = self.client.post(TAG_URL, {'name': ' VEGAN '})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['id'], tag.id)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
+
     def test_create_tag_invalid(self):
         """Test creating a new tag with invalid payload"""
         payload = {'name': ''}
@@ -84,6 +100,14 @@ class PrivateTagApiTests(TestCase):
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_create_tag_normalized_name_too_long(self):
+        """Test a name that fits but grows past the limit once normalized ("ß" becomes "ss") is refused"""
+        res = self.client.post(TAG_URL, {'name': 'ß' * 255})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('name', res.data)
+        self.assertFalse(Tag.objects.exists())
+
     def test_retrieve_tags_assigned_to_recipe(self):
         """Test filtering tags by those assigned to recipe"""
         tag1 = Tag.objects.create(user=self.user, name='Breakfast')
@@ -100,11 +124,12 @@ class PrivateTagApiTests(TestCase):
             TAG_URL,
             {'assigned_only': 1}
         )
+        tag1.refresh_from_db()
         serializer1 = TagSerializer(tag1)
         serializer2 = TagSerializer(tag2)
 
-        self.assertIn(serializer1.data, res.data)
-        self.assertNotIn(serializer2.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertNotIn(serializer2.data, res.data['results'])
 
     def test_retrieve_tags_assigned_unique(self):
         """Test filtering by assigned unique items"""
@@ -129,7 +154,96 @@ class PrivateTagApiTests(TestCase):
             TAG_URL,
             {'assigned_only': 1}
         )
+        tag.refresh_from_db()
         serializer = TagSerializer(tag)
 
-        self.assertEqual(len(res.data), 1)
-        self.assertIn(serializer.data, res.data)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertIn(serializer.data, res.data['results'])
+
+    def test_tags_paginated_by_name(self):
+        """Test tags are paginated by name without skipping any"""
+        tags = [Tag.objects.create(user=self.user, name=name) for name in ('Vegan', 'Lunch', 'Dinner', 'Breakfast')]
+
+        res = self.client.get(TAG_URL, {'page_size': 2})
+        ids = [tag['id'] for tag in res.data['results']]
+        res = self.client.get(res.data['next'])
+        ids += [tag['id'] for tag in res.data['results']]
+
+        self.assertEqual(ids, [tags[0].id, tags[1].id, tags[2].id, tags[3].id])
+        self.assertIsNone(res.data['next'])
+
+    def test_retrieve_tags_assigned_without_distinct(self):
+        """Test assigned_only is answered with a semi join instead of JOIN + DISTINCT"""
+        tag = Tag.objects.create(user=self.user, name='Lunch')
+        recipe = Recipe.objects.create(user=self.user, title='Kebab', time_minutes=25, price=80.00)
+        recipe.tags.add(tag)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(TAG_URL, {'assigned_only': 1})
+
+        self.assertEqual([item['id'] for item in res.data['results']], [tag.id])
+        sql = queries[-1]['sql'].upper()
+        self.assertIn('EXISTS', sql)
+        self.assertNotIn('DISTINCT', sql)
+
+    def test_order_tags_by_recipe_count(self):
+        """Test ordering tags by how many recipes use them"""
+        unused = Tag.objects.create(user=self.user, name='Unused')
+        popular = Tag.objects.create(user=self.user, name='Popular')
+        rare = Tag.objects.create(user=self.user, name='Rare')
+        for title in ('Kebab', 'Pizza'):
+            recipe = Recipe.objects.create(user=self.user, title=title, time_minutes=25, price=80.00)
+            recipe.tags.add(popular)
+        recipe.tags.add(rare)
+
+        res = self.client.get(TAG_URL, {'ordering': '-recipe_count'})
+
+        self.assertEqual([tag['id'] for tag in res.data['results']], [popular.id, rare.id, unused.id])
+        self.assertEqual([tag['recipe_count'] for tag in res.data['results']], [2, 1, 0])
+
+    def test_bulk_create_tags(self):
+        """Test creating many tags with one request"""
+        payload = [{'name': 'Vegan'}, {'name': 'Dessert'}]
+
+        res = self.client.post(reverse('recipe:tag-bulk-create'), payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            sorted(Tag.objects.filter(user=self.user).values_list('name', flat=True)),
+            ['Dessert', 'Vegan']
+        )
+
+    def test_bulk_create_tags_existing_names(self):
+        """Test bulk creating tags returns the existing tags and creates a repeated name once"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        payload = [{'name': 'vegan'}, {'name': 'Dessert'}, {'name': 'dessert'}]
+
+        res = self.client.post(reverse('recipe:tag-bulk-create'), payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data[0]['id'], tag.id)
+        self.assertEqual(res.data[1]['id'], res.data[2]['id'])
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+
+    def test_tags_rows_match_model_serializer(self):
+        """Test the tag list renders the same bytes from rows as with the model serializer"""
+        Tag.objects.create(user=self.user, name='Vegan')
+        Tag.objects.create(user=self.user, name='Dessert')
+
+        res = self.client.get(TAG_URL, {'ordering': '-recipe_count'})
+        with patch.object(TagViewSet, 'use_rows', return_value=False):
+            expected = self.client.get(TAG_URL, {'ordering': '-recipe_count'}, HTTP_CACHE_CONTROL='no-cache')
+
+        self.assertEqual(res.content, expected.content)
+
+    def test_tags_not_modified(self):
+        """Test the tag list answers a matching ETag with 304 until a tag changes"""
+        Tag.objects.create(user=self.user, name='Vegan')
+        etag = self.client.get(TAG_URL)['ETag']
+
+        res = self.client.get(TAG_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        Tag.objects.create(user=self.user, name='Dessert')
+        res = self.client.get(TAG_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
@@ -0,0 +1,278 @@
+import os
+import re
+
+from django.conf import settings
+from django.core.files.base import File
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.db import transaction
+from PIL import Image
+from rest_framework import exceptions, status
+
+from .models import RecipeImageUpload, recipe_image_file_path
+
+# Leading bytes of the accepted image formats, checked before anything else of the body is read
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+IMAGE_FORMATS = {'JPEG', 'PNG', 'GIF', 'WEBP'}
+# Enough bytes to recognize every signature
+SIGNATURE_LENGTH = 12
+# Room for the multipart boundaries and headers around the image
+MULTIPART_OVERHEAD = 64 * 1024
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+UPLOAD_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+CHUNK_SIZE = 64 * 1024
+
+
+class RequestEntityTooLarge(exceptions.APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Request entity too large.'
+    default_code = 'request_entity_too_large'
+
+
+class UploadConflict(Exception):
+    """The chunk doesn't start where the upload stopped"""
+
+    def __init__(self, upload_id, offset):
+        super().__init__(upload_id, offset)
+        self.upload_id = upload_id
+        self.offset = offset
+
+
+def invalid_image():
+    return exceptions.ValidationError(
+        {'image': ['Upload a valid image. The file you uploaded was either not an image or a corrupted image.']}
+    )
+
+
+def check_size(size):
+    if size > settings.RECIPE_IMAGE_MAX_UPLOAD_SIZE:
+        raise RequestEntityTooLarge(f'Images can not be larger than {settings.RECIPE_IMAGE_MAX_UPLOAD_SIZE} bytes.')
+
+
+def sniff_image_extension(header):
+    """Return the file extension for the leading bytes of an image, raise a validation error for anything else"""
+    for signature, extension in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return extension
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    raise invalid_image()
+
+
+def check_image_header(image_file):
+    """
+    Let Pillow parse only the header of a stored image, given by its path or as an open file.
+    Unlike ImageField validation this doesn't decode the pixels, so the file is not read a second time.
+    """
+    try:
+        with Image.open(image_file) as image:
+            # Opening also refuses decompression bombs from the dimensions in the header
+            if image.format not in IMAGE_FORMATS:
+                raise invalid_image()
+    except (OSError, Image.DecompressionBombError):
+        raise invalid_image()
+
+
+class StoredImageUpload(UploadedFile):
+    """An uploaded image that was already written to its final location in the default storage"""
+
+    def __init__(self, name, size, content_type):
+        super().__init__(file=None, name=name, content_type=content_type, size=size)
+        self.storage_name = name
+
+
+class RecipeImageUploadHandler(FileUploadHandler):
+    """
+    Stream the image field of a multipart upload straight to its final location under MEDIA_ROOT.
+    Memory stays at one chunk per upload: the request is refused from its Content-Length before the body is read,
+    the format is checked on the first chunk and the size limit on every chunk.
+    """
+    chunk_size = CHUNK_SIZE
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.destination = None
+        self.storage_name = None
+        self.size = 0
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        check_size(content_length - MULTIPART_OVERHEAD)
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.size = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.field_name != 'image':
+            return raw_data
+        try:
+            if self.destination is None:
+                extension = sniff_image_extension(raw_data[:SIGNATURE_LENGTH])
+                self.storage_name = recipe_image_file_path(None, f'image.{extension}')
+                path = default_storage.path(self.storage_name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                self.destination = open(path, 'wb')
+            self.size += len(raw_data)
+            check_size(self.size)
+            self.destination.write(raw_data)
+        except Exception:
+            self.discard()
+            raise
+        return None
+
+    def file_complete(self, file_size):
+        if self.field_name != 'image' or self.destination is None:
+            return None
+        self.destination.close()
+        self.destination = None
+        return StoredImageUpload(self.storage_name, file_size, self.content_type)
+
+    def upload_interrupted(self):
+        self.discard()
+
+    def discard(self):
+        """Remove a partially written image"""
+        if self.destination is not None:
+            self.destination.close()
+            self.destination = None
+        if self.storage_name:
+            default_storage.delete(self.storage_name)
+
+
+def parse_content_length(value):
+    """Return the length of a request body from its Content-Length header"""
+    try:
+        length = int(value or 0)
+    except ValueError:
+        length = -1
+    if length < 0:
+        raise exceptions.ValidationError({'Content-Length': ['Expected a number of bytes.']})
+    return length
+
+
+def parse_content_range(header):
+    """Return (start, end, total) of a 'bytes start-end/total' Content-Range header"""
+    match = CONTENT_RANGE_RE.match(header or '')
+    if not match:
+        raise exceptions.ValidationError({'Content-Range': ['Expected "bytes <start>-<end>/<total>".']})
+    start, end, total = (int(value) for value in match.groups())
+    if start > end or end >= total:
+        raise exceptions.ValidationError({'Content-Range': ['The range is not within the total size.']})
+    return start, end, total
+
+
+class RequestBodyFile(File):
+    """The body of a chunk request as a file to save in a storage, read CHUNK_SIZE bytes at a time"""
+
+    def __init__(self, stream, length):
+        super().__init__(None, name='chunk')
+        self.stream = stream
+        self.remaining = length
+        self.received = 0
+        # The leading bytes are read ahead to check the image signature before anything is stored
+        self.head = self._read()
+
+    def _read(self):
+        data = self.stream.read(min(CHUNK_SIZE, self.remaining)) if self.remaining else b''
+        self.remaining -= len(data)
+        self.received += len(data)
+        return data
+
+    def chunks(self, chunk_size=None):
+        data, self.head = self.head, b''
+        while data:
+            yield data
+            data = self._read()
+
+
+def get_upload(recipe, upload_id, lock=False):
+    """Return the chunked upload of a recipe, raise 404 for unknown uploads"""
+    if not UPLOAD_ID_RE.match(upload_id or ''):
+        raise exceptions.ValidationError({'upload_id': ['Invalid upload id.']})
+    uploads = RecipeImageUpload.objects.select_for_update() if lock else RecipeImageUpload.objects
+    try:
+        return uploads.get(pk=upload_id, recipe=recipe)
+    except RecipeImageUpload.DoesNotExist:
+        raise exceptions.NotFound('Unknown upload id.')
+
+
+def uploaded_size(recipe, upload_id):
+    """Return how many bytes of a chunked upload were received, raise 404 for unknown uploads"""
+    return get_upload(recipe, upload_id).received
+
+
+def write_chunk(path, start, body):
+    """Write a chunk at its offset of the upload's file, dropping whatever a chunk that wasn't recorded left after it"""
+    with open(path, 'r+b' if start else 'wb') as destination:
+        destination.seek(start)
+        destination.truncate()
+        for data in body.chunks():
+            destination.write(data)
+
+
+def receive_chunk(recipe, upload_id, content_range, content_length, stream):
+    """
+    Append one chunk of a resumable upload to its file and return (upload_id, received bytes, storage name).
+    The file is created at its final location by the first chunk, like RecipeImageUploadHandler does, and the
+    storage name is None until the last chunk has been received. The upload row is locked while a chunk is written,
+    a concurrent chunk for the same offset waits and gets the conflict, and every chunk must announce the total size
+    of the first one. The file of an upload deleted before it completed is removed, see recipe.signals.
+    """
+    start, end, total = parse_content_range(content_range)
+    check_size(total)
+    if content_length != end - start + 1:
+        raise exceptions.ValidationError({'Content-Range': ['The range doesn\'t match the Content-Length.']})
+
+    created = None
+    try:
+        with transaction.atomic():
+            if upload_id is None:
+                upload = RecipeImageUpload(recipe=recipe, total=total)
+            else:
+                upload = get_upload(recipe, upload_id, lock=True)
+                if total != upload.total:
+                    raise exceptions.ValidationError({'Content-Range': ['The total size changed during the upload.']})
+            if start != upload.received:
+                # A new upload has no id until its first chunk is stored
+                raise UploadConflict(upload.id.hex if upload.received else None, upload.received)
+
+            body = RequestBodyFile(stream, content_length)
+            if start == 0:
+                # The first chunk must hold the image signature, nothing is stored for anything else
+                extension = sniff_image_extension(body.head[:SIGNATURE_LENGTH])
+            if body.head:
+                if start == 0:
+                    upload.name = created = recipe_image_file_path(None, f'image.{extension}')
+                    os.makedirs(os.path.dirname(default_storage.path(upload.name)), exist_ok=True)
+                write_chunk(default_storage.path(upload.name), start, body)
+                # A dropped connection leaves a shorter chunk, the client resumes from the returned offset
+                upload.received += body.received
+                upload.save()
+    except Exception:
+        # Without its row, nothing would ever remove the file of a new upload
+        if created is not None:
+            default_storage.delete(created)
+        raise
+
+    upload_id = upload.id.hex
+    if upload.received < upload.total:
+        return upload_id, upload.received, None
+
+    # Only the request receiving the last byte gets here, the others conflict on the offset
+    image_name = upload.name
+    # The file is the image now, it must outlive the upload
+    upload.name = ''
+    upload.delete()
+    try:
+        check_image_header(default_storage.path(image_name))
+    except exceptions.ValidationError:
+        default_storage.delete(image_name)
+        raise
+    return upload_id, upload.received, image_name
@@ -1,42 +1,240 @@
-from rest_framework import permissions, authentication, mixins, viewsets, status
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from rest_framework import permissions, mixins, viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import OrderingFilter
 from rest_framework.response import Response
 
+from core.authentication import CachedTokenAuthentication
+from core.renderers import FastJSONRenderer, StreamedList
+
 from . import serializers
+from .caching import ResponseCacheMixin
+from .conditional import ConditionalRequestMixin, bump_data_version
+from .filters import MATCH_ANY, MATCH_CHOICES, filter_assigned, filter_by_related_ids
+from .images import enqueue_recipe_image
+from .pagination import RecipeCursorPagination, RecipeAttrCursorPagination
+from .replicas import ReplicaReadMixin
+from .search import autocomplete, search_recipes
+from .uploads import (
+    RecipeImageUploadHandler, StoredImageUpload, UploadConflict, check_image_header, parse_content_length,
+    receive_chunk, uploaded_size,
+)
 from .models import Tag, Ingredient, Recipe
 
 
-class BaseRecipeAttrViewSet(mixins.ListModelMixin,
+class BulkCreateModelMixin:
+    """
+    Create a list of objects with one request: one authentication, one validation pass and one transaction.
+    Validation errors are returned as a list with an entry for every submitted item.
+    """
+
+    @action(methods=['post'], detail=False, url_path='bulk')
+    def bulk_create(self, request):
+        """Create the objects of a list"""
+        if isinstance(request.data, list) and len(request.data) > settings.API_MAX_BULK_SIZE:
+            raise ValidationError({
+                'non_field_errors': [f'Ensure this list has no more than {settings.API_MAX_BULK_SIZE} items.'],
+            })
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        # Bulk inserts don't send post_save
+        bump_data_version(request.user.pk)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class BulkUpdateModelMixin(BulkCreateModelMixin):
+    """
+    Also update a list of objects with one request: PUT or PATCH on the bulk route a list of objects with their id.
+    The objects are read with one query and written with bulk_update, validation errors are returned per item.
+    """
+
+    @action(methods=['post', 'put', 'patch'], detail=False, url_path='bulk')
+    def bulk_create(self, request):
+        """Create the objects of a list, or update them if they are PUT or PATCH"""
+        if request.method == 'POST':
+            return super().bulk_create(request)
+        return self.bulk_update(request, partial=request.method == 'PATCH')
+
+    def bulk_update(self, request, partial=False):
+        """Update the objects of a list, every item has the id of one of the user's objects"""
+        data = request.data
+        if not isinstance(data, list):
+            raise ValidationError({
+                'non_field_errors': [f'Expected a list of items but got type "{type(data).__name__}".'],
+            })
+        if len(data) > settings.API_MAX_BULK_SIZE:
+            raise ValidationError({
+                'non_field_errors': [f'Ensure this list has no more than {settings.API_MAX_BULK_SIZE} items.'],
+            })
+        ids = [self._item_id(item) for item in data]
+        objs = self.get_queryset().in_bulk([pk for pk in ids if pk is not None])
+        errors = []
+        for i, pk in enumerate(ids):
+            if pk is None:
+                errors.append({'id': ['This field is required.']})
+            elif pk not in objs:
+                errors.append({'id': [f'Invalid pk "{pk}" - object does not exist.']})
+            elif pk in ids[:i]:
+                errors.append({'id': ['This object is already updated by another item.']})
+            else:
+                errors.append({})
+        instances = None if any(errors) else [objs[pk] for pk in ids]
+        serializer = self.get_serializer(instances, data=data, many=True, partial=partial)
+        if not serializer.is_valid():
+            errors = [{**error, **item_errors} for error, item_errors in zip(errors, serializer.errors)]
+        if any(errors):
+            raise ValidationError(errors)
+        serializer.save()
+        # Bulk updates don't send post_save
+        bump_data_version(request.user.pk)
+        return Response(serializer.data)
+
+    @staticmethod
+    def _item_id(item):
+        """Return the integer id of an item of the list, None if it has no valid one"""
+        pk = item.get('id') if isinstance(item, dict) else None
+        if isinstance(pk, bool):
+            return None
+        try:
+            return int(pk)
+        except (TypeError, ValueError):
+            return None
+
+
+class StreamingListModelMixin(mixins.ListModelMixin):
+    """
+    List a queryset, streaming pages of at least API_STREAMING_MIN_ITEMS objects: every object is serialized and
+    rendered while the response is sent, instead of serializing the whole page before the first byte goes out.
+    The stream is consumed after finalize_response, once the replica reads of ReplicaReadMixin are stopped and the
+    request metrics recorded, so every query runs before the response is returned: the page and its prefetched
+    related objects (or the related rows of a row serializer) are loaded, only their rendering is streamed. The
+    serializer time of a streamed response isn't in the request metrics.
+    """
+
+    def list(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        renderer_context = self.get_renderer_context()
+        if not isinstance(renderer, FastJSONRenderer) or \
+                not renderer.can_stream(request.accepted_media_type, renderer_context):
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is None or len(page) < settings.API_STREAMING_MIN_ITEMS:
+            serializer = self.get_serializer(page if page is not None else queryset, many=True)
+            if page is not None:
+                return self.get_paginated_response(serializer.data)
+            return Response(serializer.data)
+
+        # The paginator returns the page as a list, evaluated with its prefetches, and row serializers load the
+        # related rows when they are created
+        serializer = self.get_serializer(page, many=True)
+        results = StreamedList(serializer.child.to_representation(obj) for obj in page)
+        data = self.get_paginated_response(results).data
+        response = StreamingHttpResponse(
+            renderer.render_stream(data, request.accepted_media_type, renderer_context),
+            content_type=renderer.media_type,
+        )
+        # nginx buffers responses, streamed ones are passed on as they come
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class RowSerializerMixin:
+    """
+    Answer the row_actions from values() rows rendered by row_serializer_class instead of model instances rendered by
+    the ModelSerializer, which costs more than the query on big lists. Only JSON is rendered from rows, the
+    browsable API keeps the model serializer for its forms.
+    """
+    row_serializer_class = None
+    row_actions = ('list', 'retrieve')
+
+    def use_rows(self):
+        """Return whether the queryset returns rows and the serializer is row_serializer_class"""
+        renderer = getattr(self.request, 'accepted_renderer', None)
+        return self.action in self.row_actions and isinstance(renderer, FastJSONRenderer)
+
+    def get_serializer(self, *args, **kwargs):
+        if not self.use_rows():
+            return super().get_serializer(*args, **kwargs)
+        kwargs.setdefault('context', self.get_serializer_context())
+        return self.row_serializer_class(*args, **kwargs)
+
+
+class BaseRecipeAttrViewSet(ConditionalRequestMixin,
+                            ReplicaReadMixin,
+                            ResponseCacheMixin,
+                            RowSerializerMixin,
+                            BulkCreateModelMixin,
+                            StreamingListModelMixin,
                             mixins.CreateModelMixin,
                             viewsets.GenericViewSet):
     """Base viewSet for user owned recipe attributes"""
     permission_classes = (permissions.IsAuthenticated,)
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
+    pagination_class = RecipeAttrCursorPagination
+    conditional_actions = ('list', 'autocomplete')
+    filter_backends = (OrderingFilter,)
+    # ?ordering=-recipe_count reads the denormalized counter through its index instead of counting recipes
+    ordering_fields = ('name', 'recipe_count')
+    ordering = ('-name', 'id')
 
     def get_queryset(self):
         """Return objects for the current authenticated user only"""
         queryset = self.queryset
         assigned_only = bool(int(self.request.query_params.get('assigned_only', 0)))
         if assigned_only:
-            queryset = queryset.filter(recipes__isnull=False)
-            # Django return one item for every related items means for every
-            # it may return duplicate obj that we can remove them by distinct.
-        return queryset.filter(user=self.request.user)\
-                       .order_by('-name')\
-                       .distinct()
+            # A semi join never returns an object twice, so unlike joining recipes no distinct is needed
+            queryset = filter_assigned(queryset)
+        queryset = queryset.filter(user=self.request.user).order_by('-name')
+        if self.use_rows():
+            return queryset.values(*self.row_serializer_class.get_columns())
+        return queryset
+
+    def create(self, request, *args, **kwargs):
+        """Create an object, or return the user's object of the same name with a 200 instead of a duplicate"""
+        response = super().create(request, *args, **kwargs)
+        if not response.data.serializer.created:
+            response.status_code = status.HTTP_200_OK
+        return response
 
     def perform_create(self, serializer):
         """Assign the user to the obj. We can also override the create method of the Serializer"""
         serializer.save(user=self.request.user)
 
+    @action(methods=['get'], detail=False)
+    def autocomplete(self, request):
+        """
+        Suggest the user's objects for what is being typed, so pickers don't download the whole list.
+        ?prefix= returns names starting with it, ?q= returns the most similar names. ?limit= caps the results.
+        """
+        prefix = request.query_params.get('prefix', '').strip()
+        text = request.query_params.get('q', '').strip()
+        if not prefix and not text:
+            return Response([])
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), settings.AUTOCOMPLETE_MAX_LIMIT)
+        except ValueError:
+            raise ValidationError({'limit': ['A valid integer is required.']})
+        queryset = autocomplete(self.queryset.filter(user=request.user), prefix, text, max(limit, 1))
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+
 
 class TagViewSet(BaseRecipeAttrViewSet):
     serializer_class = serializers.TagSerializer
+    row_serializer_class = serializers.TagRowSerializer
     queryset = Tag.objects.all()
 
 
 class IngredientViewSet(BaseRecipeAttrViewSet):
     serializer_class = serializers.IngredientSerializer
+    row_serializer_class = serializers.IngredientRowSerializer
     queryset = Ingredient.objects.all()
 
 
@@ -45,26 +243,135 @@ def params_to_int(qs):
     return [int(str_id) for str_id in qs.split(',')]
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalRequestMixin,
+                    ReplicaReadMixin,
+                    ResponseCacheMixin,
+                    RowSerializerMixin,
+                    BulkUpdateModelMixin,
+                    StreamingListModelMixin,
+                    viewsets.ModelViewSet):
     """Manage recipes in the database"""
-    queryset = Recipe.objects.all()
+    # The search vector is only read by the database
+    queryset = Recipe.objects.defer('search_vector')
     serializer_class = serializers.RecipeSerializer
-    authentication_classes = (authentication.TokenAuthentication,)
+    row_serializer_class = serializers.RecipeRowSerializer
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
+    pagination_class = RecipeCursorPagination
 
     def get_queryset(self):
-        """Retrieve the recipes for the authenticated user"""
+        """
+        Retrieve the recipes for the authenticated user
+        Recipes can be filtered by ?tags=1,2 and ?ingredients=3,4. With ?match=all a recipe must have all of the
+        given ids, the default ?match=any returns recipes having at least one of them.
+        ?search= does a full text search of titles, tag and ingredient names, best matches first.
+        ?fields= and ?expand= select the columns read and the related objects prefetched, see get_fieldset.
+        """
         recipes = self.queryset
         tags = self.request.query_params.get('tags')
         ingredients = self.request.query_params.get('ingredients')
+        match = self.request.query_params.get('match', MATCH_ANY)
+        if match not in MATCH_CHOICES:
+            raise ValidationError({'match': f'Must be one of: {", ".join(MATCH_CHOICES)}.'})
         if tags:
             tag_ids = params_to_int(tags)
-            recipes = recipes.filter(tags__id__in=tag_ids)
+            recipes = filter_by_related_ids(recipes, 'tags', tag_ids, match)
         if ingredients:
             ingredient_ids = params_to_int(ingredients)
-            recipes = recipes.filter(ingredients__id__in=ingredient_ids)
+            recipes = filter_by_related_ids(recipes, 'ingredients', ingredient_ids, match)
+
+        search = self.request.query_params.get('search', '').strip()
+        if search:
+            recipes = search_recipes(recipes, search)
+            if 'rank_key' in recipes.query.annotations:
+                self.pagination_ordering = ('-rank_key', '-id')
+
+        recipes = recipes.filter(user=self.request.user).order_by('-id')
+        if self.use_rows():
+            columns = self.row_serializer_class.get_columns(self.get_fieldset()[0])
+            # The paginator reads the rank of the last row for its cursor
+            if 'rank_key' in recipes.query.annotations:
+                columns.append('rank_key')
+            return recipes.values(*columns)
+        return self._prefetch_related_attrs(self._select_columns(recipes))
+
+    def get_fieldset(self):
+        """
+        Return the fields asked for with ?fields=id,title (None for all of them) and the related fields asked to be
+        nested with ?expand=tags,ingredients. Only the list and retrieve actions have sparse fieldsets.
+        """
+        if hasattr(self, '_fieldset'):
+            return self._fieldset
+        fields, expand = None, ()
+        if self.action in ('list', 'retrieve'):
+            serializer_class = self.get_serializer_class()
+            fields = self._parse_names('fields', serializer_class.Meta.fields)
+            expand = self._parse_names('expand', serializer_class.expandable_fields) or ()
+            if self.action == 'retrieve':
+                # RecipeDetailSerializer always nests them
+                expand = tuple(serializer_class.expandable_fields)
+        self._fieldset = (fields, expand)
+        return self._fieldset
+
+    def _parse_names(self, param, choices):
+        """Return the comma separated names of a query parameter, None if it isn't given"""
+        value = self.request.query_params.get(param)
+        if value is None:
+            return None
+        names = [name for name in (name.strip() for name in value.split(',')) if name]
+        unknown = [name for name in names if name not in choices]
+        if unknown:
+            raise ValidationError({
+                param: [f'Unknown field: {", ".join(unknown)}. Must be any of: {", ".join(choices)}.'],
+            })
+        return names
+
+    def _select_columns(self, queryset):
+        """Read only the columns of the asked fields"""
+        fields, _ = self.get_fieldset()
+        if fields is None:
+            return queryset
+        columns = ['id']
+        for name in fields:
+            field = Recipe._meta.get_field(name)
+            if field.concrete and not field.many_to_many:
+                columns.append(name)
+        return queryset.only(*columns)
 
-        return recipes.filter(user=self.request.user).order_by('-id')
+    def _prefetch_related_attrs(self, queryset):
+        """
+        Prefetch tags and ingredients with only the columns the serializer of the action needs.
+        Without this, every recipe fires two extra queries to render its tags and ingredients. Related fields left out
+        with ?fields= are not fetched at all.
+        """
+        if self.action == 'list':
+            # RecipeSerializer only renders the primary keys of the related objects
+            columns = ('id',)
+        elif self.action == 'retrieve':
+            # RecipeDetailSerializer nests TagSerializer and IngredientSerializer
+            columns = ('id', 'name', 'recipe_count')
+        else:
+            # Write actions clear the prefetch cache anyway, so prefetching would be wasted
+            return queryset
+        fields, expand = self.get_fieldset()
+        lookups = []
+        for name, model in (('tags', Tag), ('ingredients', Ingredient)):
+            if fields is not None and name not in fields:
+                continue
+            # ?expand= nests the objects with their serializer
+            related_columns = ('id', 'name', 'recipe_count') if name in expand else columns
+            # Ordered like the links of the row serializer, so both paths render the same bytes
+            lookups.append(Prefetch(name, queryset=model.objects.only(*related_columns).order_by('id')))
+        return queryset.prefetch_related(*lookups)
+
+    def get_serializer(self, *args, **kwargs):
+        """Render only the asked fields, nesting the expanded ones"""
+        fields, expand = self.get_fieldset()
+        if fields is not None:
+            kwargs.setdefault('fields', fields)
+        if expand:
+            kwargs.setdefault('expand', expand)
+        return super().get_serializer(*args, **kwargs)
 
     def get_serializer_class(self):
         """Return appropriate serializer class"""
@@ -72,7 +379,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
             # Actions are just the method of the view.
             # Possible actions are: retrieve, list, create, destroy or any user writable methods like upload_image
             return serializers.RecipeDetailSerializer
-        elif self.action == 'upload_image':
+        elif self.action in ('upload_image', 'upload_image_chunk', 'image'):
             return serializers.RecipeImageSerializer
         return self.serializer_class
 
@@ -82,15 +389,69 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     @action(methods=['post'], detail=True, url_path='upload-image')
     def upload_image(self, request, pk=None):
-        """Upload an image to a recipe."""
+        """
+        Upload an image to a recipe.
+        RecipeImageUploadHandler writes the image to its final location while the multipart body is parsed, so the
+        upload is never held in memory nor copied once more when it is assigned to the recipe.
+        """
         recipe = self.get_object()
-        serializer = self.get_serializer(
-            instance=recipe,
-            data=request.data
-        )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+        request._request.upload_handlers = [RecipeImageUploadHandler(request._request)]
+        upload = request.FILES.get('image')
+        if not isinstance(upload, StoredImageUpload):
+            raise ValidationError({'image': ['No file was submitted.']})
+        try:
+            check_image_header(default_storage.path(upload.storage_name))
+        except ValidationError:
+            default_storage.delete(upload.storage_name)
+            raise
+        self.attach_image(recipe, upload.storage_name)
+        serializer = self.get_serializer(instance=recipe)
         return Response(
             serializer.data,
             status=status.HTTP_200_OK
         )
+
+    @action(methods=['get', 'put'], detail=True, url_path='upload-image-chunk')
+    def upload_image_chunk(self, request, pk=None):
+        """
+        Resumable upload of big images.
+        PUT every chunk as the raw request body with a 'Content-Range: bytes <start>-<end>/<total>' header, the first
+        response returns the upload_id to send as a query param with the following chunks. After a dropped
+        connection, GET ?upload_id= (or the 409 of a misplaced chunk) tells the offset to resume from.
+        """
+        recipe = self.get_object()
+        upload_id = request.query_params.get('upload_id')
+        if request.method == 'GET':
+            return Response({'upload_id': upload_id, 'offset': uploaded_size(recipe, upload_id)})
+
+        try:
+            upload_id, received, image_name = receive_chunk(
+                recipe,
+                upload_id,
+                request.META.get('HTTP_CONTENT_RANGE'),
+                parse_content_length(request.META.get('CONTENT_LENGTH')),
+                request._request
+            )
+        except UploadConflict as conflict:
+            return Response(
+                {'upload_id': conflict.upload_id, 'offset': conflict.offset},
+                status=status.HTTP_409_CONFLICT
+            )
+        data = {'upload_id': upload_id, 'offset': received, 'complete': image_name is not None}
+        if image_name is not None:
+            self.attach_image(recipe, image_name)
+            data.update(self.get_serializer(instance=recipe).data)
+        return Response(data, status=status.HTTP_200_OK)
+
+    def attach_image(self, recipe, image_name):
+        """Point the recipe to a stored image and start generating its variants"""
+        recipe.image.name = image_name
+        recipe.save(update_fields=['image'])
+        # The variants are generated by a background worker, clients poll the image action for the status
+        enqueue_recipe_image(recipe)
+
+    @action(methods=['get'], detail=True, url_path='image')
+    def image(self, request, pk=None):
+        """Return the image of a recipe with its processing status and variant URLs"""
+        serializer = self.get_serializer(instance=self.get_object())
+        return Response(serializer.data)
@@ -3,8 +3,10 @@ from django.utils.translation import gettext_lazy as _
 
 from rest_framework import serializers
 
+from core.metrics import TimedSerializerMixin
 
-class UserSerializer(serializers.ModelSerializer):
+
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for the user object"""
 
     class Meta:
@@ -28,7 +30,7 @@ class UserSerializer(serializers.ModelSerializer):
         return user
 
 
-class AuthTokenSerializer(serializers.Serializer):
+class AuthTokenSerializer(TimedSerializerMixin, serializers.Serializer):
     """
     Serializer for the user authentication object
     Take a look at: from rest_framework.authtoken.serializers import AuthTokenSerializer